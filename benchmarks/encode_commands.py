@@ -0,0 +1,111 @@
+"""Compare the per-call encode time of hot commands, with and without templates.
+
+The first table times the encoders alone. "before" is respy3's write_command,
+which formats the array header and the command name on every call. "after" is
+encoding.write_command, the default of RedisClient, which looks the
+PreparedCommand up and only encodes the args. "prepared" calls
+PreparedCommand.encode directly, skipping the lookup.
+
+The second table times a whole call from the midlevel client, down to the
+encoded bytes: the built-in method, and a Prepared called with positional and
+named arguments. The lowlevel client returns the encoded command instead of
+sending it, so no Redis server is needed. Run it with:
+
+    python benchmarks/encode_commands.py [--calls N]
+"""
+import argparse
+import timeit
+
+from respy3.protocol import write_command
+
+from redtrio.lowlevel import encoding
+from redtrio.lowlevel import RedisClient
+from redtrio.midlevel import MidlevelClient
+
+COMMANDS = {
+    "GET": (b"GET", b"user:1000"),
+    "HGET": (b"HGET", b"user:1000", b"name"),
+    "INCR": (b"INCR", b"counter:page_views"),
+    "SET": (b"SET", b"session:abcdef", b"x" * 64),
+}
+
+# The midlevel method, and the names of its args, for each command.
+METHODS = {
+    "GET": ("get", ("key",)),
+    "HGET": ("hget", ("key", "field")),
+    "INCR": ("incr", ("key",)),
+    "SET": ("set", ("key", "value")),
+}
+
+
+class EncodeOnlyClient(RedisClient):
+    """A RedisClient that returns each encoded command instead of sending it."""
+
+    async def call(self, command: bytes, *args: bytes):
+        """Return the command, encoded the way RedisClient.call encodes it."""
+        return self.encode_command(command, *args)
+
+    async def call_prepared(self, prepared: encoding.PreparedCommand, *args: bytes):
+        """Return the command, encoded the way RedisClient.call_prepared does."""
+        return prepared.encode(*args)
+
+
+def run(coroutine):
+    """Run a coroutine that never waits, and return its result."""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("The coroutine tried to wait")
+
+
+def measure(encode, command: tuple, calls: int) -> float:
+    """Return the best time of one call to *encode* with *command*, in nanoseconds."""
+    timings = timeit.repeat(lambda: encode(*command), number=calls, repeat=5)
+    return min(timings) / calls * 1_000_000_000
+
+
+def measure_call(function, args: tuple, kwargs: dict, calls: int) -> float:
+    """Return the best time of one awaited call to *function*, in nanoseconds."""
+    timings = timeit.repeat(
+        lambda: run(function(*args, **kwargs)), number=calls, repeat=5
+    )
+    return min(timings) / calls * 1_000_000_000
+
+
+def main(calls: int) -> None:
+    """Benchmark each command with each encoder, then each midlevel call."""
+    print("Encoding only:")
+    for name, command in COMMANDS.items():
+        prepared = encoding.prepare(command[0], len(command) - 1)
+        before = measure(write_command, command, calls)
+        after = measure(encoding.write_command, command, calls)
+        direct = measure(prepared.encode, command[1:], calls)
+        print(
+            f"{name:>5}: before {before:6.0f}ns  after {after:6.0f}ns  "
+            f"prepared {direct:6.0f}ns  ({before / after:.1f}x)"
+        )
+
+    print("Midlevel calls:")
+    client = MidlevelClient(client=EncodeOnlyClient())
+    for name, command in COMMANDS.items():
+        method, params = METHODS[name]
+        args = tuple(arg.decode() for arg in command[1:])
+        prepared = client.prepare(name, *params)
+        assert run(prepared(*args)) == b"".join(run(getattr(client, method)(*args)))
+
+        builtin = measure_call(getattr(client, method), args, {}, calls)
+        positional = measure_call(prepared, args, {}, calls)
+        by_name = {param: args[i] for i, param in enumerate(params)}
+        named = measure_call(prepared, (), by_name, calls)
+        print(
+            f"{name:>5}: client.{method} {builtin:6.0f}ns  "
+            f"Prepared {positional:6.0f}ns  by name {named:6.0f}ns  "
+            f"({builtin / positional:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200_000)
+    main(parser.parse_args().calls)
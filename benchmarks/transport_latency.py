@@ -0,0 +1,71 @@
+"""Compare PING round-trip latency over TCP loopback and a unix socket.
+
+A small stand-in server answering PING is started on both transports, so no
+Redis server is needed. Run it with:
+
+    python benchmarks/transport_latency.py [--requests N]
+"""
+import argparse
+from functools import partial
+import os
+import statistics
+import tempfile
+
+import trio
+
+from redtrio.lowlevel import RedisClient
+
+
+async def ping_handler(stream: trio.abc.Stream) -> None:
+    """Answer every PING received on the stream with PONG."""
+    while data := await stream.receive_some():
+        await stream.send_all(b"+PONG\r\n" * data.count(b"PING"))
+
+
+async def measure(client: RedisClient, requests: int) -> list:
+    """Return the latency of each of *requests* sequential PINGs, in microseconds."""
+    await client.call(b"PING")  # Open the connection before timing.
+    latencies = []
+    for _ in range(requests):
+        start = trio.current_time()
+        await client.call(b"PING")
+        latencies.append((trio.current_time() - start) * 1_000_000)
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    """Print summary statistics for a list of latencies."""
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:>5}: mean {statistics.mean(latencies):7.1f}us  "
+        f"p50 {statistics.median(latencies):7.1f}us  p99 {p99:7.1f}us"
+    )
+
+
+async def main(requests: int) -> None:
+    """Start the stand-in servers and benchmark both transports."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "redis.sock")
+        unix_socket = trio.socket.socket(trio.socket.AF_UNIX)
+        await unix_socket.bind(path)
+        unix_socket.listen()
+
+        async with trio.open_nursery() as nursery:
+            tcp_listeners = await nursery.start(
+                partial(trio.serve_tcp, ping_handler, 0, host="127.0.0.1")
+            )
+            nursery.start_soon(
+                trio.serve_listeners, ping_handler, [trio.SocketListener(unix_socket)]
+            )
+            port = tcp_listeners[0].socket.getsockname()[1]
+
+            report("tcp", await measure(RedisClient(port=port), requests))
+            report("unix", await measure(RedisClient(unix_socket_path=path), requests))
+            nursery.cancel_scope.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10_000)
+    trio.run(main, parser.parse_args().requests)
@@ -0,0 +1,18 @@
+"""The cluster package routes commands across the nodes of a Redis Cluster.
+
+Example:
+    from redtrio.cluster import ClusterClient
+    client = ClusterClient([("127.0.0.1", 7000)])
+    await client.call(b"SET", b"key", b"value")
+
+Modules:
+    slots - Hash slots and the CRC16 checksum they are computed with
+    client - The cluster client, exported at the package level
+
+Exports:
+    ClusterClient
+    key_slot
+"""
+
+from .client import ClusterClient
+from .slots import key_slot
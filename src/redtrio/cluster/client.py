@@ -0,0 +1,325 @@
+"""The client module routes commands to the nodes of a Redis Cluster.
+
+Classes:
+    ClusterClient
+"""
+import typing as t
+
+from respy3 import protocol
+import trio
+
+from redtrio.lowlevel import connections
+from redtrio.lowlevel import Pipeline
+from redtrio.lowlevel import RedisClient
+from redtrio.lowlevel.readers import parse_raw
+from .slots import key_slot
+from .slots import SLOT_COUNT
+
+Address = t.Tuple[str, int]
+
+REDIRECTS = (b"MOVED", b"ASK")
+
+# Commands whose keys come after a numkeys argument, instead of first.
+NUMKEYS_COMMANDS = {
+    b"EVAL",
+    b"EVALSHA",
+    b"EVAL_RO",
+    b"EVALSHA_RO",
+    b"FCALL",
+    b"FCALL_RO",
+}
+
+# Commands taking many keys, or key-value pairs, that are split up by slot when
+# their keys are in different slots. The value is how many args go with each key.
+FAN_OUT_COMMANDS = {
+    b"DEL": 1,
+    b"EXISTS": 1,
+    b"MGET": 1,
+    b"MSET": 2,
+    b"TOUCH": 1,
+    b"UNLINK": 1,
+}
+
+# Commands that aren't about a key, and can be sent to any node.
+KEYLESS_COMMANDS = {
+    b"CLUSTER",
+    b"COMMAND",
+    b"CONFIG",
+    b"DBSIZE",
+    b"ECHO",
+    b"FLUSHALL",
+    b"FLUSHDB",
+    b"FUNCTION",
+    b"HELLO",
+    b"INFO",
+    b"PING",
+    b"PUBLISH",
+    b"SCRIPT",
+    b"TIME",
+}
+
+
+class ClusterClient:
+    """ClusterClient sends each command to the node that owns its key's hash slot.
+
+    There is one :class:`RedisClient`, with its own :class:`ConnectionPool`, per
+    node. The slot map is fetched with CLUSTER SLOTS before the first command. A
+    MOVED redirect updates the slot it names straight away, and marks the map to
+    be fetched again before the next command. An ASK redirect, sent while a slot
+    is being migrated, is followed once with ASKING, without touching the map.
+    If a node can't be reached, its client is dropped and the map is fetched
+    again before the next command, in case its slots have failed over.
+
+    MGET, MSET, DEL, UNLINK, EXISTS and TOUCH with keys in several slots are
+    split into one command per slot. The commands for each node are pipelined,
+    and every node is sent its pipeline at the same time, so the whole command
+    costs about one round trip. The replies are put back together as if a single
+    node had answered. Split MSETs are not atomic. Other commands with several
+    keys are routed by their first key, so all of their keys must be in the same
+    slot. For MSETNX, use hash tags to keep the keys in one slot.
+
+    Attributes:
+        startup_nodes (list): The (host, port) addresses to fetch the slot map from.
+        max_redirects (int): How many redirects to follow for one command.
+        pool_args (dict): Args passed to each node's :class:`ConnectionPool`.
+        nodes (dict): The client for each node, by (host, port).
+        slots (list): The (host, port) of the node owning each slot, or None
+            for slots no node owns.
+
+    Example:
+        client = ClusterClient([("10.0.0.1", 7000), ("10.0.0.2", 7000)])
+        await client.call(b"SET", b"{user1000}.name", b"Ada")
+    """
+
+    def __init__(
+        self,
+        startup_nodes: t.Iterable[Address] = (("127.0.0.1", 7000),),
+        *,
+        max_redirects: int = 5,
+        **pool_args,
+    ):
+        """Initialize the ClusterClient.
+
+        Arguments:
+            startup_nodes (list): (host, port) addresses of some of the nodes
+                (default: [("127.0.0.1", 7000)]).
+            max_redirects (int): How many MOVED or ASK redirects to follow for one
+                command before giving up (default: 5).
+            **pool_args: Any other arg accepted by :class:`ConnectionPool`, used
+                for every node.
+        """
+        self.startup_nodes = list(startup_nodes)
+        self.max_redirects = max_redirects
+        self.pool_args = pool_args
+        self.nodes: t.Dict[Address, RedisClient] = {}
+        self.slots: t.List[t.Optional[Address]] = [None] * SLOT_COUNT
+        self._refresh_needed = True
+        self._refresh_lock = trio.Lock()
+
+    def get_node(self, host: str, port: int) -> RedisClient:
+        """Return the client for a node, creating it if needed.
+
+        Args:
+            host (str): The address of the node.
+            port (int): The port of the node.
+
+        Returns:
+            The RedisClient connected to the node.
+        """
+        address = (host, port)
+        if address not in self.nodes:
+            pool = connections.ConnectionPool(host, port, **self.pool_args)
+            self.nodes[address] = RedisClient(host, port, connection_pool=pool)
+        return self.nodes[address]
+
+    async def refresh_slots(self) -> None:
+        """Fetch the slot map from the first node that answers.
+
+        Raises:
+            ConnectionError: No known node returned the slot map.
+        """
+        addresses = list(dict.fromkeys([*self.nodes, *self.startup_nodes]))
+        for host, port in addresses:
+            try:
+                reply = await self.get_node(host, port).call(b"CLUSTER", b"SLOTS")
+            except (OSError, trio.BrokenResourceError):
+                continue
+            if isinstance(reply, protocol.RedisError):
+                continue
+
+            slots: t.List[t.Optional[Address]] = [None] * SLOT_COUNT
+            for start, end, primary, *_ in parse_raw(reply):
+                # An empty host means the node we asked.
+                owner = (_to_str(primary[0]) or host, int(primary[1]))
+                slots[start : end + 1] = [owner] * (end + 1 - start)
+            self.slots = slots
+            self._refresh_needed = False
+            return
+        raise ConnectionError(f"Could not fetch the slot map from any of {addresses}")
+
+    def slot_for(self, command: bytes, *args: bytes) -> t.Optional[int]:
+        """Return the hash slot a command should be routed by.
+
+        Args:
+            command (bytes): The command, such as b"GET".
+            *args (bytes): The args sent with the command.
+
+        Returns:
+            The slot of the command's first key, or None if it has no keys.
+        """
+        command = command.upper()
+        if command in KEYLESS_COMMANDS or not args:
+            return None
+        if command in NUMKEYS_COMMANDS:
+            if len(args) < 3 or int(args[1]) < 1:
+                return None
+            return key_slot(args[2])
+        return key_slot(args[0])
+
+    async def call(self, command: bytes, *args: bytes):
+        """Send a command to the node owning its slot and return the response.
+
+        Args:
+            command (bytes): The command to send, such as b"PING" or b"SET".
+            *args (bytes): The args to send with the command.
+
+        Returns:
+            The response from Redis, or the last redirect error if there were more
+                than *max_redirects* of them.
+
+        Raises:
+            OSError: The node owning the slot could not be reached.
+            trio.BrokenResourceError: The node closed the connection.
+        """
+        await self._ensure_slots()
+        step = FAN_OUT_COMMANDS.get(command.upper())
+        if step is not None and len(args) > step:
+            groups = _group_by_slot(args, step)
+            if len(groups) > 1:
+                return await self._fan_out(command, args, step, groups)
+
+        slot = self.slot_for(command, *args)
+        address = self._address(slot)
+        asking = False
+        for _ in range(self.max_redirects + 1):
+            node = self.get_node(*address)
+            try:
+                if asking:
+                    pipeline = Pipeline(node).queue(b"ASKING").queue(command, *args)
+                    reply = (await pipeline.execute())[1]
+                else:
+                    reply = await node.call(command, *args)
+            except (OSError, trio.BrokenResourceError):
+                self._node_failed(address)
+                raise
+
+            redirect = _parse_redirect(reply, address[0])
+            if redirect is None:
+                return reply
+            kind, moved_slot, address = redirect
+            asking = kind == b"ASK"
+            if not asking:
+                self.slots[moved_slot] = address
+                self._refresh_needed = True
+        return reply
+
+    async def _ensure_slots(self) -> None:
+        """Fetch the slot map, if it hasn't been or a MOVED made it stale."""
+        if self._refresh_needed:
+            async with self._refresh_lock:
+                if self._refresh_needed:
+                    await self.refresh_slots()
+
+    def _node_failed(self, address: Address) -> None:
+        """Forget a node that can't be reached, and fetch the slot map again."""
+        self.nodes.pop(address, None)
+        self._refresh_needed = True
+
+    def _address(self, slot: t.Optional[int]) -> Address:
+        """Return the address of a slot's node, or of any node for no slot."""
+        address = self.slots[slot] if slot is not None else None
+        if address is None:
+            address = next(iter(self.nodes), self.startup_nodes[0])
+        return address
+
+    async def _fan_out(
+        self,
+        command: bytes,
+        args: t.Tuple[bytes, ...],
+        step: int,
+        groups: t.Dict[int, t.List[int]],
+    ):
+        """Send a command split up by slot, pipelined per node, and merge the replies.
+
+        Args:
+            command (bytes): The command, such as b"MGET".
+            args (tuple): The args sent with the command.
+            step (int): How many args go with each key.
+            groups (dict): The positions of the keys in *args*, by slot.
+
+        Returns:
+            The reply a single node would have sent, or the first error.
+        """
+        by_node: t.Dict[Address, t.List[int]] = {}
+        for slot in groups:
+            by_node.setdefault(self._address(slot), []).append(slot)
+        replies: t.Dict[int, t.Any] = {}
+
+        def sub_args(slot: int) -> t.List[bytes]:
+            return [arg for i in groups[slot] for arg in args[i : i + step]]
+
+        async def send(address: Address, slots: t.List[int]) -> None:
+            pipeline = Pipeline(self.get_node(*address))
+            for slot in slots:
+                pipeline.queue(command, *sub_args(slot))
+            try:
+                pipeline_replies = await pipeline.execute()
+            except (OSError, trio.BrokenResourceError):
+                self._node_failed(address)
+                raise
+            for position, slot in enumerate(slots):
+                reply = pipeline_replies[position]
+                if _parse_redirect(reply, address[0]) is not None:
+                    # Let call follow the redirect; it only has the one slot.
+                    reply = await self.call(command, *sub_args(slot))
+                replies[slot] = reply
+
+        async with trio.open_nursery() as nursery:
+            for address, slots in by_node.items():
+                nursery.start_soon(send, address, slots)
+
+        for reply in replies.values():
+            if isinstance(reply, protocol.RedisError):
+                return reply
+        name = command.upper()
+        if name == b"MGET":
+            merged: t.List[t.Any] = [None] * len(args)
+            for slot, reply in replies.items():
+                for position, i in enumerate(groups[slot]):
+                    merged[i] = reply[position]
+            return merged
+        if name == b"MSET":
+            return b"OK"
+        return sum(replies.values())
+
+
+def _to_str(value: t.Union[bytes, str]) -> str:
+    """Return a string from a reply, which DecodingReader has already decoded."""
+    return value if isinstance(value, str) else value.decode()
+
+
+def _group_by_slot(args: t.Sequence[bytes], step: int) -> t.Dict[int, t.List[int]]:
+    """Return the positions of the keys in args, by slot."""
+    groups: t.Dict[int, t.List[int]] = {}
+    for i in range(0, len(args), step):
+        groups.setdefault(key_slot(args[i]), []).append(i)
+    return groups
+
+
+def _parse_redirect(reply, host: str) -> t.Optional[t.Tuple[bytes, int, Address]]:
+    """Return (kind, slot, address) for a MOVED or ASK error, or None."""
+    if not isinstance(reply, protocol.RedisError) or reply.args[0] not in REDIRECTS:
+        return None
+    slot, target = bytes(reply.args[1]).split()
+    target_host, _, port = target.rpartition(b":")
+    return reply.args[0], int(slot), (target_host.decode() or host, int(port))
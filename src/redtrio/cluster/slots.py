@@ -0,0 +1,65 @@
+"""The slots module maps keys to Redis Cluster hash slots.
+
+Functions:
+    crc16 - the CRC16 (XMODEM) checksum Redis Cluster uses
+    key_slot - the hash slot a key belongs to
+"""
+import typing as t
+
+SLOT_COUNT = 16384
+
+
+def _make_table() -> list:
+    """Build the lookup table for the CRC16 polynomial 0x1021."""
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_TABLE = _make_table()
+
+
+def crc16(data: bytes) -> int:
+    """Return the CRC16 (XMODEM) checksum of data.
+
+    Arguments:
+        data (bytes): The data to checksum.
+
+    Returns:
+        The checksum, from 0 to 65535.
+    """
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def key_slot(key: t.Union[bytes, bytearray, memoryview]) -> int:
+    """Return the hash slot of a key.
+
+    If the key contains a non-empty hash tag, such as b"{user1000}.following",
+    only the part between the first "{" and the following "}" is hashed, so
+    related keys can be kept in the same slot.
+
+    Arguments:
+        key (bytes): The key, or any bytes-like object.
+
+    Returns:
+        The hash slot, from 0 to 16383.
+
+    Example:
+        >>>key_slot(b"{user1000}.following") == key_slot(b"{user1000}.followers")
+
+        True
+    """
+    key = bytes(key)  # memoryviews have no find.
+    start = key.find(b"{")
+    if start != -1:
+        end = key.find(b"}", start + 1)
+        if end > start + 1:
+            key = key[start + 1 : end]
+    return crc16(key) % SLOT_COUNT
@@ -11,9 +11,40 @@ Modules:
     protocol - An implementation of Redis' RESP3 protocol
     connections - The default connection pool
     client - The Redis client, exported at the package level
+    pipeline - Sending many commands in one write, exported at the package level
+    multiplexer - Sharing connections between callers, exported at the package level
+    encoding - Encoding commands without copying large arguments
+    pubsub - Receiving Pub/Sub messages, exported at the package level
+    dispatch - Handling pushes in worker tasks, exported at the package level
+    transaction - MULTI/EXEC transactions, exported at the package level
+    sentinel - Finding the master through Redis Sentinel, exported at the package level
+    replicas - Sending reads to replicas, exported at the package level
+    readers - Raw, pairs and decoded replies, exported at the package level
 
 Exports:
     RedisClient
+    Pipeline
+    Multiplexer
+    PubSub
+    PushDispatcher
+    RawReader
+    PairsReader
+    DecodingReader
+    ReplicaClient
+    SentinelPool
+    Transaction
+    run_transaction
 """
 
 from .client import RedisClient
+from .dispatch import PushDispatcher
+from .multiplexer import Multiplexer
+from .pipeline import Pipeline
+from .pubsub import PubSub
+from .readers import DecodingReader
+from .readers import PairsReader
+from .readers import RawReader
+from .replicas import ReplicaClient
+from .sentinel import SentinelPool
+from .transaction import run_transaction
+from .transaction import Transaction
@@ -4,15 +4,67 @@ Classes:
     RedisClient
 """
 from collections import defaultdict
+import inspect
 import typing as t
+from urllib.parse import parse_qs, unquote, urlsplit
 
 from respy3 import protocol
+import trio
 
 from . import connections
+from . import encoding
 
 
 PUSH_COMMANDS = {b"SUBSCRIBE", b"PSUBSCRIBE", b"UNSUBSCRIBE", b"PUNSUBSCRIBE"}
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+async def _receive_some(connection, max_bytes: int) -> bytes:
+    """Receive up to *max_bytes* from the connection, which must not be closed."""
+    data = await connection.receive_some(max_bytes)
+    if not data:
+        raise trio.BrokenResourceError("The connection was closed by Redis")
+    return data
+
+
+def _take_buffered(reader) -> bytes:
+    """Remove and return the data a reader was fed but hasn't parsed yet.
+
+    Resp3Reader and its subclasses keep it in *_buffer*. RawReader keeps the
+    frames it has returned there too, until *feed* drops them.
+
+    Arguments:
+        reader: The reader of a connection.
+
+    Returns:
+        The unparsed data, which the reader no longer holds.
+    """
+    reader.feed(b"")
+    data = bytes(reader._buffer)
+    reader._buffer = bytearray()
+    return data
+
+
+async def _read_from(readable, max_bytes: int) -> bytes:
+    """Read up to *max_bytes* from a file, an async file or a trio ReceiveStream."""
+    if hasattr(readable, "receive_some"):
+        return await readable.receive_some(max_bytes)
+    data = readable.read(max_bytes)
+    if inspect.isawaitable(data):
+        data = await data
+    return data
+
+
+async def _write_to(writable, data: bytes) -> None:
+    """Write data to a file, an async file or a trio SendStream."""
+    if hasattr(writable, "send_all"):
+        await writable.send_all(data)
+        return
+    written = writable.write(data)
+    if inspect.isawaitable(written):
+        await written
+
 
 class RedisClient:
     """RedisClient communicates with the Redis server via its *call* method.
@@ -20,11 +72,21 @@ class RedisClient:
     Attributes:
         host (str): The address to connect to (default: "127.0.0.1").
         port (int): The port to connect to (default: 6379).
+        unix_socket_path (str): The unix socket to connect to instead of *host* and
+            *port*, or None to use TCP (default: None).
         connection_pool (instance of a connection pool): The pool to use for
             connections. Leave as None to use the default ConnectionPool.
         Reader (protocol class): The class to use for interpreting responses from Redis.
         write_command (function): The function to use to format commands to send
-            to Redis.
+            to Redis. The default, :func:`encoding.write_command`, reuses the
+            encoded header and name of each command.
+        large_value_threshold (int): Commands with an argument at least this many
+            bytes long are encoded with :func:`encoding.write_command_chunks`
+            instead of *write_command*, so the argument isn't copied.
+        multiplexer (Multiplexer): While a :class:`Multiplexer` is running, *call*
+            sends commands through it instead of checking out a connection.
+        push_dispatcher (PushDispatcher): While a :class:`PushDispatcher` is
+            running, pushes are queued for it instead of being handled by *receive*.
     """
 
     def __init__(
@@ -32,31 +94,105 @@ class RedisClient:
         host: str = "127.0.0.1",
         port: int = 6379,
         *,
+        unix_socket_path: t.Optional[str] = None,
         connection_pool=None,
         Reader: type = protocol.Resp3Reader,
-        write_command: t.Callable = protocol.write_command,
+        write_command: t.Callable = encoding.write_command,
+        large_value_threshold: int = encoding.LARGE_VALUE_THRESHOLD,
+        **pool_args,
     ):
         """Initialize the RedisClient.
 
         Arguments:
             host (str): The address to connect to (default: "127.0.0.1").
             port (int): The port to connect to (default: 6379).
-            connection_pool: A connection pool to use. Overrides host and port.
+            unix_socket_path (str): The path of a unix socket to connect to. Overrides
+                host and port.
+            connection_pool: A connection pool to use. Overrides host, port and
+                unix_socket_path.
                 Leave as None to use the default ConnectionPool.
-            Reader: the class to use for parsing replies from the server.
+            Reader: the class to use for parsing replies from the server. It is
+                passed to the default ConnectionPool, which gives each connection
+                its own instance. See :mod:`readers` for raw, pairs and decoded
+                replies.
             write_command: the function used to prepare commands sent to the server.
+            large_value_threshold (int): the argument size, in bytes, from which
+                commands are sent without copying their arguments (default: 64KiB).
+            **pool_args: Any other arg accepted by the default ConnectionPool, such
+                as protocol=3 to send HELLO 3 on every new connection.
+
+        Raises:
+            TypeError: *pool_args* were given with a *connection_pool*, which
+                they would not apply to.
         """
+        if connection_pool is not None and pool_args:
+            raise TypeError(
+                f"{', '.join(pool_args)} can't be used with a connection_pool; "
+                "pass them to the ConnectionPool instead"
+            )
         self.host = host
         self.port = port
+        self.unix_socket_path = unix_socket_path
 
         if connection_pool is None:
-            self.connection_pool = connections.ConnectionPool(host, port)
+            self.connection_pool = connections.ConnectionPool(
+                host,
+                port,
+                Reader=Reader,
+                unix_socket_path=unix_socket_path,
+                **pool_args,
+            )
         else:
             self.connection_pool = connection_pool
 
-        self.reader = Reader()
+        self.Reader = Reader
         self.write_command = write_command
+        self.large_value_threshold = large_value_threshold
         self.push_callbacks: defaultdict = defaultdict(list)
+        self.multiplexer = None
+        self.push_dispatcher = None
+
+    @classmethod
+    def from_url(cls, url: str, **client_args) -> "RedisClient":
+        """Create a RedisClient from a URL.
+
+        redis://host:port connects over TCP, while redis+unix:///path/to/socket and
+        unix:///path/to/socket connect to a unix socket. A username and password
+        in the URL are sent with AUTH, and a database number in the path of a
+        redis:// URL, or in a db query parameter, is selected.
+
+        Args:
+            url (str): The URL of the Redis server.
+            **client_args: Any other arg accepted by :class:`RedisClient`.
+
+        Returns:
+            A new RedisClient.
+
+        Raises:
+            ValueError: The URL scheme is not supported.
+
+        Example:
+            RedisClient.from_url("redis+unix:///run/redis/redis.sock")
+        """
+        parts = urlsplit(url)
+        if parts.username:
+            client_args.setdefault("username", unquote(parts.username))
+        if parts.password is not None:
+            client_args.setdefault("password", unquote(parts.password))
+        db = parse_qs(parts.query).get("db")
+        if db:
+            client_args.setdefault("db", int(db[0]))
+        if parts.scheme in ("redis+unix", "unix"):
+            return cls(unix_socket_path=unquote(parts.path), **client_args)
+        if parts.scheme == "redis":
+            if parts.path.strip("/"):
+                client_args.setdefault("db", int(parts.path.strip("/")))
+            return cls(
+                host=parts.hostname or "127.0.0.1",
+                port=parts.port or 6379,
+                **client_args,
+            )
+        raise ValueError(f"Unsupported Redis URL scheme: {parts.scheme!r}")
 
     async def receive(self, connection, push_only: bool = False):
         """Read the connection and return an object, calling any push callbacks.
@@ -65,22 +201,24 @@ class RedisClient:
         instead.
 
         Args:
-            connection (trio.abc.Stream): The connection to read from.
+            connection (Connection): The connection to read from.
             push_only (bool): If a push is received, return None
                 and don't try to read anything else (default: False).
 
         Returns:
             The response from Redis, as parsed by the Reader class (or None, if
                 push_only is True and a push is received).
+
+        Raises:
+            BrokenResourceError: The server closed the connection.
         """
+        reader = connection.reader
         while True:
-            output = self.reader.get_object()
-            if output is self.reader.sentinel:
+            output = reader.get_object()
+            if output is reader.sentinel:
                 pass
             elif isinstance(output, protocol.RespPush):
-                callbacks = self.push_callbacks[output.push_type]
-                for callback in callbacks:
-                    callback(output)
+                await self.handle_push(output)
                 if push_only:
                     return None
                 continue  # pragma: nocover
@@ -88,7 +226,29 @@ class RedisClient:
                 return output
 
             data = await connection.receive_some()
-            self.reader.feed(data)
+            if not data:
+                raise trio.BrokenResourceError("The connection was closed by Redis")
+            reader.feed(data)
+
+    def encode_command(self, command: bytes, *args: bytes) -> list:
+        """Encode a command as a list of chunks to be sent in order.
+
+        Most commands are encoded into a single chunk with *write_command*. If an
+        argument is at least *large_value_threshold* bytes long, it is passed
+        through as its own chunk instead of being copied.
+
+        Args:
+            command (bytes): The command to send, such as b"PING" or b"SET".
+            *args (bytes): The args to send with the command. Large args may be
+                bytes, bytearray or memoryview objects.
+
+        Returns:
+            A list of bytes-like chunks.
+        """
+        threshold = self.large_value_threshold
+        if any(len(arg) >= threshold for arg in args):
+            return encoding.write_command_chunks(command, *args, threshold=threshold)
+        return [self.write_command(command, *args)]
 
     async def send_command(self, command: bytes, *args: bytes, connection=None):
         """Send the given command to Redis and return the connection used.
@@ -99,22 +259,26 @@ class RedisClient:
         Args:
             command (bytes): The command to send, such as b"PING" or b"SET".
             *args (bytes): The args to send with the command.
-            connection (trio.abc.Stream): the connection to use, or None
+            connection (Connection): the connection to use, or None
                 to get a connection from the pool.
 
         Returns:
             The connection used to send the command.
 
         """
-        buffer = self.write_command(command, *args)
+        chunks = self.encode_command(command, *args)
         if connection is None:
             connection = await self.connection_pool.wait_for_connection()
-        await connection.send_all(buffer)
+        for chunk in chunks:
+            await connection.send_all(chunk)
         return connection
 
     async def call(self, command: bytes, *args: bytes):
         """Send the given command to Redis and return the response.
 
+        If the connection fails before the response is read, it is closed
+        instead of being put back in the pool.
+
         Args:
             command (bytes): The command to send, such as b"PING" or b"SET".
             *args (bytes): The args to send with the command.
@@ -125,13 +289,187 @@ class RedisClient:
         Example:
             call(b"SET", b"key_name", b"value") -> b"OK"
         """
-        connection = await self.send_command(command, *args)
-        response = await self.receive(
-            connection, push_only=command.upper() in PUSH_COMMANDS
+        if self.multiplexer is not None and command.upper() not in PUSH_COMMANDS:
+            return await self.multiplexer.call(command, *args)
+
+        async with self.connection_pool.checkout() as connection:
+            await self.send_command(command, *args, connection=connection)
+            return await self.receive(
+                connection, push_only=command.upper() in PUSH_COMMANDS
+            )
+
+    async def call_prepared(self, prepared: encoding.PreparedCommand, *args: bytes):
+        """Send a prepared command with its args and return the response.
+
+        Only the args are encoded; the array header and the command name come
+        from *prepared*. The command is always encoded into a single chunk, so
+        this is meant for commands with small args.
+
+        Args:
+            prepared (encoding.PreparedCommand): The command to send.
+            *args (bytes): The args to send with the command.
+
+        Returns:
+            The response from Redis, as parsed by the Reader class.
+
+        Example:
+            hget = encoding.prepare(b"HGET", 2)
+            await client.call_prepared(hget, b"key", b"field") -> b"value"
+        """
+        data = prepared.encode(*args)
+        push = prepared.command.upper() in PUSH_COMMANDS
+        if self.multiplexer is not None and not push:
+            return await self.multiplexer.call_encoded(data)
+
+        async with self.connection_pool.checkout() as connection:
+            await connection.send_all(data)
+            return await self.receive(connection, push_only=push)
+
+    async def get_into(
+        self, key: bytes, writable, *, chunk_size: int = STREAM_CHUNK_SIZE
+    ):
+        """GET a string and write it to *writable* in chunks, instead of returning it.
+
+        The value is copied from the socket to *writable* at most *chunk_size*
+        bytes at a time, so it is never held in memory as a whole. *writable*
+        may be a file opened in binary mode, a trio async file, or a trio
+        SendStream. The command is always sent on a connection of its own, even
+        while a :class:`Multiplexer` is running.
+
+        If the connection fails partway through, it is closed, and *writable* is
+        left holding whatever had been written so far.
+
+        Args:
+            key (bytes): The key to GET.
+            writable: Where to write the value.
+            chunk_size (int): The most bytes to read or write at once
+                (default: 64KiB).
+
+        Returns:
+            The length of the value, None if the key doesn't exist, or the error
+                returned by Redis.
+
+        Example:
+            with open("artifact.bin", "wb") as file:
+                await client.get_into(b"artifact", file)
+        """
+        async with self.connection_pool.checkout() as connection:
+            await self.send_command(b"GET", key, connection=connection)
+            return await self._receive_into(connection, writable, chunk_size)
+
+    async def _receive_into(self, connection, writable, chunk_size: int):
+        """Stream a bulk string reply into *writable* and return its length."""
+        data = _take_buffered(connection.reader)
+        while b"\r\n" not in data:
+            data += await _receive_some(connection, chunk_size)
+        end = data.index(b"\r\n")
+        if data[:end] == b"$-1":
+            # A RESP2 null, which Resp3Reader doesn't parse.
+            connection.reader.feed(data[end + 2 :])
+            return None
+        if data[:1] != b"$":
+            # Not a bulk string, like an error, a RESP3 null or a push.
+            connection.reader.feed(data)
+            response = await self.receive(connection)
+            if isinstance(response, (bytes, bytearray)):
+                await _write_to(writable, response)
+                return len(response)
+            return response
+
+        length = left = int(data[1:end])
+        data = data[end + 2 :]
+        while left:
+            if not data:
+                data = await _receive_some(connection, min(left, chunk_size))
+            piece, data = data[:left], data[left:]
+            await _write_to(writable, piece)
+            left -= len(piece)
+        while len(data) < 2:
+            data += await _receive_some(connection, 2 - len(data))
+        if data[:2] != b"\r\n":
+            raise trio.BrokenResourceError("Redis sent a malformed bulk string")
+        connection.reader.feed(data[2:])
+        return length
+
+    async def set_from(
+        self,
+        key: bytes,
+        readable,
+        length: int,
+        *args: bytes,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+    ):
+        """SET a string to *length* bytes read from *readable* in chunks.
+
+        The value is copied from *readable* to the socket at most *chunk_size*
+        bytes at a time, so it is never held in memory as a whole. *readable*
+        may be a file opened in binary mode, a trio async file, or a trio
+        ReceiveStream. The command is always sent on a connection of its own, even
+        while a :class:`Multiplexer` is running.
+
+        Args:
+            key (bytes): The key to SET.
+            readable: Where to read the value from.
+            length (int): The length of the value, in bytes.
+            *args (bytes): Other args to send after the value, such as b"EX".
+            chunk_size (int): The most bytes to read or write at once
+                (default: 64KiB).
+
+        Returns:
+            The response from Redis.
+
+        Raises:
+            ValueError: *readable* ended before *length* bytes were read. The
+                connection is closed, so the key is not set.
+
+        Example:
+            with open("artifact.bin", "rb") as file:
+                size = os.fstat(file.fileno()).st_size
+                await client.set_from(b"artifact", file, size)
+        """
+        head = b"*%d\r\n$3\r\nSET\r\n$%d\r\n%s\r\n$%d\r\n" % (
+            len(args) + 3,
+            len(key),
+            key,
+            length,
         )
-        self.connection_pool.put_connection(connection)
-        return response
+        tail = b"\r\n" + b"".join(b"$%d\r\n%s\r\n" % (len(arg), arg) for arg in args)
+
+        async with self.connection_pool.checkout() as connection:
+            await connection.send_all(head)
+            left = length
+            while left:
+                data = await _read_from(readable, min(left, chunk_size))
+                if not data:
+                    raise ValueError(
+                        f"{readable!r} ended {left} bytes short of {length}"
+                    )
+                await connection.send_all(data)
+                left -= len(data)
+            await connection.send_all(tail)
+            return await self.receive(connection)
+
+    async def handle_push(self, push: protocol.RespPush) -> None:
+        """Call the callbacks registered for a push, or queue it for the dispatcher.
+
+        Callbacks may be regular functions or async functions. Without a running
+        :class:`PushDispatcher`, they run before the reply being read is returned.
+
+        Args:
+            push (RespPush): The push received from Redis.
+        """
+        if self.push_dispatcher is not None:
+            self.push_dispatcher.dispatch(push)
+            return
+        for callback in list(self.push_callbacks[push.push_type]):
+            result = callback(push)
+            if inspect.isawaitable(result):
+                await result
 
     def register_push_callback(self, push_type: bytes, callback: t.Callable) -> None:
         """Register a function to be called when a push is received."""
         self.push_callbacks[push_type].append(callback)
+
+    def unregister_push_callback(self, push_type: bytes, callback: t.Callable) -> None:
+        """Stop calling a function registered with :meth:`register_push_callback`."""
+        self.push_callbacks[push_type].remove(callback)
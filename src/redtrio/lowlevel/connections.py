@@ -1,24 +1,150 @@
 """The connections module handles connecting to the server.
 
 Classes:
+    Connection
     ConnectionPool
 """
 
+from collections import deque
+from contextlib import asynccontextmanager
+import math
 import typing as t
 
+from respy3 import protocol
 import trio
 
 
+PING = b"*1\r\n$4\r\nPING\r\n"
+# PONG as returned by Resp3Reader, readers.DecodingReader and readers.RawReader.
+PONG_REPLIES = (b"PONG", "PONG", b"+PONG\r\n")
+HEALTH_CHECK_TIMEOUT = 5
+# What opening a connection raises if the server is down, hangs up during the
+# handshake, or doesn't answer it in time.
+CONNECT_ERRORS = (OSError, trio.BrokenResourceError, trio.TooSlowError)
+
+
+class Connection(trio.abc.Stream):
+    """Connection wraps a stream together with the parser for its replies.
+
+    Each connection owns its own reader, so replies read from different
+    connections at the same time never share a parser buffer.
+
+    Attributes:
+        stream (trio.abc.Stream): The underlying stream to the Redis server.
+        reader: The reader that parses replies received on *stream*.
+        created_at (float): The trio time the connection was created.
+        idle_since (float): The trio time the connection was last put in the pool.
+        generation (int): The pool's *generation* when the connection was opened.
+    """
+
+    def __init__(self, stream: trio.abc.Stream, reader):
+        """Initialize the Connection.
+
+        Arguments:
+            stream (trio.abc.Stream): The stream to wrap.
+            reader: The reader that will parse replies received on the stream.
+        """
+        self.stream = stream
+        self.reader = reader
+        self.created_at = trio.current_time()
+        self.idle_since = self.created_at
+        self.generation = 0
+
+    async def send_all(self, data) -> None:
+        """Send data on the underlying stream."""
+        await self.stream.send_all(data)
+
+    async def wait_send_all_might_not_block(self) -> None:
+        """Wait until the underlying stream might accept more data."""
+        await self.stream.wait_send_all_might_not_block()
+
+    async def receive_some(self, max_bytes: t.Optional[int] = None) -> bytes:
+        """Receive data from the underlying stream.
+
+        Arguments:
+            max_bytes (int): The maximum number of bytes to receive.
+
+        Returns:
+            The data received.
+        """
+        return await self.stream.receive_some(max_bytes)
+
+    async def aclose(self) -> None:
+        """Close the underlying stream."""
+        await self.stream.aclose()
+
+
+class _Waiter:
+    """A caller waiting in line for a connection.
+
+    Attributes:
+        event (trio.Event): Set when the waiter is given a connection or a free slot.
+        connection (Connection): The connection handed over, or None if the waiter
+            was given a free slot to spawn a new connection in.
+    """
+
+    def __init__(self):
+        """Initialize the _Waiter."""
+        self.event = trio.Event()
+        self.connection: t.Optional[Connection] = None
+
+
 class ConnectionPool:
     """This class implements a default connection pool.
 
+    When *max_connections* is reached, callers wait in a FIFO queue. A connection
+    that is put back is handed straight to the caller that has waited longest.
+
+    New connections can be opened ahead of time with :meth:`warmup`, and
+    :meth:`run` keeps at least *min_idle* of them ready in the background. It
+    also calls :meth:`evict` regularly, closing idle connections that are too old,
+    idle for too long, or no longer answering PING, before a caller can use them.
+
+    Every new connection is set up with one pipelined write before it is used:
+    HELLO, with AUTH and SETNAME, when *protocol* is set, SELECT when *db* is
+    set, and the commands returned by each of *handshake_hooks*, such as script
+    preloads. Then *on_connect* is called, for anything else.
+
+    :meth:`reset` points the pool at a new address, for example after a failover.
+    Idle connections are closed right away, and connections in use are closed
+    when they are put back, instead of waiting for them to fail.
+
     Attributes:
         host (str): The address to connect to.
         port (int): The port to connect to.
         max_connections (int): The maximum number of connections to keep.
         spawn_connection: The function used to spawn a new connection.
+        unix_socket_path (str): The path of a unix socket to connect to instead of
+            *host* and *port*, or None to use TCP.
+        Reader (protocol class): The class used to parse replies on each connection.
+        checkout_timeout (float): How long to wait for a connection before giving
+            up, or None to wait forever.
+        min_idle (int): The number of idle connections :meth:`run` keeps open.
+        on_connect: An async function called with each new connection before it
+            is used, to run the connection handshake. None to skip it.
+        idle_timeout (float): Close connections idle for this many seconds, as
+            long as *min_idle* remain. None to keep them.
+        max_lifetime (float): Close connections this many seconds after they were
+            created. None to keep them.
+        health_check_interval (float): PING connections that have been idle this
+            many seconds. None to skip health checks.
+        maintenance_interval (float): How often :meth:`run` calls :meth:`evict`.
+        protocol (int): The RESP version asked for with HELLO, or None to skip
+            HELLO and keep the server's default.
+        username (str): The user to AUTH as, or None for the default user.
+        password (str): The password to AUTH with, or None to skip AUTH.
+        client_name (str): The name given to each connection, or None.
+        db (int): The database to SELECT, or None to keep the default.
+        handshake_hooks (list): Functions called without args for each new
+            connection. Each returns more commands, as tuples of bytes, to send
+            with the handshake. Their replies are not checked.
         used_connections (set): A set containing connections currently in use.
         pool: The pool of unused connections.
+        connecting (int): The number of connections currently being spawned.
+        wait_count (int): How many checkouts have had to wait for a connection.
+        wait_time (float): The total number of seconds spent waiting.
+        generation (int): Incremented by :meth:`reset`. Connections opened in an
+            earlier generation are never handed out again.
     """
 
     def __init__(
@@ -27,6 +153,20 @@ class ConnectionPool:
         port: int,
         max_connections: int = 50,
         spawn_connection: t.Callable = trio.open_tcp_stream,
+        Reader: type = protocol.Resp3Reader,
+        checkout_timeout: t.Optional[float] = None,
+        min_idle: int = 0,
+        on_connect: t.Optional[t.Callable[[Connection], t.Awaitable]] = None,
+        idle_timeout: t.Optional[float] = None,
+        max_lifetime: t.Optional[float] = None,
+        health_check_interval: t.Optional[float] = None,
+        maintenance_interval: float = 1,
+        unix_socket_path: t.Optional[str] = None,
+        protocol: t.Optional[int] = None,
+        username: t.Optional[str] = None,
+        password: t.Optional[str] = None,
+        client_name: t.Optional[str] = None,
+        db: t.Optional[int] = None,
     ):
         """Initialize the ConnectionPool.
 
@@ -35,48 +175,246 @@ class ConnectionPool:
             port (int): The port to connect to.
             max_connections (int): The maximum number of connections (default: 50).
             spawn_connection: Spawn a connection (default: trio.open_tcp_stream).
+            Reader: The class used to parse replies (default: Resp3Reader).
+            checkout_timeout (float): Seconds to wait for a connection before
+                raising trio.TooSlowError (default: None, wait forever).
+            min_idle (int): Idle connections to keep open while :meth:`run` is
+                running (default: 0).
+            on_connect: Called with each new connection, to run the connection
+                handshake (default: None).
+            idle_timeout (float): Seconds before an idle connection is closed
+                (default: None, never).
+            max_lifetime (float): Seconds before any connection is closed
+                (default: None, never).
+            health_check_interval (float): Seconds of idleness before a connection
+                is checked with PING (default: None, never).
+            maintenance_interval (float): Seconds between calls to :meth:`evict`
+                while :meth:`run` is running (default: 1).
+            unix_socket_path (str): Connect to this unix socket with
+                trio.open_unix_socket instead of calling *spawn_connection*
+                (default: None).
+            protocol (int): Send HELLO with this RESP version on each new
+                connection (default: None, don't).
+            username (str): The user to AUTH as (default: None, the default user).
+            password (str): The password to AUTH with (default: None, don't).
+            client_name (str): The name to give each connection (default: None).
+            db (int): The database to SELECT (default: None, don't).
         """
         self.host = host
         self.port = port
         self.max_connections = max_connections
         self.spawn_connection = spawn_connection
-        self.used_connections: t.Set[trio.abc.Stream] = set()
-        self.pool: t.List[trio.abc.Stream] = []
+        self.unix_socket_path = unix_socket_path
+        self.Reader = Reader
+        self.checkout_timeout = checkout_timeout
+        self.min_idle = min_idle
+        self.on_connect = on_connect
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.maintenance_interval = maintenance_interval
+        self.protocol = protocol
+        self.username = username
+        self.password = password
+        self.client_name = client_name
+        self.db = db
+        self.handshake_hooks: t.List[t.Callable[[], t.Iterable[tuple]]] = []
+        self.used_connections: t.Set[Connection] = set()
+        self.pool: t.List[Connection] = []
+        self.connecting = 0
+        self.wait_count = 0
+        self.wait_time = 0.0
+        self._waiters: t.Deque[_Waiter] = deque()
+        self._refill = trio.Event()
+        self.generation = 0
+        self._retired: t.List[Connection] = []
+
+    @property
+    def size(self) -> int:
+        """The number of connections in use, idle, or being spawned."""
+        return len(self.used_connections) + len(self.pool) + self.connecting
+
+    @property
+    def waiting(self) -> int:
+        """The number of callers currently waiting for a connection."""
+        return len(self._waiters)
 
     async def wait_for_connection(self):
         """Wait for a connection to become available.
 
-        Returns immediately if *pool* has a connection available.
+        Returns immediately if *pool* has a connection available. Connections past
+        *max_lifetime* are closed instead of being returned.
         Otherwise, if *max_connections* has not been reached, spawns a new connection.
-        If *max_connections* has been reached, wait for one to become available.
+        If *max_connections* has been reached, wait in line for one to be put back,
+        raising trio.TooSlowError if *checkout_timeout* passes first.
 
         Returns:
             A connection to the Redis server.
         """
         connection = None
-        while not connection:  # pragma: nobranch
-            if self.pool:
-                connection = self.pool.pop()
-                break
-            elif len(self.used_connections) + len(self.pool) < self.max_connections:
-                connection = await self.spawn_connection(self.host, self.port)
-                break
+        while self.pool and connection is None:
+            connection = self.pool.pop()
+            if self._too_old(connection):
+                await self._discard(connection)
+                connection = None
 
-            await trio.sleep(5)
+        if connection is not None:
+            if len(self.pool) < self.min_idle:
+                self._refill.set()
+        elif self.size < self.max_connections:
+            self.connecting += 1
+            connection = await self._spawn()
+        else:
+            connection = await self._wait_in_line()
 
         self.used_connections.add(connection)
         return connection
 
-    def put_connection(self, connection: trio.abc.Stream):
+    async def _spawn(self) -> Connection:
+        """Spawn a connection in a slot already reserved by incrementing *connecting*.
+
+        The handshake, then *on_connect*, are run before the connection is
+        returned.
+
+        Returns:
+            The new connection.
+        """
+        connection = None
+        ready = False
+        generation = self.generation
+        try:
+            if self.unix_socket_path is not None:
+                stream = await trio.open_unix_socket(self.unix_socket_path)
+            else:
+                stream = await self.spawn_connection(self.host, self.port)
+            connection = Connection(stream, self.Reader())
+            connection.generation = generation
+            await self._handshake(connection)
+            if self.on_connect is not None:
+                await self.on_connect(connection)
+            ready = True
+        finally:
+            self.connecting -= 1
+            if not ready:
+                self._offer_slot()
+                if connection is not None:
+                    await trio.aclose_forcefully(connection)
+        return connection
+
+    def handshake_commands(self) -> t.List[t.Tuple[bytes, ...]]:
+        """Return the HELLO, AUTH, SETNAME and SELECT commands for a new connection.
+
+        Returns:
+            The commands, not including those from *handshake_hooks*.
+        """
+        commands: t.List[t.Tuple[bytes, ...]] = []
+        password = None if self.password is None else self.password.encode()
+        if self.protocol is not None:
+            hello: t.Tuple[bytes, ...] = (b"HELLO", b"%d" % self.protocol)
+            if password is not None:
+                # Unlike AUTH, HELLO always needs a username.
+                hello += (b"AUTH", (self.username or "default").encode(), password)
+            if self.client_name is not None:
+                hello += (b"SETNAME", self.client_name.encode())
+            commands.append(hello)
+        else:
+            if password is not None:
+                username = () if self.username is None else (self.username.encode(),)
+                commands.append((b"AUTH", *username, password))
+            if self.client_name is not None:
+                commands.append((b"CLIENT", b"SETNAME", self.client_name.encode()))
+        if self.db is not None:
+            commands.append((b"SELECT", b"%d" % self.db))
+        return commands
+
+    async def _handshake(self, connection: Connection) -> None:
+        """Send the handshake and hook commands in one write, and read the replies.
+
+        Arguments:
+            connection: The new connection.
+
+        Raises:
+            ConnectionError: Redis refused HELLO, AUTH, SETNAME or SELECT.
+        """
+        commands = self.handshake_commands()
+        required = len(commands)
+        for hook in self.handshake_hooks:
+            commands.extend(hook())
+        if not commands:
+            return
+        await connection.send_all(
+            b"".join(protocol.write_command(*command) for command in commands)
+        )
+        for i, command in enumerate(commands):
+            reply = await _receive(connection)
+            if i < required and isinstance(reply, protocol.RedisError):
+                name = command[0].decode()
+                raise ConnectionError(f"{name} failed during the handshake: {reply}")
+
+    async def _wait_in_line(self) -> Connection:
+        """Wait until a connection or a free slot is handed over.
+
+        Returns:
+            The connection that was handed over, or a newly spawned one.
+
+        Raises:
+            TooSlowError: *checkout_timeout* passed without a connection.
+        """
+        waiter = _Waiter()
+        self._waiters.append(waiter)
+        self.wait_count += 1
+        start = trio.current_time()
+        timeout = math.inf if self.checkout_timeout is None else self.checkout_timeout
+        try:
+            with trio.move_on_after(timeout):
+                await waiter.event.wait()
+        finally:
+            self.wait_time += trio.current_time() - start
+            if not waiter.event.is_set():
+                self._waiters.remove(waiter)
+
+        if not waiter.event.is_set():
+            raise trio.TooSlowError("Timed out waiting for a connection")
+        if waiter.connection is not None:
+            return waiter.connection
+        return await self._spawn()
+
+    def _offer_slot(self) -> None:
+        """Let the longest waiting caller spawn a connection, if there is room."""
+        if self._waiters and self.size < self.max_connections:
+            self.connecting += 1
+            self._waiters.popleft().event.set()
+
+    def put_connection(self, connection: Connection):
         """Put a connection back in the pool, removing it from used_connections.
 
+        If a caller is waiting, the connection is handed straight to it instead.
+        If the connection was opened before the last :meth:`reset`, it is set
+        aside to be closed by :meth:`evict` instead.
+
         Arguments:
             connection: The connection to put back.
         """
         self.used_connections.remove(connection)
-        self.pool.append(connection)
+        if connection.generation != self.generation:
+            self._retired.append(connection)
+            self._offer_slot()
+            self._refill.set()
+            return
+        self._make_available(connection)
 
-    def remove_connection(self, connection: trio.abc.Stream):
+    def _make_available(self, connection: Connection) -> None:
+        """Hand an idle connection to the longest waiting caller, or pool it."""
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.connection = connection
+            self.used_connections.add(connection)
+            waiter.event.set()
+        else:
+            connection.idle_since = trio.current_time()
+            self.pool.append(connection)
+
+    def remove_connection(self, connection: Connection):
         """Remove a connection entirely, whether it is in used_connections or the pool.
 
         Arguments:
@@ -85,3 +423,245 @@ class ConnectionPool:
         self.used_connections.discard(connection)
         if connection in self.pool:
             self.pool.remove(connection)
+        self._offer_slot()
+
+    async def release(self, connection: Connection, reusable: bool) -> None:
+        """Put a checked out connection back in the pool, or close it.
+
+        A connection whose command was interrupted is not reusable, since the
+        next caller would read the reply to that command.
+
+        Arguments:
+            connection: The connection to release.
+            reusable (bool): Whether every reply has been read from it.
+        """
+        if reusable:
+            self.put_connection(connection)
+        else:
+            await self._discard(connection)
+
+    @asynccontextmanager
+    async def checkout(self) -> t.AsyncIterator[Connection]:
+        """Check a connection out for the duration of an async with block.
+
+        The connection is put back in the pool if the block completes, and
+        closed if it raises or is cancelled.
+
+        Yields:
+            The connection.
+
+        Example:
+            async with pool.checkout() as connection:
+                await connection.send_all(PING)
+        """
+        connection = await self.wait_for_connection()
+        completed = False
+        try:
+            yield connection
+            completed = True
+        finally:
+            await self.release(connection, completed)
+
+    async def warmup(self, count: t.Optional[int] = None) -> int:
+        """Open connections concurrently until *count* are idle in the pool.
+
+        Each connection runs the *on_connect* handshake before it is pooled.
+        No more than *max_connections* are ever opened.
+
+        Arguments:
+            count (int): The number of idle connections wanted (default: min_idle).
+
+        Returns:
+            The number of connections opened.
+
+        Raises:
+            ConnectionError: Some connections could not be opened. The ones that
+                were opened successfully are still pooled.
+        """
+        if count is None:
+            count = self.min_idle
+        needed = min(count - len(self.pool), self.max_connections - self.size)
+        errors: t.List[Exception] = []
+
+        async def open_one():
+            try:
+                connection = await self._spawn()
+            except CONNECT_ERRORS as error:
+                errors.append(error)
+            else:
+                self._make_available(connection)
+
+        async with trio.open_nursery() as nursery:
+            for _ in range(max(needed, 0)):
+                self.connecting += 1
+                nursery.start_soon(open_one)
+
+        if errors:
+            raise ConnectionError(
+                f"{len(errors)} of {needed} connections could not be opened"
+            ) from errors[0]
+        return max(needed, 0)
+
+    async def run(self, *, task_status=trio.TASK_STATUS_IGNORED) -> None:
+        """Keep *min_idle* connections open, topping the pool up as they are used.
+
+        This is meant to run in the background, for the lifetime of the pool. It
+        reports itself as started once the first :meth:`warmup` has finished.
+        Connection errors while topping up are ignored; the next checkout will
+        try again.
+
+        Arguments:
+            task_status: Used by :meth:`trio.Nursery.start`.
+
+        Example:
+            await nursery.start(pool.run)
+        """
+        await self.warmup()
+        task_status.started()
+        while True:
+            with trio.move_on_after(self.maintenance_interval):
+                await self._refill.wait()
+            self._refill = trio.Event()
+            await self.evict()
+            try:
+                await self.warmup()
+            except CONNECT_ERRORS:
+                pass
+
+    async def reset(
+        self, host: t.Optional[str] = None, port: t.Optional[int] = None
+    ) -> int:
+        """Start a new generation of connections, optionally to a new address.
+
+        Idle connections are closed right away. Connections in use are closed
+        when they are put back, so commands already sent can still finish. New
+        connections are opened to the new address, and :meth:`run` tops the pool
+        back up to *min_idle*.
+
+        Arguments:
+            host (str): The new address to connect to (default: unchanged).
+            port (int): The new port to connect to (default: unchanged).
+
+        Returns:
+            The number of idle connections closed.
+        """
+        if host is not None:
+            self.host = host
+        if port is not None:
+            self.port = port
+        self.generation += 1
+        idle, self.pool = self.pool, []
+        idle.extend(self._retired)
+        self._retired = []
+        for connection in idle:
+            await trio.aclose_forcefully(connection)
+        self._refill.set()
+        return len(idle)
+
+    async def evict(self) -> int:
+        """Close idle connections that are too old, idle too long, or broken.
+
+        Connections past *max_lifetime*, or put back after a :meth:`reset`, are
+        always closed. Connections idle for longer than *idle_timeout* are closed
+        while more than *min_idle* remain.
+        Connections idle for longer than *health_check_interval* are sent a PING
+        concurrently, and closed if they don't answer PONG.
+
+        Returns:
+            The number of connections closed.
+        """
+        now = trio.current_time()
+        expired, self._retired = self._retired, []
+        retired = len(expired)
+        for connection in expired:
+            await trio.aclose_forcefully(connection)
+        for connection in list(self.pool):
+            idle_for = now - connection.idle_since
+            if self._too_old(connection) or (
+                self.idle_timeout is not None
+                and idle_for >= self.idle_timeout
+                and len(self.pool) > self.min_idle
+            ):
+                self.pool.remove(connection)
+                expired.append(connection)
+        for connection in expired[retired:]:
+            await self._discard(connection)
+
+        if self.health_check_interval is None:
+            return len(expired)
+
+        stale = [
+            connection
+            for connection in self.pool
+            if now - connection.idle_since >= self.health_check_interval
+        ]
+        broken: t.List[Connection] = []
+
+        async def check(connection):
+            if await self._ping(connection):
+                self.put_connection(connection)
+            else:
+                broken.append(connection)
+
+        async with trio.open_nursery() as nursery:
+            for connection in stale:
+                self.pool.remove(connection)
+                self.used_connections.add(connection)
+                nursery.start_soon(check, connection)
+
+        for connection in broken:
+            await self._discard(connection)
+        return len(expired) + len(broken)
+
+    def _too_old(self, connection: Connection) -> bool:
+        """Return whether the connection is from an old generation or too old."""
+        return connection.generation != self.generation or (
+            self.max_lifetime is not None
+            and trio.current_time() - connection.created_at >= self.max_lifetime
+        )
+
+    async def _discard(self, connection: Connection) -> None:
+        """Remove a connection from the pool and close it."""
+        self.remove_connection(connection)
+        await trio.aclose_forcefully(connection)
+
+    async def _ping(self, connection: Connection) -> bool:
+        """Send PING on an idle connection and return whether PONG came back.
+
+        Pushes received while waiting are discarded.
+
+        Arguments:
+            connection: The connection to check.
+
+        Returns:
+            True if the connection answered PONG in time.
+        """
+        reader = connection.reader
+        with trio.move_on_after(HEALTH_CHECK_TIMEOUT):
+            try:
+                await connection.send_all(PING)
+                while True:
+                    reply = reader.get_object()
+                    if reply is reader.sentinel:
+                        data = await connection.receive_some()
+                        if not data:
+                            return False
+                        reader.feed(data)
+                    elif not isinstance(reply, protocol.RespPush):
+                        return reply in PONG_REPLIES
+            except (OSError, trio.BrokenResourceError, trio.ClosedResourceError):
+                return False
+        return False
+
+
+async def _receive(connection: Connection):
+    """Read the next reply or push from a connection."""
+    reader = connection.reader
+    while True:
+        reply = reader.get_object()
+        if reply is not reader.sentinel:
+            return reply
+        data = await connection.receive_some()
+        if not data:
+            raise trio.BrokenResourceError("The connection was closed by Redis")
+        reader.feed(data)
@@ -0,0 +1,120 @@
+"""The dispatch module runs push callbacks in worker tasks instead of inline.
+
+Classes:
+    PushDispatcher
+"""
+import inspect
+import typing as t
+
+from respy3 import protocol
+import trio
+
+
+class PushDispatcher:
+    """PushDispatcher hands pushes to worker tasks, so callbacks don't block reads.
+
+    Without a dispatcher, :meth:`RedisClient.receive` calls the push callbacks
+    itself, so a slow callback delays the reply being read. While a dispatcher is
+    running, *receive* only queues the push on a bounded channel and carries on.
+    The callbacks are called by *workers* worker tasks. They may be regular
+    functions or async functions.
+
+    If the queue is full, the push is dropped and *dropped* is incremented,
+    rather than holding up the connection. With more than one worker, pushes may
+    be handled out of order. An exception raised by a callback is propagated out
+    of the dispatcher's *async with* block.
+
+    Attributes:
+        client (RedisClient): The client whose pushes are dispatched.
+        workers (int): How many pushes are handled concurrently.
+        queue_size (int): How many pushes can wait to be handled.
+        dispatched (int): How many pushes have been queued.
+        handled (int): How many pushes have been handled by the workers.
+        dropped (int): How many pushes were dropped because the queue was full.
+        max_queue_depth (int): The most pushes that were queued at once.
+
+    Example:
+        async def on_message(push):
+            await database.save(push.data)
+
+        client.register_push_callback(b"message", on_message)
+        async with PushDispatcher(client, workers=4):
+            ...
+    """
+
+    def __init__(self, client, workers: int = 1, queue_size: int = 1000):
+        """Initialize the PushDispatcher.
+
+        Arguments:
+            client (RedisClient): The client to dispatch the pushes of.
+            workers (int): How many pushes to handle concurrently (default: 1).
+            queue_size (int): How many pushes can wait to be handled
+                (default: 1000).
+        """
+        self.client = client
+        self.workers = workers
+        self.queue_size = queue_size
+        self.dispatched = 0
+        self.handled = 0
+        self.dropped = 0
+        self.max_queue_depth = 0
+        self._send_channel, self._receive_channel = trio.open_memory_channel(queue_size)
+        self._nursery_manager = trio.open_nursery()
+        self._nursery: t.Optional[trio.Nursery] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of pushes waiting to be handled."""
+        return self._send_channel.statistics().current_buffer_used
+
+    @property
+    def stats(self) -> dict:
+        """The queue depth and the dispatched, handled and dropped counters."""
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "dispatched": self.dispatched,
+            "handled": self.handled,
+            "dropped": self.dropped,
+        }
+
+    async def __aenter__(self) -> "PushDispatcher":
+        """Start the workers and queue the client's pushes for them."""
+        self._nursery = await self._nursery_manager.__aenter__()
+        for _ in range(self.workers):
+            self._nursery.start_soon(self._worker, self._receive_channel.clone())
+        self.client.push_dispatcher = self
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Stop queueing pushes, and wait for the queued ones to be handled."""
+        self.client.push_dispatcher = None
+        await self._send_channel.aclose()
+        return await self._nursery_manager.__aexit__(*exc_info)
+
+    def dispatch(self, push: protocol.RespPush) -> None:
+        """Queue a push for the workers, or drop it if the queue is full.
+
+        It is not recommended to call this directly. :meth:`RedisClient.receive`
+        calls it while the dispatcher is running.
+
+        Args:
+            push (RespPush): The push received from Redis.
+        """
+        try:
+            self._send_channel.send_nowait(push)
+        except trio.WouldBlock:
+            self.dropped += 1
+            return
+        self.dispatched += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    async def _worker(self, receive_channel) -> None:
+        """Call the callbacks for each queued push."""
+        async with receive_channel:
+            async for push in receive_channel:
+                for callback in list(self.client.push_callbacks[push.push_type]):
+                    result = callback(push)
+                    if inspect.isawaitable(result):
+                        await result
+                self.handled += 1
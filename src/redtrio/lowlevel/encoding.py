@@ -0,0 +1,248 @@
+"""The encoding module encodes commands without copying large arguments.
+
+:func:`respy3.protocol.write_command` builds a single bytes object, which copies
+every argument at least once. For multi-megabyte values that copy dominates
+peak memory. The functions here instead return a list of chunks, where small
+pieces are joined together and large arguments are passed through untouched,
+to be written one after another.
+
+:func:`encode_arg` converts the str, int and float arguments of the midlevel
+client to bytes, passing bytes-like arguments through.
+
+:func:`write_command` is a drop-in replacement for
+:func:`respy3.protocol.write_command`. The array header and the command name
+only depend on the command and its number of arguments, so they are encoded
+once into a :class:`PreparedCommand` and reused, and only the arguments are
+encoded on every call.
+
+Classes:
+    PreparedCommand
+
+Functions:
+    write_command_chunks - encode a command as a list of chunks
+    coalesce - join runs of small chunks together
+    encode_arg - convert one argument to bytes
+    prepare - return the cached PreparedCommand for a command
+    write_command - encode a command into a single bytes object
+"""
+import typing as t
+
+
+LARGE_VALUE_THRESHOLD = 64 * 1024
+
+SMALL_INT_CACHE_SIZE = 1024
+
+PREPARED_CACHE_SIZE = 512
+
+Chunk = t.Union[bytes, bytearray, memoryview]
+Arg = t.Union[str, int, float, bytes, bytearray, memoryview]
+
+_SMALL_INTS = tuple(b"%d" % i for i in range(SMALL_INT_CACHE_SIZE))
+
+_PREPARED: t.Dict[t.Tuple[bytes, int], "PreparedCommand"] = {}
+
+
+def _size(arg: Chunk) -> int:
+    """Return the size of a bytes-like object in bytes."""
+    return arg.nbytes if isinstance(arg, memoryview) else len(arg)
+
+
+def write_command_chunks(
+    command: bytes, *args: Chunk, threshold: int = LARGE_VALUE_THRESHOLD
+) -> t.List[Chunk]:
+    r"""Encode a command as a list of chunks to be sent in order.
+
+    Arguments of at least *threshold* bytes are included as they are, so the
+    same bytes, bytearray or memoryview object is what gets written. Everything
+    else, including the RESP headers around the large arguments, is joined into
+    as few chunks as possible.
+
+    Arguments:
+        command (bytes): The command to be sent.
+        *args (Chunk): The args to send with the command, as bytes, bytearray
+            or memoryview objects.
+        threshold (int): The size from which args are not copied (default: 64KiB).
+
+    Returns:
+        A list of bytes-like chunks whose concatenation is the encoded command.
+
+    Example:
+        >>>write_command_chunks(b"SET", b"key", big_value, threshold=4)
+
+        [b'*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$5\r\n', big_value, b'\r\n']
+    """
+    chunks: t.List[Chunk] = []
+    buffer = bytearray(b"*%d\r\n" % (len(args) + 1))
+    for arg in (command, *args):
+        size = _size(arg)
+        buffer += b"$%d\r\n" % size
+        if size >= threshold:
+            chunks.append(bytes(buffer))
+            chunks.append(arg)
+            buffer = bytearray()
+        else:
+            buffer += arg
+        buffer += b"\r\n"
+    chunks.append(bytes(buffer))
+    return chunks
+
+
+def coalesce(
+    chunks: t.Iterable[Chunk], threshold: int = LARGE_VALUE_THRESHOLD
+) -> t.List[Chunk]:
+    """Join runs of chunks smaller than *threshold*, keeping larger ones as they are.
+
+    Arguments:
+        chunks (bytes-like): The chunks to join.
+        threshold (int): The size from which chunks are not copied (default: 64KiB).
+
+    Returns:
+        A list of chunks with the same concatenation as *chunks*.
+    """
+    coalesced: t.List[Chunk] = []
+    run: t.List[Chunk] = []
+    for chunk in chunks:
+        if _size(chunk) >= threshold:
+            if run:
+                coalesced.append(b"".join(run))
+                run = []
+            coalesced.append(chunk)
+        else:
+            run.append(chunk)
+    if run:
+        coalesced.append(b"".join(run))
+    return coalesced
+
+
+def encode_arg(arg: Arg) -> Chunk:
+    """Convert one argument of a command to the bytes sent to Redis.
+
+    bytes, bytearray and memoryview objects are passed through without being
+    copied. A str is encoded as UTF-8. An int is written in decimal, and the
+    encodings of 0 up to *SMALL_INT_CACHE_SIZE* are reused rather than formatted
+    every time. A float is written with repr, the shortest string that reads
+    back as the same float.
+
+    Arguments:
+        arg (Arg): The argument to convert.
+
+    Returns:
+        The argument as a bytes-like object.
+
+    Raises:
+        TypeError: The argument is not a str, int, float or bytes-like object.
+    """
+    kind = type(arg)
+    if kind is bytes:
+        return arg
+    if kind is str:
+        return arg.encode()
+    if kind is int:
+        if 0 <= arg < SMALL_INT_CACHE_SIZE:
+            return _SMALL_INTS[arg]
+        return b"%d" % arg
+    if kind is float:
+        return repr(arg).encode()
+
+    # Subclasses, and the less common types.
+    if isinstance(arg, memoryview):
+        # RESP lengths are in bytes, so the view must be of bytes too.
+        return arg if arg.itemsize == 1 else arg.cast("B")
+    if isinstance(arg, (bytes, bytearray)):
+        return arg
+    if isinstance(arg, str):
+        return str.encode(arg)
+    if isinstance(arg, int):
+        return b"%d" % arg
+    if isinstance(arg, float):
+        return repr(float(arg)).encode()
+    raise TypeError(f"Can't send a {kind.__name__} to Redis: {arg!r}")
+
+
+class PreparedCommand:
+    r"""PreparedCommand encodes a command that always has the same number of args.
+
+    The RESP header of the array and the command name are encoded once, when
+    the PreparedCommand is created, so encoding the command only formats the
+    header of each argument.
+
+    Attributes:
+        command (bytes): The command, such as b"HGET".
+        arity (int): How many args are sent with the command.
+        prefix (bytes): The encoded array header and command name.
+
+    Example:
+        >>>PreparedCommand(b"HGET", 2).encode(b"key", b"field")
+
+        b'*3\r\n$4\r\nHGET\r\n$3\r\nkey\r\n$5\r\nfield\r\n'
+    """
+
+    def __init__(self, command: bytes, arity: int):
+        """Initialize the PreparedCommand.
+
+        Arguments:
+            command (bytes): The command, such as b"HGET".
+            arity (int): How many args are sent with the command.
+        """
+        self.command = command
+        self.arity = arity
+        self.prefix = b"*%d\r\n$%d\r\n%b\r\n" % (arity + 1, len(command), command)
+
+    def encode(self, *args: Chunk) -> bytes:
+        """Encode the command with its args into a single bytes object.
+
+        Args:
+            *args (Chunk): The args to send with the command.
+
+        Returns:
+            The encoded RESP array.
+
+        Raises:
+            TypeError: The number of args is not *arity*.
+        """
+        if len(args) != self.arity:
+            raise TypeError(
+                f"{self.command!r} takes {self.arity} args, but {len(args)} were given"
+            )
+        return self.prefix + b"".join(
+            [b"$%d\r\n%b\r\n" % (len(arg), arg) for arg in args]
+        )
+
+
+def prepare(command: bytes, arity: int) -> PreparedCommand:
+    """Return the PreparedCommand for a command, creating it the first time.
+
+    At most *PREPARED_CACHE_SIZE* commands are kept. When there are more, for
+    example because MSET was sent with many different numbers of args, the
+    cache is emptied and fills up again with the commands still in use.
+
+    Arguments:
+        command (bytes): The command, such as b"HGET".
+        arity (int): How many args are sent with the command.
+
+    Returns:
+        The PreparedCommand, shared by every caller.
+    """
+    key = (command, arity)
+    prepared = _PREPARED.get(key)
+    if prepared is None:
+        if len(_PREPARED) >= PREPARED_CACHE_SIZE:
+            _PREPARED.clear()
+        prepared = _PREPARED[key] = PreparedCommand(command, arity)
+    return prepared
+
+
+def write_command(command: bytes, *args: Chunk) -> bytes:
+    """Encode a command into a single bytes object, like respy3's write_command.
+
+    Arguments:
+        command (bytes): The command to be sent.
+        *args (Chunk): The args to send with the command.
+
+    Returns:
+        The encoded RESP array as a bytes object.
+    """
+    prepared = _PREPARED.get((command, len(args))) or prepare(command, len(args))
+    return prepared.prefix + b"".join(
+        [b"$%d\r\n%b\r\n" % (len(arg), arg) for arg in args]
+    )
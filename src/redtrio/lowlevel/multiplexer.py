@@ -0,0 +1,235 @@
+"""The multiplexer module shares a few connections between many concurrent callers.
+
+Classes:
+    Multiplexer
+"""
+from collections import deque
+import typing as t
+
+import trio
+
+from . import connections
+
+RECONNECT_DELAY = 1
+
+
+class _Reply:
+    """A reply that a caller is waiting for.
+
+    Attributes:
+        event (trio.Event): Set once the reply or an error is available.
+        value: The reply from Redis.
+        error (Exception): The error that prevented a reply, if any.
+    """
+
+    def __init__(self):
+        """Initialize the _Reply."""
+        self.event = trio.Event()
+        self.value: t.Any = None
+        self.error: t.Optional[BaseException] = None
+
+    def set(self, value) -> None:
+        """Store the reply and wake the caller."""
+        self.value = value
+        self.event.set()
+
+    def fail(self, error: BaseException) -> None:
+        """Store the error and wake the caller."""
+        self.error = error
+        self.event.set()
+
+    async def wait(self):
+        """Wait for the reply and return it.
+
+        Returns:
+            The reply from Redis.
+
+        Raises:
+            error: The connection failed before a reply was read.
+        """
+        await self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class _Channel:
+    """A multiplexed connection, with its queued commands and outstanding replies.
+
+    Attributes:
+        connection (Connection): The connection, or None while connecting.
+        queued (list): (buffer, reply) pairs that have not been written yet.
+        waiting (deque): Replies that have been written, in the order they were sent.
+        wake (trio.Event): Set when *queued* has something for the writer.
+    """
+
+    def __init__(self):
+        """Initialize the _Channel."""
+        self.connection = None
+        self.queued: t.List[t.Tuple[bytes, _Reply]] = []
+        self.waiting: t.Deque[_Reply] = deque()
+        self.wake = trio.Event()
+
+    def __len__(self) -> int:
+        """Return the number of replies this channel still owes."""
+        return len(self.queued) + len(self.waiting)
+
+
+class Multiplexer:
+    """Multiplexer coalesces concurrent calls onto a few long-lived connections.
+
+    While the multiplexer is running, :meth:`RedisClient.call` queues each command
+    on the least busy of *connections* connections instead of checking out a
+    connection of its own. A writer task per connection flushes everything queued
+    since its last write with a single *send_all*, and a reader task hands the
+    replies back to the waiting callers in FIFO order. Pushes are still passed to
+    the client's push callbacks. When a connection breaks, the calls it owes
+    fail, and it is opened again, every *RECONNECT_DELAY* seconds until that
+    works; calls queued while it can't be opened fail too.
+
+    Commands that block the connection, such as BLPOP, stall every caller sharing
+    it and should not be sent while multiplexing. Subscribe commands are always
+    sent on a connection of their own.
+
+    Attributes:
+        client (RedisClient): The client being multiplexed.
+        channels (list): One _Channel per multiplexed connection.
+
+    Example:
+        async with Multiplexer(client, connections=2):
+            async with trio.open_nursery() as nursery:
+                for _ in range(1000):
+                    nursery.start_soon(client.call, b"INCR", b"counter")
+    """
+
+    def __init__(self, client, connections: int = 1):
+        """Initialize the Multiplexer.
+
+        Arguments:
+            client (RedisClient): The client to multiplex.
+            connections (int): How many connections to share (default: 1).
+        """
+        self.client = client
+        self.channels = [_Channel() for _ in range(connections)]
+        self._nursery_manager = trio.open_nursery()
+        self._nursery: t.Optional[trio.Nursery] = None
+
+    async def __aenter__(self) -> "Multiplexer":
+        """Open the connections and route the client's calls through them."""
+        self._nursery = await self._nursery_manager.__aenter__()
+        try:
+            for channel in self.channels:
+                await self._nursery.start(self._run_channel, channel)
+        except BaseException as error:
+            self._nursery.cancel_scope.cancel()
+            await self._nursery_manager.__aexit__(type(error), error, None)
+            raise
+        self.client.multiplexer = self
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Stop routing calls through the multiplexer and release the connections."""
+        self.client.multiplexer = None
+        self._nursery.cancel_scope.cancel()
+        try:
+            return await self._nursery_manager.__aexit__(*exc_info)
+        finally:
+            error = trio.ClosedResourceError("The multiplexer was closed")
+            for channel in self.channels:
+                for _, reply in channel.queued:
+                    reply.fail(error)
+                for reply in channel.waiting:
+                    reply.fail(error)
+                channel.queued.clear()
+                channel.waiting.clear()
+
+    async def call(self, command: bytes, *args: bytes):
+        """Queue a command on the least busy connection and wait for its reply.
+
+        It is not recommended to call this directly. Use :meth:`RedisClient.call`
+        while the multiplexer is running, instead.
+
+        Args:
+            command (bytes): The command to send, such as b"PING" or b"SET".
+            *args (bytes): The args to send with the command.
+
+        Returns:
+            The response from Redis, as parsed by the Reader class.
+        """
+        return await self.call_encoded(self.client.write_command(command, *args))
+
+    async def call_encoded(self, data: bytes):
+        """Queue an encoded command on the least busy connection and wait for its reply.
+
+        Args:
+            data (bytes): The command, already encoded as a RESP array.
+
+        Returns:
+            The response from Redis, as parsed by the Reader class.
+        """
+        channel = min(self.channels, key=len)
+        reply = _Reply()
+        channel.queued.append((data, reply))
+        channel.wake.set()
+        return await reply.wait()
+
+    async def _run_channel(self, channel, *, task_status=trio.TASK_STATUS_IGNORED):
+        """Keep a channel connected, reconnecting if the connection breaks."""
+        pool = self.client.connection_pool
+        started = False
+        while True:
+            try:
+                channel.connection = await pool.wait_for_connection()
+            except connections.CONNECT_ERRORS as error:
+                if not started:
+                    raise
+                queued, channel.queued = channel.queued, []
+                for _, reply in queued:
+                    reply.fail(error)
+                await trio.sleep(RECONNECT_DELAY)
+                continue
+            started = True
+            task_status.started()
+            task_status = trio.TASK_STATUS_IGNORED
+
+            errors: t.List[BaseException] = []
+            try:
+                async with trio.open_nursery() as nursery:
+                    nursery.start_soon(self._write_loop, channel, nursery, errors)
+                    nursery.start_soon(self._read_loop, channel, nursery, errors)
+            finally:
+                connection, channel.connection = channel.connection, None
+                await pool.release(connection, not (errors or channel.waiting))
+
+            while channel.waiting:
+                channel.waiting.popleft().fail(errors[0])
+
+    async def _write_loop(self, channel, nursery, errors) -> None:
+        """Write everything queued on the channel each time it is woken."""
+        try:
+            while True:
+                if not channel.queued:
+                    await channel.wake.wait()
+                channel.wake = trio.Event()
+
+                queued, channel.queued = channel.queued, []
+                channel.waiting.extend(reply for _, reply in queued)
+                await channel.connection.send_all(
+                    b"".join(buffer for buffer, _ in queued)
+                )
+        except (OSError, trio.BrokenResourceError) as error:
+            errors.append(error)
+            nursery.cancel_scope.cancel()
+
+    async def _read_loop(self, channel, nursery, errors) -> None:
+        """Read replies from the channel and hand them to the callers in order."""
+        try:
+            while True:
+                value = await self.client.receive(channel.connection)
+                # A reply nobody is waiting for, such as a stray push that no
+                # callback took, is dropped rather than stopping the loop.
+                if channel.waiting:
+                    channel.waiting.popleft().set(value)
+        except (OSError, trio.BrokenResourceError) as error:
+            errors.append(error)
+            nursery.cancel_scope.cancel()
@@ -0,0 +1,92 @@
+"""The pipeline module sends many commands to Redis in a single write.
+
+Classes:
+    Pipeline
+"""
+import typing as t
+
+from . import encoding
+from .client import PUSH_COMMANDS
+
+
+class Pipeline:
+    """Pipeline queues commands and sends them to Redis over one connection.
+
+    All queued commands are encoded into one buffer and written with a single
+    *send_all*, then the replies are read back in order. This costs one round
+    trip for the whole batch instead of one per command. Large arguments are
+    written separately rather than copied into the buffer.
+
+    Attributes:
+        client (RedisClient): The client whose connection pool and protocol are used.
+        commands (list): The queued commands, as (command, args) tuples.
+
+    Example:
+        pipeline = Pipeline(client)
+        pipeline.queue(b"SET", b"key", b"1").queue(b"INCR", b"key")
+        await pipeline.execute() -> [b"OK", 2]
+    """
+
+    def __init__(self, client):
+        """Initialize the Pipeline.
+
+        Arguments:
+            client (RedisClient): The client to send the commands with.
+        """
+        self.client = client
+        self.commands: t.List[t.Tuple[bytes, t.Tuple[bytes, ...]]] = []
+
+    def __len__(self) -> int:
+        """Return the number of queued commands."""
+        return len(self.commands)
+
+    def queue(self, command: bytes, *args: bytes) -> "Pipeline":
+        """Queue a command to be sent when :meth:`execute` is called.
+
+        Args:
+            command (bytes): The command to send, such as b"PING" or b"SET".
+            *args (bytes): The args to send with the command.
+
+        Returns:
+            The pipeline itself, so calls can be chained.
+        """
+        self.commands.append((command, args))
+        return self
+
+    async def execute(self) -> list:
+        """Send every queued command and return the replies in order.
+
+        Errors returned by Redis are not raised; they are placed in the list at
+        the position of the command that caused them. The connection is only
+        returned to the pool once every reply has been read. If reading is
+        interrupted, the connection is closed instead, since it still has unread
+        replies.
+
+        Returns:
+            A list containing one reply per queued command.
+        """
+        commands, self.commands = self.commands, []
+        if not commands:
+            return []
+
+        async with self.client.connection_pool.checkout() as connection:
+            return await self._send(connection, commands)
+
+    async def _send(self, connection, commands) -> list:
+        """Write every command to the connection and read back one reply each."""
+        chunks = encoding.coalesce(
+            (
+                chunk
+                for command, args in commands
+                for chunk in self.client.encode_command(command, *args)
+            ),
+            self.client.large_value_threshold,
+        )
+        for chunk in chunks:
+            await connection.send_all(chunk)
+        return [
+            await self.client.receive(
+                connection, push_only=command.upper() in PUSH_COMMANDS
+            )
+            for command, _ in commands
+        ]
@@ -0,0 +1,421 @@
+"""The pubsub module delivers Pub/Sub messages to async iterators.
+
+Classes:
+    Message
+    Subscription
+    PubSub
+"""
+import typing as t
+
+from respy3 import protocol
+import trio
+
+
+RECONNECT_DELAY = 1
+
+OVERFLOW_POLICIES = ("block", "drop-oldest", "disconnect")
+
+
+class Message(t.NamedTuple):
+    """A message published to a channel.
+
+    Attributes:
+        channel (bytes): The channel the message was published to.
+        data (bytes): The message itself.
+        pattern (bytes): The pattern that matched *channel*, or None if the
+            message was received through a channel subscription.
+    """
+
+    channel: bytes
+    data: bytes
+    pattern: t.Optional[bytes] = None
+
+
+class Subscription(trio.abc.ReceiveChannel):
+    """Subscription receives the messages for a few channels or patterns.
+
+    Messages are buffered in a bounded memory channel. What happens once the
+    buffer is full depends on the *overflow* policy:
+
+    - "block": the PubSub stops reading until there is room again, which holds
+      up every other subscription too.
+    - "drop-oldest": the oldest buffered message is dropped to make room, and
+      *dropped* is incremented.
+    - "disconnect": the subscription is closed. Once the buffered messages have
+      been received, :meth:`receive` raises :exc:`trio.BrokenResourceError`.
+
+    Use *async for* to receive the messages, and :meth:`aclose` (or *async with*)
+    to unsubscribe.
+
+    Attributes:
+        pubsub (PubSub): The PubSub the subscription belongs to.
+        names (tuple): The channels or patterns subscribed to.
+        pattern (bool): Whether *names* are patterns.
+        overflow (str): "block", "drop-oldest" or "disconnect".
+        dropped (int): How many messages were dropped to make room.
+        overflowed (bool): Whether the subscription was closed for falling behind.
+    """
+
+    def __init__(
+        self,
+        pubsub,
+        names: t.Tuple[bytes, ...],
+        pattern: bool,
+        buffer_size: int,
+        overflow: str,
+    ):
+        """Initialize the Subscription.
+
+        Arguments:
+            pubsub (PubSub): The PubSub the subscription belongs to.
+            names (tuple): The channels or patterns to subscribe to.
+            pattern (bool): Whether *names* are patterns.
+            buffer_size (int): How many messages to buffer.
+            overflow (str): "block", "drop-oldest" or "disconnect".
+        """
+        self.pubsub = pubsub
+        self.names = names
+        self.pattern = pattern
+        self.overflow = overflow
+        self.dropped = 0
+        self.overflowed = False
+        self._send_channel, self._receive_channel = trio.open_memory_channel(
+            buffer_size
+        )
+
+    async def receive(self) -> Message:
+        """Wait for the next message and return it.
+
+        Returns:
+            The next Message.
+
+        Raises:
+            error: trio.EndOfChannel once the PubSub has been closed, or
+                trio.BrokenResourceError if the subscription fell too far behind.
+        """
+        try:
+            return await self._receive_channel.receive()
+        except trio.EndOfChannel as end:
+            error = end
+            if self.overflowed:
+                error = trio.BrokenResourceError("The subscriber fell too far behind")
+        raise error
+
+    async def aclose(self) -> None:
+        """Unsubscribe and stop receiving messages."""
+        await self._receive_channel.aclose()
+        await self.pubsub._remove(self)
+
+    async def _deliver(self, message: Message) -> None:
+        """Buffer a message, applying the overflow policy if the buffer is full."""
+        try:
+            self._send_channel.send_nowait(message)
+        except trio.WouldBlock:
+            if self.overflow == "block":
+                try:
+                    await self._send_channel.send(message)
+                except (trio.BrokenResourceError, trio.ClosedResourceError):
+                    # The subscriber closed while the reader waited for room.
+                    await self.pubsub._remove(self)
+            elif self.overflow == "drop-oldest":
+                self._receive_channel.receive_nowait()
+                self.dropped += 1
+                self._send_channel.send_nowait(message)
+            else:
+                self.overflowed = True
+                await self.pubsub._remove(self)
+        except trio.BrokenResourceError:
+            # The subscriber closed the receiving end without calling aclose.
+            await self.pubsub._remove(self)
+
+
+class PubSub:
+    """PubSub owns a connection dedicated to Pub/Sub and fans messages out.
+
+    A background task reads the pushes on the connection, and hands each message
+    to every :class:`Subscription` for its channel or pattern. If the connection
+    is lost, it reconnects and subscribes to everything again. Messages published
+    while it was disconnected are lost.
+
+    Attributes:
+        client (RedisClient): The client whose connection pool is used.
+        buffer_size (int): How many messages each subscription buffers by default.
+        overflow (str): The default overflow policy: "block", "drop-oldest" or
+            "disconnect".
+        channels (dict): The subscriptions, by channel.
+        patterns (dict): The subscriptions, by pattern.
+        connection (Connection): The Pub/Sub connection, or None while it is not
+            connected.
+
+    Example:
+        async with PubSub(client, overflow="drop-oldest") as pubsub:
+            async with await pubsub.subscribe(b"news") as subscription:
+                async for message in subscription:
+                    print(message.data)
+    """
+
+    def __init__(self, client, *, buffer_size: int = 100, overflow: str = "block"):
+        """Initialize the PubSub.
+
+        Arguments:
+            client (RedisClient): The client to open the connection with.
+            buffer_size (int): How many messages each subscription buffers by
+                default (default: 100).
+            overflow (str): The default overflow policy: "block", "drop-oldest" or
+                "disconnect" (default: "block").
+        """
+        _check_policy(buffer_size, overflow)
+        self.client = client
+        self.buffer_size = buffer_size
+        self.overflow = overflow
+        self.channels: t.Dict[bytes, t.List[Subscription]] = {}
+        self.patterns: t.Dict[bytes, t.List[Subscription]] = {}
+        self.connection = None
+        self._pending: t.Dict[t.Tuple[bool, bytes], trio.Event] = {}
+        self._send_lock = trio.StrictFIFOLock()
+        self._closed = False
+        self._nursery_manager = trio.open_nursery()
+        self._nursery: t.Optional[trio.Nursery] = None
+
+    async def __aenter__(self) -> "PubSub":
+        """Connect the Pub/Sub connection and start reading from it."""
+        self._nursery = await self._nursery_manager.__aenter__()
+        try:
+            await self._nursery.start(self._run)
+        except BaseException as error:
+            self._nursery.cancel_scope.cancel()
+            await self._nursery_manager.__aexit__(type(error), error, None)
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Close the connection and end every subscription."""
+        self._closed = True
+        self._nursery.cancel_scope.cancel()
+        try:
+            return await self._nursery_manager.__aexit__(*exc_info)
+        finally:
+            for subscriptions in (*self.channels.values(), *self.patterns.values()):
+                for subscription in subscriptions:
+                    subscription._send_channel.close()
+            self.channels.clear()
+            self.patterns.clear()
+            for event in self._pending.values():
+                event.set()
+            self._pending.clear()
+
+    async def subscribe(
+        self,
+        *channels: bytes,
+        buffer_size: t.Optional[int] = None,
+        overflow: t.Optional[str] = None,
+    ) -> Subscription:
+        """Subscribe to channels, returning once Redis has confirmed it.
+
+        Args:
+            *channels (bytes): The channels to subscribe to.
+            buffer_size (int): How many messages to buffer (default: *buffer_size*).
+            overflow (str): The overflow policy (default: *overflow*).
+
+        Returns:
+            A Subscription receiving the messages for *channels*.
+        """
+        return await self._add(channels, False, buffer_size, overflow)
+
+    async def psubscribe(
+        self,
+        *patterns: bytes,
+        buffer_size: t.Optional[int] = None,
+        overflow: t.Optional[str] = None,
+    ) -> Subscription:
+        """Subscribe to patterns, returning once Redis has confirmed it.
+
+        Args:
+            *patterns (bytes): The glob-style patterns to subscribe to.
+            buffer_size (int): How many messages to buffer (default: *buffer_size*).
+            overflow (str): The overflow policy (default: *overflow*).
+
+        Returns:
+            A Subscription receiving the messages for *patterns*.
+        """
+        return await self._add(patterns, True, buffer_size, overflow)
+
+    async def _add(
+        self,
+        names: t.Tuple[bytes, ...],
+        pattern: bool,
+        buffer_size: t.Optional[int],
+        overflow: t.Optional[str],
+    ) -> Subscription:
+        """Add a subscription, subscribing to any names not subscribed to yet."""
+        if self._closed or self._nursery is None:
+            raise trio.ClosedResourceError("The PubSub is not running")
+        buffer_size = self.buffer_size if buffer_size is None else buffer_size
+        overflow = self.overflow if overflow is None else overflow
+        _check_policy(buffer_size, overflow)
+
+        subscription = Subscription(self, names, pattern, buffer_size, overflow)
+        subscribed = self.patterns if pattern else self.channels
+        new = []
+        for name in dict.fromkeys(names):
+            if name not in subscribed:
+                new.append(name)
+                self._pending[pattern, name] = trio.Event()
+            subscribed.setdefault(name, []).append(subscription)
+
+        command = b"PSUBSCRIBE" if pattern else b"SUBSCRIBE"
+        sent = False
+        try:
+            if new:
+                await self._send(command, *new)
+            sent = True
+            for name in names:
+                event = self._pending.get((pattern, name))
+                if event is not None:
+                    await event.wait()
+        except BaseException:
+            # Cancelled: undo the subscription, so no name is left waiting for a
+            # confirmation that won't come, and no unread buffer blocks the reader.
+            with trio.CancelScope(shield=True):
+                await self._remove(subscription)
+                kept = [name for name in new if name in subscribed]
+                for name in new:
+                    if name not in kept:
+                        event = self._pending.pop((pattern, name), None)
+                        if event is not None:
+                            event.set()
+                # Subscriptions added meanwhile still wait for these names.
+                if kept and not sent:
+                    await self._send(command, *kept)
+            raise
+        return subscription
+
+    async def _remove(self, subscription: Subscription) -> None:
+        """Remove a subscription, unsubscribing from names nobody else wants."""
+        subscribed = self.patterns if subscription.pattern else self.channels
+        unused = []
+        for name in dict.fromkeys(subscription.names):
+            subscriptions = subscribed.get(name, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+                if not subscriptions:
+                    del subscribed[name]
+                    unused.append(name)
+        subscription._send_channel.close()
+        if unused and not self._closed:
+            command = b"PUNSUBSCRIBE" if subscription.pattern else b"UNSUBSCRIBE"
+            await self._send(command, *unused)
+
+    async def _send(self, command: bytes, *args: bytes) -> None:
+        """Send a command, unless disconnected. Subscriptions are redone anyway."""
+        async with self._send_lock:
+            if self.connection is None:
+                return
+            try:
+                await self.connection.send_all(
+                    self.client.write_command(command, *args)
+                )
+            except (OSError, trio.BrokenResourceError, trio.ClosedResourceError):
+                pass
+
+    async def _run(self, *, task_status=trio.TASK_STATUS_IGNORED) -> None:
+        """Keep the Pub/Sub connection open, reading the pushes sent on it.
+
+        Args:
+            task_status: Used by :meth:`trio.Nursery.start`.
+
+        Raises:
+            OSError: The connection could not be set up the first time.
+            trio.BrokenResourceError: Redis closed the connection during setup.
+        """
+        pool = self.client.connection_pool
+        started = False
+        while True:
+            try:
+                connection = await pool.wait_for_connection()
+            except OSError:
+                if not started:
+                    raise
+                await trio.sleep(RECONNECT_DELAY)
+                continue
+            # A subscribed connection can never go back to the pool.
+            pool.remove_connection(connection)
+
+            try:
+                commands = [(b"HELLO", b"3")]
+                if self.channels:
+                    commands.append((b"SUBSCRIBE", *self.channels))
+                if self.patterns:
+                    commands.append((b"PSUBSCRIBE", *self.patterns))
+                await connection.send_all(
+                    b"".join(
+                        self.client.write_command(*command) for command in commands
+                    )
+                )
+                await self.client.receive(connection)
+                self.connection = connection
+                if not started:
+                    started = True
+                    task_status.started()
+                await self._read_loop(connection)
+            except (OSError, trio.BrokenResourceError):
+                if not started:
+                    raise
+            finally:
+                self.connection = None
+                await trio.aclose_forcefully(connection)
+            await trio.sleep(RECONNECT_DELAY)
+
+    async def _read_loop(self, connection) -> None:
+        """Read pushes from the connection and deliver the messages."""
+        reader = connection.reader
+        while True:
+            push = reader.get_object()
+            if push is reader.sentinel:
+                data = await connection.receive_some()
+                if not data:
+                    raise trio.BrokenResourceError("The connection was closed by Redis")
+                reader.feed(data)
+            elif isinstance(push, protocol.RespPush):
+                await self._dispatch(push)
+
+    async def _dispatch(self, push: protocol.RespPush) -> None:
+        """Deliver a message push, or note a subscribe confirmation."""
+        kind = push.push_type
+        if kind in (b"subscribe", b"psubscribe"):
+            event = self._pending.pop((kind == b"psubscribe", push.data[0]), None)
+            if event is not None:
+                event.set()
+            return
+
+        if kind == b"message":
+            channel, data = push.data
+            message = Message(channel, data)
+            subscriptions = self.channels.get(channel, [])
+        elif kind == b"pmessage":
+            pattern, channel, data = push.data
+            message = Message(channel, data, pattern)
+            subscriptions = self.patterns.get(pattern, [])
+        else:
+            return
+        for subscription in list(subscriptions):
+            await subscription._deliver(message)
+
+
+def _check_policy(buffer_size: int, overflow: str) -> None:
+    """Raise ValueError if the overflow policy can't be used with the buffer size.
+
+    Arguments:
+        buffer_size (int): How many messages to buffer.
+        overflow (str): The overflow policy.
+
+    Raises:
+        ValueError: The overflow policy is unknown, or it drops or disconnects
+            with nothing to buffer.
+    """
+    if overflow not in OVERFLOW_POLICIES:
+        raise ValueError(
+            f"overflow must be one of {OVERFLOW_POLICIES}, not {overflow!r}"
+        )
+    if overflow != "block" and buffer_size < 1:
+        raise ValueError(f"overflow={overflow!r} needs a buffer_size of at least 1")
@@ -0,0 +1,274 @@
+"""The readers module contains alternatives to Resp3Reader for other reply shapes.
+
+Any of them can be passed as the *Reader* of a :class:`RedisClient` or a
+:class:`ConnectionPool`, which gives each connection its own instance:
+
+- :class:`RawReader` returns each reply as the undecoded RESP frame, for
+  proxies passing replies through without looking inside them.
+- :class:`PairsReader` returns maps as flat [key, value, ...] lists, so large
+  HGETALL or CONFIG GET replies don't build a dict.
+- :class:`DecodingReader` returns strings as str, decoded as they are parsed.
+
+Classes:
+    RawReader
+    PairsReader
+    DecodingReader
+
+Functions:
+    parse_raw - parse a frame left undecoded by RawReader, for internal replies
+"""
+import typing as t
+
+from respy3 import protocol
+
+# Frames whose header is followed by that many bytes of data.
+BLOB_TYPES = {ord("$"), ord("!"), ord("=")}
+# Frames whose header is followed by that many frames.
+AGGREGATE_TYPES = {ord("*"), ord("~"), ord(">")}
+# Frames whose header is followed by twice that many frames.
+MAP_TYPES = {ord("%"), ord("|")}
+# Frames RawReader parses, so errors and pushes are handled as usual.
+PARSED_TYPES = {ord("-"), ord("!"), ord(">")}
+
+
+class RawReader:
+    r"""RawReader returns each reply as a memoryview of its undecoded RESP frame.
+
+    Frames are only scanned for their end, jumping over the data of strings, so
+    nothing is decoded and no object is built for the elements of arrays or
+    maps. The returned memoryview is read-only, and slices the buffer the
+    frame was received into rather than a copy of it.
+
+    Errors and pushes are still parsed, into a RedisError and a RespPush, so
+    handshakes, cluster redirects and push callbacks keep working.
+
+    Attributes:
+        sentinel (object): Returned by *get_object* when no frame is complete.
+
+    Example:
+        client = RedisClient(Reader=RawReader)
+        bytes(await client.call(b"HGETALL", b"key")) -> b"%1\r\n$1\r\na\r\n:1\r\n"
+    """
+
+    def __init__(self):
+        """Initialize the RawReader."""
+        self.sentinel = object()
+        self._buffer = bytearray()
+        self._start = 0
+        # Where the scan of an incomplete frame stopped, and how many frames
+        # it still has to skip, so a large frame is not scanned from the start
+        # every time more data arrives.
+        self._position = 0
+        self._pending = 0
+        self._exported = False
+
+    def feed(self, data: bytes) -> None:
+        """Extend the buffer with data.
+
+        Arguments:
+            data (bytes): Bytes received from the server.
+        """
+        if self._exported:
+            # Returned frames still view the old buffer, so it can't be resized.
+            self._buffer = self._buffer[self._start :]
+            self._exported = False
+        else:
+            del self._buffer[: self._start]
+        self._position -= self._start
+        self._start = 0
+        self._buffer += data
+
+    def get_object(self) -> t.Any:
+        """Return the next complete frame, or *sentinel* if there isn't one yet.
+
+        Returns:
+            A memoryview of the frame, or the parsed error or push.
+        """
+        buffer = self._buffer
+        if self._pending:
+            position, pending = self._position, self._pending
+        else:
+            position, pending = self._start, 1
+
+        while pending:
+            line_end = buffer.find(b"\r\n", position)
+            if line_end == -1:
+                break
+            kind = buffer[position]
+            end = line_end + 2
+            if kind in BLOB_TYPES:
+                size = int(buffer[position + 1 : line_end])
+                if size >= 0:  # $-1 is a RESP2 null, without data.
+                    end += size + 2
+                if end > len(buffer):
+                    break
+                pending -= 1
+            elif kind in AGGREGATE_TYPES:
+                pending += max(int(buffer[position + 1 : line_end]), 0) - 1
+            elif kind in MAP_TYPES:
+                pending += 2 * int(buffer[position + 1 : line_end])
+                if kind == ord("%"):
+                    pending -= 1  # Attributes (|) come before the reply itself.
+            else:
+                pending -= 1
+            position = end
+
+        if pending:
+            self._position, self._pending = position, pending
+            return self.sentinel
+        start, self._start, self._pending = self._start, position, 0
+
+        if buffer[start] in PARSED_TYPES:
+            reader = protocol.Resp3Reader()
+            reader.feed(buffer[start:position])
+            return reader.get_object()
+        self._exported = True
+        return memoryview(buffer).toreadonly()[start:position]
+
+
+def parse_raw(reply) -> t.Any:
+    """Parse a reply left as a RESP frame by RawReader, as Resp3Reader would.
+
+    Replies the client reads itself, such as CLIENT ID or CLUSTER SLOTS, are
+    passed through this, so they can be understood whatever the *Reader* is.
+
+    Arguments:
+        reply: A reply from any reader.
+
+    Returns:
+        The parsed reply, or *reply* itself if it isn't a RawReader frame.
+    """
+    if not isinstance(reply, memoryview):
+        return reply
+    if reply[:3] == b"$-1":
+        return None  # A RESP2 null, which Resp3Reader doesn't parse.
+    reader = protocol.Resp3Reader()
+    reader.feed(bytes(reply))
+    return reader.get_object()
+
+
+class PairsReader(protocol.Resp3Reader):
+    """PairsReader parses maps into flat [key, value, ...] lists instead of dicts.
+
+    Keys don't have to be hashed, and replies with repeated or unhashable keys
+    are kept as they are. Every other type is parsed like Resp3Reader does.
+
+    Example:
+        client = RedisClient(Reader=PairsReader)
+        await client.call(b"HGETALL", b"key") -> [b"a", b"1", b"b", b"2"]
+    """
+
+    def parse_map(self, state: t.Optional[dict] = None) -> list:
+        """Parse a RESP3 map (byte: %) into a flat list of keys and values.
+
+        Arguments:
+            state (dict): If this is passed, parsing will resume from where it
+                left off.
+
+        Returns:
+            A list alternating keys and values.
+        """
+        if state is None:
+            state = {"function": self.parse_map, "object": []}
+
+        if "length" not in state:
+            state["length"] = 2 * int(self.eat_linebreak(state=state))
+
+        while len(state["object"]) < state["length"]:
+            state["object"].append(self.parse(state=state))
+
+        return state["object"]
+
+
+class DecodingReader(protocol.Resp3Reader):
+    """DecodingReader parses strings into str, decoding each one as it is parsed.
+
+    Simple, blob and verbatim strings are decoded, including map keys and the
+    elements of arrays. Errors are left as bytes, like the RedisErrors of
+    Resp3Reader, and so are pushes, whose types and channels the push callbacks
+    are registered with.
+
+    To decode with other arguments, pass a partial, such as
+    functools.partial(DecodingReader, errors="replace"), as the Reader.
+
+    Attributes:
+        encoding (str): The encoding of the strings.
+        errors (str): How decoding errors are handled, as for bytes.decode.
+        decoding (bool): Whether strings are decoded, which is False in pushes.
+
+    Example:
+        client = RedisClient(Reader=DecodingReader)
+        await client.call(b"GET", b"key") -> "value"
+    """
+
+    def __init__(self, encoding: str = "utf-8", errors: str = "strict"):
+        """Initialize the DecodingReader.
+
+        Arguments:
+            encoding (str): The encoding of the strings (default: "utf-8").
+            errors (str): How decoding errors are handled (default: "strict").
+        """
+        super().__init__()
+        self.encoding = encoding
+        self.errors = errors
+        self.decoding = True
+
+    def _decode(self, value: bytes) -> t.Union[str, bytes]:
+        """Decode a string, unless it is part of a push."""
+        if self.decoding:
+            return value.decode(self.encoding, self.errors)
+        return value
+
+    def parse_simple_string(self, state: t.Optional[dict] = None):
+        """Parse a RESP3 simple string (byte: +) into a str.
+
+        Arguments:
+            state (dict): Passed on to Resp3Reader.parse_simple_string.
+
+        Returns:
+            The decoded string.
+        """
+        return self._decode(super().parse_simple_string(state))
+
+    def parse_blob(self, state: t.Optional[dict] = None):
+        """Parse a RESP3 blob (byte: $) into a str.
+
+        Arguments:
+            state (dict): If this is passed, parsing will resume from where it
+                left off.
+
+        Returns:
+            The decoded string.
+        """
+        return self._decode(super().parse_blob(state))
+
+    def parse_verbatim_string(self, state: t.Optional[dict] = None):
+        """Parse a verbatim string (byte: =) into a str.
+
+        Arguments:
+            state (dict): If this is passed, parsing will resume from where it
+                left off.
+
+        Returns:
+            The decoded string, after the format marker.
+        """
+        return self._decode(super().parse_verbatim_string(state))
+
+    def parse_push(self, state: t.Optional[dict] = None) -> protocol.RespPush:
+        """Parse a RESP3 push (byte: >) into a RespPush, leaving its strings as bytes.
+
+        Pushes are only sent at the top level, and parsing one resumes from
+        here after more data is fed, so decoding is switched off around it.
+
+        Arguments:
+            state (dict): If this is passed, parsing will resume from where it
+                left off.
+
+        Returns:
+            A RespPush object containing the push type and the parsed list.
+        """
+        self.decoding = False
+        try:
+            return super().parse_push(state)
+        finally:
+            self.decoding = True
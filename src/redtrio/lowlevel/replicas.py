@@ -0,0 +1,225 @@
+"""The replicas module sends reads to replicas and writes to the primary.
+
+Classes:
+    ReplicaClient
+"""
+import itertools
+import typing as t
+
+from respy3 import protocol
+import trio
+
+from . import connections
+from .client import RedisClient
+
+Address = t.Tuple[str, int]
+
+BALANCE_POLICIES = ("round-robin", "least-outstanding")
+
+# Commands that never write, so any replica can answer them.
+READ_COMMANDS = {
+    b"BITCOUNT",
+    b"BITPOS",
+    b"DBSIZE",
+    b"EVALSHA_RO",
+    b"EVAL_RO",
+    b"EXISTS",
+    b"FCALL_RO",
+    b"GEODIST",
+    b"GEOHASH",
+    b"GEOPOS",
+    b"GEOSEARCH",
+    b"GET",
+    b"GETBIT",
+    b"GETRANGE",
+    b"HEXISTS",
+    b"HGET",
+    b"HGETALL",
+    b"HKEYS",
+    b"HLEN",
+    b"HMGET",
+    b"HRANDFIELD",
+    b"HSCAN",
+    b"HSTRLEN",
+    b"HVALS",
+    b"KEYS",
+    b"LINDEX",
+    b"LLEN",
+    b"LPOS",
+    b"LRANGE",
+    b"MGET",
+    b"PTTL",
+    b"RANDOMKEY",
+    b"SCAN",
+    b"SCARD",
+    b"SDIFF",
+    b"SINTER",
+    b"SISMEMBER",
+    b"SMEMBERS",
+    b"SMISMEMBER",
+    b"SRANDMEMBER",
+    b"SSCAN",
+    b"STRLEN",
+    b"SUNION",
+    b"TTL",
+    b"TYPE",
+    b"XLEN",
+    b"XRANGE",
+    b"XREVRANGE",
+    b"ZCARD",
+    b"ZCOUNT",
+    b"ZMSCORE",
+    b"ZRANGE",
+    b"ZRANGEBYSCORE",
+    b"ZRANK",
+    b"ZREVRANGE",
+    b"ZREVRANK",
+    b"ZSCAN",
+    b"ZSCORE",
+}
+
+# Errors a replica sends while it can't serve reads yet.
+UNAVAILABLE_ERRORS = {b"LOADING", b"MASTERDOWN"}
+
+
+class ReplicaClient:
+    """ReplicaClient sends reads to replicas, and everything else to the primary.
+
+    There is one :class:`RedisClient`, with its own :class:`ConnectionPool`, for
+    the primary and for each replica. Commands in *READ_COMMANDS* go to a replica
+    picked by *balance*:
+
+    - "round-robin" takes the replicas in turn.
+    - "least-outstanding" takes the replica with the fewest commands in flight,
+      so a slow replica is given less work.
+
+    A replica that can't be connected to, drops the connection, or replies with
+    LOADING or MASTERDOWN is taken out of rotation for *retry_interval* seconds,
+    and the command is sent to the next replica instead. If no replica is in
+    rotation, reads go to the primary. Replicas are updated asynchronously, so a
+    read sent right after a write may not see it yet.
+
+    Attributes:
+        primary (RedisClient): The client for the primary.
+        replicas (list): The client for each replica.
+        balance (str): How a replica is picked for each read.
+        retry_interval (float): Seconds a failed replica is left out of rotation.
+        outstanding (dict): How many commands are in flight on each replica.
+        down_until (dict): The trio time each failed replica is back in rotation.
+
+    Example:
+        client = ReplicaClient(
+            ("10.0.0.1", 6379),
+            [("10.0.0.2", 6379), ("10.0.0.3", 6379)],
+            balance="least-outstanding",
+        )
+        await client.call(b"SET", b"key", b"value")  # Sent to 10.0.0.1
+        await client.call(b"GET", b"key")  # Sent to 10.0.0.2 or 10.0.0.3
+    """
+
+    def __init__(
+        self,
+        primary: Address = ("127.0.0.1", 6379),
+        replicas: t.Iterable[Address] = (),
+        *,
+        balance: str = "round-robin",
+        retry_interval: float = 5,
+        **pool_args,
+    ):
+        """Initialize the ReplicaClient.
+
+        Arguments:
+            primary: The (host, port) of the primary
+                (default: ("127.0.0.1", 6379)).
+            replicas (list): The (host, port) of each replica (default: none).
+            balance (str): "round-robin" or "least-outstanding"
+                (default: "round-robin").
+            retry_interval (float): Seconds to leave a failed replica out of
+                rotation (default: 5).
+            **pool_args: Any other arg accepted by :class:`ConnectionPool`, used
+                for every node.
+
+        Raises:
+            ValueError: The balance policy is unknown.
+        """
+        if balance not in BALANCE_POLICIES:
+            raise ValueError(
+                f"balance must be one of {BALANCE_POLICIES}, not {balance!r}"
+            )
+        self.balance = balance
+        self.retry_interval = retry_interval
+        self.primary = self._connect(*primary, pool_args)
+        self.replicas = [self._connect(*address, pool_args) for address in replicas]
+        self.outstanding: t.Dict[RedisClient, int] = {
+            replica: 0 for replica in self.replicas
+        }
+        self.down_until: t.Dict[RedisClient, float] = {}
+        self._turn = itertools.count()
+
+    @property
+    def available(self) -> t.List[RedisClient]:
+        """The replicas currently in rotation."""
+        now = trio.current_time()
+        return [
+            replica
+            for replica in self.replicas
+            if self.down_until.get(replica, now) <= now
+        ]
+
+    async def call(self, command: bytes, *args: bytes):
+        """Send a command to a replica if it only reads, or to the primary.
+
+        Args:
+            command (bytes): The command to send, such as b"GET" or b"SET".
+            *args (bytes): The args to send with the command.
+
+        Returns:
+            The response from Redis, as parsed by the Reader class.
+        """
+        if command.upper() in READ_COMMANDS:
+            tried: t.Set[RedisClient] = set()
+            replica = self._pick(tried)
+            while replica is not None:
+                tried.add(replica)
+                self.outstanding[replica] += 1
+                try:
+                    reply = await replica.call(command, *args)
+                    failed = _unavailable(reply)
+                except (OSError, trio.BrokenResourceError):
+                    failed = True
+                finally:
+                    self.outstanding[replica] -= 1
+                if not failed:
+                    return reply
+                self._take_down(replica)
+                replica = self._pick(tried)
+        return await self.primary.call(command, *args)
+
+    def _connect(self, host: str, port: int, pool_args: dict) -> RedisClient:
+        """Create the client for one node."""
+        pool = connections.ConnectionPool(host, port, **pool_args)
+        return RedisClient(host, port, connection_pool=pool)
+
+    def _pick(self, tried: t.Set[RedisClient]) -> t.Optional[RedisClient]:
+        """Return the replica to send a read to, or None to use the primary."""
+        candidates = [replica for replica in self.available if replica not in tried]
+        if not candidates:
+            return None
+        turn = next(self._turn)
+        # Rotate first, so ties between equally loaded replicas are shared out.
+        start = turn % len(candidates)
+        candidates = candidates[start:] + candidates[:start]
+        if self.balance == "least-outstanding":
+            return min(candidates, key=self.outstanding.__getitem__)
+        return candidates[0]
+
+    def _take_down(self, replica: RedisClient) -> None:
+        """Leave a replica out of rotation for *retry_interval* seconds."""
+        self.down_until[replica] = trio.current_time() + self.retry_interval
+
+
+def _unavailable(reply) -> bool:
+    """Return whether a reply says the replica can't serve reads right now."""
+    return (
+        isinstance(reply, protocol.RedisError) and reply.args[0] in UNAVAILABLE_ERRORS
+    )
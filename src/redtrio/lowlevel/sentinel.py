@@ -0,0 +1,204 @@
+"""The sentinel module finds the Redis master through Redis Sentinel.
+
+Classes:
+    SentinelPool
+"""
+import typing as t
+
+from respy3 import protocol
+import trio
+
+from .connections import _receive
+from .connections import Connection
+from .connections import ConnectionPool
+
+Address = t.Tuple[str, int]
+
+RECONNECT_DELAY = 1
+SWITCH_MASTER = b"+switch-master"
+
+
+class SentinelPool(ConnectionPool):
+    """SentinelPool is a connection pool to whichever node Sentinel says is master.
+
+    The master's address is asked of the sentinels, in order, with SENTINEL
+    get-master-addr-by-name before the first connection is opened. The sentinel
+    that answered is moved to the front of *sentinels*, so it is asked first
+    next time.
+
+    While :meth:`run` is running, the pool also stays subscribed to
+    +switch-master on one of the sentinels, over RESP3. When the master fails
+    over, the pool is :meth:`reset` to the new master as soon as the message
+    arrives: idle connections are closed, connections in use are closed when
+    they are put back, and new connections go to the new master. Without this,
+    the old connections would only be dropped once they failed. If the
+    subscription is lost, the pool subscribes on the next sentinel, and asks for
+    the master's address again in case a failover was missed.
+
+    Attributes:
+        service_name (str): The name the master is monitored under.
+        sentinels (list): The (host, port) addresses of the sentinels.
+        sentinel_timeout (float): Seconds to wait for a sentinel to answer.
+        failovers (int): How many failovers the pool has followed.
+
+    Example:
+        pool = SentinelPool("mymaster", [("10.0.0.1", 26379), ("10.0.0.2", 26379)])
+        client = RedisClient(connection_pool=pool)
+        await nursery.start(pool.run)
+    """
+
+    def __init__(
+        self,
+        service_name: str,
+        sentinels: t.Iterable[Address] = (("127.0.0.1", 26379),),
+        *,
+        sentinel_timeout: float = 1,
+        **pool_args,
+    ):
+        """Initialize the SentinelPool.
+
+        Arguments:
+            service_name (str): The name the master is monitored under.
+            sentinels (list): (host, port) addresses of the sentinels
+                (default: [("127.0.0.1", 26379)]).
+            sentinel_timeout (float): Seconds to wait for a sentinel to answer
+                before trying the next one (default: 1).
+            **pool_args: Any other arg accepted by :class:`ConnectionPool`.
+        """
+        super().__init__(None, None, **pool_args)
+        self.service_name = service_name
+        self.sentinels = list(sentinels)
+        self.sentinel_timeout = sentinel_timeout
+        self.failovers = 0
+        self._discover_lock = trio.Lock()
+
+    async def discover(self) -> Address:
+        """Ask the sentinels, in order, for the address of the master.
+
+        Returns:
+            The (host, port) of the master.
+
+        Raises:
+            ConnectionError: No sentinel knew the address of the master.
+        """
+        command = (b"SENTINEL", b"get-master-addr-by-name", self.service_name.encode())
+        for address in list(self.sentinels):
+            try:
+                with trio.fail_after(self.sentinel_timeout):
+                    async with await self._open_sentinel(*address) as connection:
+                        await connection.send_all(protocol.write_command(*command))
+                        reply = await _receive(connection)
+            except (OSError, trio.BrokenResourceError, trio.TooSlowError):
+                continue
+            # An unknown name is a null under RESP3, and an empty list under RESP2.
+            if not isinstance(reply, list) or len(reply) != 2:
+                continue
+            self.sentinels.remove(address)
+            self.sentinels.insert(0, address)
+            return reply[0].decode(), int(reply[1])
+        raise ConnectionError(
+            f"None of {self.sentinels} knew the master of {self.service_name!r}"
+        )
+
+    async def run(self, *, task_status=trio.TASK_STATUS_IGNORED) -> None:
+        """Follow failovers, and keep *min_idle* connections to the master open.
+
+        Arguments:
+            task_status: Used by :meth:`trio.Nursery.start`.
+
+        Example:
+            await nursery.start(pool.run)
+        """
+        async with trio.open_nursery() as nursery:
+            await nursery.start(self._watch)
+            await nursery.start(super().run)
+            task_status.started()
+
+    async def _spawn(self) -> Connection:
+        """Spawn a connection to the master, asking the sentinels for it first."""
+        ready = False
+        try:
+            async with self._discover_lock:
+                if self.host is None:
+                    self.host, self.port = await self.discover()
+            ready = True
+        finally:
+            if not ready:
+                self.connecting -= 1
+                self._offer_slot()
+        return await super()._spawn()
+
+    async def _open_sentinel(self, host: str, port: int) -> Connection:
+        """Open a connection to a sentinel, without running *on_connect*.
+
+        Only the pool reads the sentinels' replies, so they are parsed with
+        Resp3Reader rather than the *Reader* of the master's connections.
+
+        Args:
+            host (str): The address of the sentinel.
+            port (int): The port of the sentinel.
+
+        Returns:
+            The connection.
+        """
+        stream = await self.spawn_connection(host, port)
+        return Connection(stream, protocol.Resp3Reader())
+
+    async def _watch(self, *, task_status=trio.TASK_STATUS_IGNORED) -> None:
+        """Stay subscribed to +switch-master, resetting the pool on failovers.
+
+        Args:
+            task_status: Used by :meth:`trio.Nursery.start`.
+
+        Raises:
+            ConnectionError: No sentinel could be subscribed to the first time.
+        """
+        started = False
+        while True:
+            for address in list(self.sentinels):
+                try:
+                    with trio.fail_after(self.sentinel_timeout):
+                        connection = await self._open_sentinel(*address)
+                except (OSError, trio.TooSlowError):
+                    continue
+
+                async with connection:
+                    try:
+                        with trio.fail_after(self.sentinel_timeout):
+                            await connection.send_all(
+                                protocol.write_command(b"HELLO", b"3")
+                                + protocol.write_command(b"SUBSCRIBE", SWITCH_MASTER)
+                            )
+                            await _receive(connection)
+                            await _receive(connection)
+                        # A failover may have happened while we weren't subscribed.
+                        host, port = await self.discover()
+                        if (host, port) != (self.host, self.port):
+                            await self._switch(host, port)
+                        if not started:
+                            started = True
+                            task_status.started()
+                        await self._read_switches(connection)
+                    except (OSError, trio.BrokenResourceError, trio.TooSlowError):
+                        pass
+
+            if not started:
+                raise ConnectionError(f"Could not subscribe to any of {self.sentinels}")
+            await trio.sleep(RECONNECT_DELAY)
+
+    async def _read_switches(self, connection: Connection) -> None:
+        """Reset the pool whenever a +switch-master message names our master."""
+        while True:
+            push = await _receive(connection)
+            if not isinstance(push, protocol.RespPush) or push.push_type != b"message":
+                continue
+            # <name> <old host> <old port> <new host> <new port>
+            name, _, _, host, port = bytes(push.data[1]).split()
+            if name.decode() == self.service_name:
+                await self._switch(host.decode(), int(port))
+
+    async def _switch(self, host: str, port: int) -> None:
+        """Point the pool at a new master."""
+        if self.host is not None:
+            self.failovers += 1
+        await self.reset(host, port)
@@ -0,0 +1,187 @@
+"""The transaction module runs MULTI/EXEC transactions on a pinned connection.
+
+Classes:
+    WatchError
+    Transaction
+
+Functions:
+    run_transaction - run a transaction, retrying it while watched keys change
+"""
+import typing as t
+
+import trio
+
+from .pipeline import Pipeline
+from .readers import parse_raw
+
+
+class WatchError(Exception):
+    """A transaction was aborted by WATCH more times than it was allowed to be."""
+
+
+class Transaction(Pipeline):
+    """Transaction queues commands and sends them wrapped in MULTI and EXEC.
+
+    The whole transaction, MULTI and EXEC included, is written with a single
+    *send_all*, like a :class:`Pipeline`. Inside *async with*, the transaction
+    keeps one connection checked out of the pool, so keys can be watched and
+    read with :meth:`call` before the commands are queued. Nothing else is sent
+    on that connection in the meantime.
+
+    Attributes:
+        client (RedisClient): The client whose connection pool and protocol are used.
+        commands (list): The queued commands, as (command, args) tuples.
+        connection (Connection): The pinned connection, or None outside *async with*.
+        watching (bool): Whether keys are being watched.
+
+    Example:
+        async with Transaction(client) as transaction:
+            await transaction.watch(b"balance")
+            balance = int(await transaction.call(b"GET", b"balance"))
+            transaction.queue(b"SET", b"balance", b"%d" % (balance - 10))
+            await transaction.execute() -> [b"OK"], or None if balance changed
+    """
+
+    def __init__(self, client):
+        """Initialize the Transaction.
+
+        Arguments:
+            client (RedisClient): The client to send the commands with.
+        """
+        super().__init__(client)
+        self.connection = None
+        self.watching = False
+        self._drained = True
+
+    async def __aenter__(self) -> "Transaction":
+        """Check a connection out of the pool and pin it to the transaction."""
+        self.connection = await self.client.connection_pool.wait_for_connection()
+        self._drained = True
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        """Unwatch any keys and return the connection, or close it if not drained."""
+        pool = self.client.connection_pool
+        connection = self.connection
+        self.commands = []
+        try:
+            if self._drained and self.watching:
+                await self.unwatch()
+        finally:
+            self.connection = None
+            await pool.release(connection, self._drained)
+
+    async def call(self, command: bytes, *args: bytes):
+        """Send a command on the pinned connection right away and return the reply.
+
+        Args:
+            command (bytes): The command to send, such as b"GET".
+            *args (bytes): The args to send with the command.
+
+        Returns:
+            The response from Redis, as parsed by the Reader class.
+        """
+        return (await self._run([(command, args)]))[0]
+
+    async def watch(self, *keys: bytes) -> None:
+        """WATCH keys, so that :meth:`execute` aborts if any of them change.
+
+        Args:
+            *keys (bytes): The keys to watch.
+        """
+        await self.call(b"WATCH", *keys)
+        self.watching = True
+
+    async def unwatch(self) -> None:
+        """Stop watching every watched key."""
+        await self.call(b"UNWATCH")
+        self.watching = False
+
+    async def execute(self) -> t.Optional[list]:
+        """Send MULTI, every queued command and EXEC in one write.
+
+        Outside *async with*, a connection is checked out of the pool just for
+        this call.
+
+        Returns:
+            A list containing one reply per queued command. None if a watched key
+                changed, so nothing was executed. The error returned by Redis if
+                it refused to queue one of the commands.
+        """
+        commands, self.commands = self.commands, []
+        if self.connection is None:
+            async with self:
+                self.commands = commands
+                return await self.execute()
+
+        if not commands:
+            if self.watching:
+                await self.unwatch()
+            return []
+        replies = await self._run([(b"MULTI", ()), *commands, (b"EXEC", ())])
+        self.watching = False
+        reply = replies[-1]
+        # RawReader leaves the reply as a frame, which says nothing until parsed.
+        parsed = parse_raw(reply)
+        if parsed is None:
+            return None
+        if isinstance(parsed, list) and len(parsed) != len(commands):
+            # Under RESP2, the nil reply is parsed as an empty list.
+            return None
+        return reply
+
+    async def _run(self, commands) -> list:
+        """Send commands on the pinned connection, tracking whether it drained."""
+        if self.connection is None:
+            raise trio.ClosedResourceError("The transaction is not in async with")
+        self._drained = False
+        replies = await self._send(self.connection, commands)
+        self._drained = True
+        return replies
+
+
+async def run_transaction(
+    client,
+    body: t.Callable[[Transaction], t.Awaitable[t.Any]],
+    *keys: bytes,
+    max_attempts: t.Optional[int] = 10,
+) -> list:
+    """Run a transaction, starting over whenever a watched key changes.
+
+    *keys* are watched, then *body* is called with the transaction to read them
+    with :meth:`Transaction.call` and queue commands with
+    :meth:`Transaction.queue`. The queued commands are then executed. If a
+    watched key changed in the meantime, EXEC returns nil, and the whole thing is
+    retried with a fresh transaction.
+
+    Args:
+        client (RedisClient): The client to run the transaction with.
+        body: An async function that takes the transaction and queues commands.
+        *keys (bytes): The keys to watch.
+        max_attempts (int): How many times to try before giving up, or None to
+            keep trying (default: 10).
+
+    Returns:
+        The replies to the queued commands.
+
+    Raises:
+        WatchError: A watched key changed on every attempt.
+
+    Example:
+        async def withdraw(transaction):
+            balance = int(await transaction.call(b"GET", b"balance"))
+            transaction.queue(b"SET", b"balance", b"%d" % (balance - 10))
+
+        await run_transaction(client, withdraw, b"balance")
+    """
+    attempt = 0
+    while max_attempts is None or attempt < max_attempts:
+        attempt += 1
+        async with Transaction(client) as transaction:
+            if keys:
+                await transaction.watch(*keys)
+            await body(transaction)
+            replies = await transaction.execute()
+        if replies is not None:
+            return replies
+    raise WatchError(f"Watched keys changed on all {max_attempts} attempts")
@@ -6,10 +6,30 @@ In particular, this means:
 
 2. Where possible, arguments supplied to a command will be converted
    automatically from their type to the bytes that Redis expects to receive.
+   str, int and float arguments are encoded, and bytes-like arguments are sent
+   without being copied.
 
-3. HELLO 3 is called automatically.
+3. HELLO 3 is sent on every new connection, in the same write as AUTH, SELECT
+   and the script preloads.
 
 4. Some return types are changed, where it makes sense. For example, INCRBYFLOAT
    returns a float instead of the bytes that Redis returns.
+
+5. Reads can be served from a local cache kept fresh by Redis, using
+   :class:`ClientSideCache`.
+
+6. Lua scripts and function libraries are run by name, and reloaded when Redis
+   has lost them, using :class:`Script` and :class:`Library`.
+
+7. Keys, hashes, sets and sorted sets can be iterated over a page at a time
+   with the scan_iter methods, which size their pages with :class:`Scanner`.
+
+8. Commands sent often can be prepared once with :meth:`MidlevelClient.prepare`,
+   which returns a :class:`Prepared` called with named arguments.
 """
+from .cache import ClientSideCache
 from .client import MidlevelClient
+from .prepared import Prepared
+from .scanning import Scanner
+from .scripting import Library
+from .scripting import Script
@@ -0,0 +1,430 @@
+"""The cache module serves repeated reads from memory, kept fresh by Redis.
+
+Redis 6 can track the keys a client has read and push an *invalidate* message
+when one of them changes (https://redis.io/topics/client-side-caching). This
+module uses that to keep a bounded local copy of recent replies.
+
+Classes:
+    LocalCache
+    ClientSideCache
+"""
+from collections import OrderedDict
+import copy
+import typing as t
+import weakref
+
+from respy3 import protocol
+import trio
+
+from redtrio.lowlevel.readers import parse_raw
+
+RECONNECT_DELAY = 1
+MODES = ("default", "bcast", "optin")
+
+
+def _copy(reply):
+    """Return a shallow copy of a reply, except for RawReader's read-only frames."""
+    return reply if isinstance(reply, memoryview) else copy.copy(reply)
+
+
+class LocalCache:
+    """LocalCache is a bounded LRU store of replies, indexed by the key they read.
+
+    Each entry is identified by the full command, such as (b"HGET", b"key",
+    b"field"), so that every entry read from a key can be dropped at once when
+    that key is invalidated. Replies are copied on the way in and out, so callers
+    can't change what is cached.
+
+    Attributes:
+        max_size (int): The maximum number of entries to keep.
+        ttl (float): Seconds an entry stays valid, or None to keep it until it is
+            invalidated or evicted.
+        entries (OrderedDict): Maps each command to its (reply, expiry) pair, least
+            recently used first.
+        keys (dict): Maps each Redis key to the commands cached for it.
+        hits (int): How many lookups found a valid entry.
+        misses (int): How many lookups found nothing, or an expired entry.
+        evictions (int): How many entries were dropped to stay under *max_size*.
+        invalidations (int): How many entries were dropped because Redis said
+            their key changed.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: t.Optional[float] = None):
+        """Initialize the LocalCache.
+
+        Arguments:
+            max_size (int): The maximum number of entries (default: 10,000).
+            ttl (float): Seconds before an entry expires (default: None, never).
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: t.OrderedDict[tuple, t.Tuple[t.Any, float]] = OrderedDict()
+        self.keys: t.Dict[bytes, t.Set[tuple]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        """Return the number of cached entries."""
+        return len(self.entries)
+
+    def get(self, command: tuple) -> t.Tuple[bool, t.Any]:
+        """Look up the cached reply to a command.
+
+        Arguments:
+            command (tuple): The command and its args, with the key first.
+
+        Returns:
+            A (found, reply) pair. The reply is None when nothing was found.
+        """
+        entry = self.entries.get(command)
+        if entry is None or entry[1] <= trio.current_time():
+            if entry is not None:
+                self._remove(command)
+            self.misses += 1
+            return False, None
+
+        self.entries.move_to_end(command)
+        self.hits += 1
+        return True, _copy(entry[0])
+
+    def set(self, command: tuple, reply) -> None:
+        """Cache the reply to a command, evicting the least recently used entries.
+
+        Arguments:
+            command (tuple): The command and its args, with the key first.
+            reply: The reply from Redis.
+        """
+        expiry = float("inf") if self.ttl is None else trio.current_time() + self.ttl
+        self.entries[command] = (_copy(reply), expiry)
+        self.entries.move_to_end(command)
+        self.keys.setdefault(command[1], set()).add(command)
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate(self, key: bytes) -> None:
+        """Drop every entry read from a key.
+
+        Arguments:
+            key (bytes): The Redis key that changed.
+        """
+        for command in self.keys.pop(key, ()):
+            del self.entries[command]
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.keys.clear()
+
+    def _remove(self, command: tuple) -> None:
+        """Drop a single entry."""
+        del self.entries[command]
+        commands = self.keys[command[1]]
+        commands.discard(command)
+        if not commands:
+            del self.keys[command[1]]
+
+
+class ClientSideCache:
+    """ClientSideCache serves a MidlevelClient's reads from a :class:`LocalCache`.
+
+    While it is running, read commands sent through the client's methods, such as
+    :meth:`MidlevelClient.get` and :meth:`MidlevelClient.hgetall`, are answered
+    from memory when possible. A dedicated tracking connection receives Redis'
+    invalidation pushes, and every connection used for a cached read is told to
+    redirect its invalidations there with CLIENT TRACKING ... REDIRECT.
+
+    There are three tracking modes:
+
+    * "default": Redis remembers every key each connection has read, and only
+      sends invalidations for those.
+    * "bcast": The tracking connection subscribes to every key starting with one
+      of *prefixes* (or every key, if there are none), so the other connections
+      need no setup and Redis keeps no per-key tracking table. Only keys
+      matching a prefix are cached.
+    * "optin": Like "default", but Redis only tracks reads preceded by CLIENT
+      CACHING yes, which is only sent for *commands*.
+
+    If the tracking connection breaks, the whole cache is flushed and reads go
+    straight to Redis until it has reconnected.
+
+    Attributes:
+        client (MidlevelClient): The client whose reads are cached.
+        local (LocalCache): The cached replies.
+        mode (str): The tracking mode: "default", "bcast" or "optin".
+        prefixes (list): The key prefixes tracked in "bcast" mode.
+        commands (set): The read commands that are cached, or None for all of them.
+        client_id (int): The ID of the tracking connection, or None while it is
+            not connected.
+
+    Example:
+        async with ClientSideCache(client, max_size=1000, ttl=60) as cache:
+            await client.get("key")  # Read from Redis
+            await client.get("key")  # Read from the cache
+            print(cache.stats)
+    """
+
+    def __init__(
+        self,
+        client,
+        max_size: int = 10_000,
+        ttl: t.Optional[float] = None,
+        *,
+        mode: str = "default",
+        prefixes: t.Iterable[bytes] = (),
+        commands: t.Optional[t.Iterable[bytes]] = None,
+    ):
+        """Initialize the ClientSideCache.
+
+        Arguments:
+            client (MidlevelClient): The client to cache reads for.
+            max_size (int): The maximum number of cached replies (default: 10,000).
+            ttl (float): Seconds before a cached reply expires (default: None).
+            mode (str): "default", "bcast" or "optin" (default: "default").
+            prefixes (bytes): Key prefixes to track in "bcast" mode (default: all
+                keys).
+            commands (bytes): The read commands to cache, such as b"HGETALL"
+                (default: None, all of them).
+
+        Raises:
+            ValueError: An unknown mode was given, or prefixes outside "bcast" mode.
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+        if prefixes and mode != "bcast":
+            raise ValueError("prefixes can only be used in 'bcast' mode")
+
+        self.client = client
+        self.local = LocalCache(max_size, ttl)
+        self.mode = mode
+        self.prefixes = list(prefixes)
+        self.commands = None if commands is None else set(commands)
+        self.client_id: t.Optional[int] = None
+        self._tracked: weakref.WeakSet = weakref.WeakSet()
+        self._in_flight: t.Dict[bytes, t.Set[object]] = {}
+        self._nursery_manager = trio.open_nursery()
+        self._nursery: t.Optional[trio.Nursery] = None
+
+    @property
+    def stats(self) -> dict:
+        """The size of the cache and its hit, miss and eviction counters."""
+        return {
+            "size": len(self.local),
+            "hits": self.local.hits,
+            "misses": self.local.misses,
+            "evictions": self.local.evictions,
+            "invalidations": self.local.invalidations,
+        }
+
+    async def __aenter__(self) -> "ClientSideCache":
+        """Connect the tracking connection and start caching the client's reads."""
+        lowlevel = self.client.client
+        lowlevel.register_push_callback(b"invalidate", self._on_invalidate)
+        lowlevel.register_push_callback(b"tracking-redir-broken", self._on_broken)
+        self._nursery = await self._nursery_manager.__aenter__()
+        try:
+            await self._nursery.start(self._run_tracking)
+        except BaseException as error:
+            self._nursery.cancel_scope.cancel()
+            await self._nursery_manager.__aexit__(type(error), error, None)
+            self._unregister()
+            raise
+        self.client.cache = self
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Stop caching and close the tracking connection."""
+        self.client.cache = None
+        self._unregister()
+        self._nursery.cancel_scope.cancel()
+        return await self._nursery_manager.__aexit__(*exc_info)
+
+    def _unregister(self) -> None:
+        """Remove the push callbacks registered by :meth:`__aenter__`."""
+        lowlevel = self.client.client
+        lowlevel.unregister_push_callback(b"invalidate", self._on_invalidate)
+        lowlevel.unregister_push_callback(b"tracking-redir-broken", self._on_broken)
+
+    def flush(self) -> None:
+        """Drop every cached reply, including reads that are still in flight."""
+        self.local.clear()
+        self._in_flight.clear()
+
+    def invalidate(self, key: bytes) -> None:
+        """Drop every cached reply read from a key.
+
+        Arguments:
+            key (bytes): The Redis key that changed.
+        """
+        self.local.invalidate(key)
+        self._in_flight.pop(key, None)
+
+    def _on_invalidate(self, push: protocol.RespPush) -> None:
+        """Handle an invalidate push. A null key list means everything changed."""
+        keys = push.data[0] if push.data else None
+        if keys is None:
+            self.flush()
+            return
+        for key in keys:
+            self.invalidate(key)
+
+    def _on_broken(self, push: protocol.RespPush) -> None:
+        """Flush everything when Redis can no longer deliver invalidations."""
+        self.flush()
+
+    def caches(self, command: bytes, key: bytes) -> bool:
+        """Return whether a read of this key with this command would be cached.
+
+        Arguments:
+            command (bytes): The read command, such as b"GET".
+            key (bytes): The key that is read.
+
+        Returns:
+            False while the tracking connection is down, if *command* is not one
+                of *commands*, or if *key* matches none of *prefixes* in "bcast"
+                mode. True otherwise.
+        """
+        return (
+            self.client_id is not None
+            and (self.commands is None or command in self.commands)
+            and (
+                self.mode != "bcast"
+                or not self.prefixes
+                or key.startswith(tuple(self.prefixes))
+            )
+        )
+
+    def _setup_commands(self, client_id: int) -> t.List[t.Tuple[bytes, ...]]:
+        """Return the commands that make a connection send invalidations to us."""
+        commands = [(b"HELLO", b"3")]
+        if self.mode != "bcast":
+            tracking = (b"CLIENT", b"TRACKING", b"ON", b"REDIRECT", b"%d" % client_id)
+            if self.mode == "optin":
+                tracking += (b"OPTIN",)
+            commands.append(tracking)
+        return commands
+
+    async def call(self, command: bytes, key: bytes, *args: bytes):
+        """Return the reply to a read command, from the cache if possible.
+
+        It is not recommended to call this directly. Use the client's methods
+        while the cache is running, instead. Check :meth:`caches` first; reads
+        that would not be cached should be sent normally.
+
+        Args:
+            command (bytes): The read command, such as b"GET".
+            key (bytes): The key that is read.
+            *args (bytes): Any other args sent with the command.
+
+        Returns:
+            The reply from the cache, or from Redis.
+        """
+        # Cache entries are looked up by the whole command, so bytes-like args
+        # such as bytearrays are copied into bytes to be hashable.
+        entry = (command, bytes(key), *[bytes(arg) for arg in args])
+        found, reply = self.local.get(entry)
+        if found:
+            return reply
+
+        lowlevel = self.client.client
+        pool = lowlevel.connection_pool
+        client_id = self.client_id
+        if client_id is None:
+            return await lowlevel.call(command, key, *args)
+
+        # Invalidations can arrive on the tracking connection before our reply;
+        # if one does, the marker is dropped and the reply is not cached.
+        marker = object()
+        try:
+            self._in_flight.setdefault(key, set()).add(marker)
+            async with pool.checkout() as connection:
+                commands = []
+                if connection not in self._tracked:
+                    commands.extend(self._setup_commands(client_id))
+                if self.mode == "optin":
+                    commands.append((b"CLIENT", b"CACHING", b"yes"))
+                commands.append(entry)
+
+                await connection.send_all(
+                    b"".join(lowlevel.write_command(*queued) for queued in commands)
+                )
+                replies = [await lowlevel.receive(connection) for _ in commands]
+        finally:
+            markers = self._in_flight.get(key, set())
+            valid = marker in markers
+            markers.discard(marker)
+            if not markers:
+                self._in_flight.pop(key, None)
+
+        *setup_replies, reply = replies
+        tracked = not any(isinstance(r, protocol.RedisError) for r in setup_replies)
+        if tracked and client_id == self.client_id:
+            self._tracked.add(connection)
+            if valid and not isinstance(reply, protocol.RedisError):
+                self.local.set(entry, reply)
+        return reply
+
+    async def _run_tracking(self, *, task_status=trio.TASK_STATUS_IGNORED) -> None:
+        """Keep the tracking connection open, reading invalidation pushes from it.
+
+        The cache is flushed every time the connection is lost, since any
+        invalidations sent in the meantime are gone, and a new connection is
+        opened after *RECONNECT_DELAY* seconds.
+
+        Args:
+            task_status: Used by :meth:`trio.Nursery.start`.
+
+        Raises:
+            OSError: The tracking connection could not be set up the first time.
+            trio.BrokenResourceError: Redis closed the connection during setup.
+            reply: Redis refused to enable tracking the first time.
+        """
+        lowlevel = self.client.client
+        pool = lowlevel.connection_pool
+        started = False
+        while True:
+            try:
+                connection = await pool.wait_for_connection()
+            except OSError:
+                if not started:
+                    raise
+                await trio.sleep(RECONNECT_DELAY)
+                continue
+
+            try:
+                commands = [(b"HELLO", b"3"), (b"CLIENT", b"ID")]
+                if self.mode == "bcast":
+                    tracking = [b"CLIENT", b"TRACKING", b"ON", b"BCAST"]
+                    for prefix in self.prefixes:
+                        tracking.extend([b"PREFIX", prefix])
+                    commands.append(tuple(tracking))
+                await connection.send_all(
+                    b"".join(lowlevel.write_command(*queued) for queued in commands)
+                )
+                replies = [await lowlevel.receive(connection) for _ in commands]
+                reply = next(
+                    (r for r in replies if isinstance(r, protocol.RedisError)), None
+                )
+                if reply is not None and not started:
+                    raise reply
+                if reply is None:
+                    self._tracked = weakref.WeakSet()
+                    self.client_id = parse_raw(replies[1])
+                    if not started:
+                        started = True
+                        task_status.started()
+                    # Nothing else is sent, so only pushes should arrive here.
+                    await lowlevel.receive(connection)
+            except (OSError, trio.BrokenResourceError):
+                # Once started, keep trying; reads bypass the cache meanwhile.
+                if not started:
+                    raise
+            finally:
+                self.client_id = None
+                self.flush()
+                await pool.release(connection, False)
+            await trio.sleep(RECONNECT_DELAY)
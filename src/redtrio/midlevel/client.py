@@ -2,40 +2,296 @@
 
 All commands are divided by comments into sections based on https://redis.io/commands
 """
+import itertools
 import typing as t
 
+from respy3 import protocol
+import trio
+
 from redtrio.lowlevel import RedisClient
+from redtrio.lowlevel import run_transaction
+from redtrio.lowlevel import Transaction
+from redtrio.lowlevel.encoding import Arg
+from redtrio.lowlevel.encoding import encode_arg
+from .cache import ClientSideCache
+from .prepared import Prepared
+from .scanning import Scanner
+from .scanning import TARGET_LATENCY
+from .scripting import Library
+from .scripting import Script
+
+BULK_CHUNK_SIZE = 1000
+BULK_CONCURRENCY = 4
+
+Pairs = t.Union[t.Mapping[Arg, Arg], t.Iterable[t.Tuple[Arg, Arg]]]
 
 
 class MidlevelClient:
     """MidlevelClient is an abstraction on top of the lowlevel client.
 
     Args:
-        **client_args: any arg accepted by :class:`lowlevel.RedisClient`.
+        client: a lowlevel client to use instead of creating one, such as a
+            :class:`cluster.ClusterClient`.
+        **client_args: any arg accepted by :class:`lowlevel.RedisClient`. The
+            created client's pool sends HELLO 3 on every new connection, unless
+            another *protocol* is given. So does a *connection_pool* without a
+            *protocol* of its own.
+
+    Attributes:
+        client (RedisClient): The lowlevel client used to talk to Redis.
+        cache (ClientSideCache): While a :class:`ClientSideCache` is running, read
+            commands are sent through it.
+        scripts (dict): The registered :class:`Script` objects, by SHA1.
+        libraries (dict): The registered :class:`Library` objects, by name.
     """
 
-    def __init__(self, **client_args):
-        """Initialize MidlevelClient."""
-        self.client = RedisClient(**client_args)
-        self.said_hello = False
+    def __init__(self, *, client=None, **client_args):
+        """Initialize MidlevelClient.
 
-    async def call(self, command: str, *args: str):
+        Arguments:
+            client: A lowlevel client to use, such as a :class:`ClusterClient`.
+                Its connection pools should be created with protocol=3.
+                Leave as None to create a :class:`RedisClient` from *client_args*.
+            **client_args: Any arg accepted by :class:`lowlevel.RedisClient`.
+        """
+        if client is None:
+            pool = client_args.get("connection_pool")
+            if pool is None:
+                client_args.setdefault("protocol", 3)
+            elif pool.protocol is None:
+                pool.protocol = 3
+            client = RedisClient(**client_args)
+        self.client = client
+        self.cache = None
+        self.scripts: t.Dict[str, Script] = {}
+        self.libraries: t.Dict[str, Library] = {}
+
+    async def call(self, command: str, *args: Arg):
         """Send a command to Redis and return the response.
 
-        Strings passed to this function will be converted to bytes.
+        Arguments are converted to bytes with :func:`encoding.encode_arg`, so
+        they may be str, int, float, or bytes-like objects, which are sent as
+        they are.
 
         Args:
             command (str): The command to be sent, like "HELLO".
-            *args (str): Arguments to be sent with the command.
+            *args (Arg): Arguments to be sent with the command.
 
         Returns:
             The response from Redis.
         """
-        if not self.said_hello:
-            self.said_hello = True
-            await self.hello(3)
-        encoded_args = [s.encode() for s in args]
-        return await self.client.call(command.encode(), *encoded_args)
+        return await self.client.call(
+            encode_arg(command), *[encode_arg(arg) for arg in args]
+        )
+
+    async def read(self, command: str, key: Arg, *args: Arg):
+        """Send a read-only command about a single key and return the response.
+
+        While a :class:`ClientSideCache` is running, the response may come from
+        the cache. Otherwise, this is the same as :meth:`call`.
+
+        Args:
+            command (str): The read-only command to be sent, like "GET".
+            key (Arg): The key the command reads.
+            *args (Arg): Other arguments to be sent with the command.
+
+        Returns:
+            The response from Redis, or from the cache.
+        """
+        if self.cache is None:
+            return await self.call(command, key, *args)
+        # Cached replies are stored by key, so it must be hashable.
+        encoded_command, encoded_key = command.encode(), bytes(encode_arg(key))
+        if not self.cache.caches(encoded_command, encoded_key):
+            return await self.call(command, key, *args)
+        encoded_args = [encode_arg(arg) for arg in args]
+        return await self.cache.call(encoded_command, encoded_key, *encoded_args)
+
+    def client_side_cache(
+        self,
+        max_size: int = 10_000,
+        ttl: t.Optional[float] = None,
+        *,
+        mode: str = "default",
+        prefixes: t.Iterable[str] = (),
+        commands: t.Optional[t.Iterable[str]] = None,
+    ) -> ClientSideCache:
+        """Create a :class:`ClientSideCache` for this client's reads.
+
+        The cache only starts serving reads once it is entered with *async with*.
+
+        Args:
+            max_size (int): The maximum number of cached replies (default: 10,000).
+            ttl (float): Seconds before a cached reply expires (default: None).
+            mode (str): "default", "bcast" or "optin" (default: "default").
+            prefixes (str): Key prefixes to track in "bcast" mode (default: all).
+            commands (str): The read commands to cache, like "HGETALL"
+                (default: None, all of them).
+
+        Returns:
+            The ClientSideCache.
+
+        Example:
+            async with client.client_side_cache(mode="bcast", prefixes=["user:"]):
+                await client.hgetall("user:1")
+        """
+        return ClientSideCache(
+            self,
+            max_size,
+            ttl,
+            mode=mode,
+            prefixes=[prefix.encode() for prefix in prefixes],
+            commands=None if commands is None else [c.encode() for c in commands],
+        )
+
+    async def transaction(
+        self,
+        body: t.Callable[[Transaction], t.Awaitable[t.Any]],
+        *keys: Arg,
+        max_attempts: t.Optional[int] = 10,
+    ) -> list:
+        """Run a MULTI/EXEC transaction, starting over whenever a watched key changes.
+
+        *body* is called with a lowlevel :class:`Transaction`, whose commands take
+        bytes. See :func:`lowlevel.run_transaction`. Transactions need a lowlevel
+        client with a connection pool, such as :class:`RedisClient`.
+
+        Args:
+            body: An async function that takes the transaction and queues commands.
+            *keys (Arg): The keys to watch.
+            max_attempts (int): How many times to try before raising WatchError, or
+                None to keep trying (default: 10).
+
+        Returns:
+            The replies to the queued commands.
+
+        Example:
+            async def increment(transaction):
+                value = int(await transaction.call(b"GET", b"counter") or 0)
+                transaction.queue(b"SET", b"counter", b"%d" % (value + 1))
+
+            await client.transaction(increment, "counter")
+        """
+        self._require_pool("transaction")
+        return await run_transaction(
+            self.client,
+            body,
+            *[encode_arg(key) for key in keys],
+            max_attempts=max_attempts,
+        )
+
+    def register_script(self, source: str) -> Script:
+        """Register a Lua script, to be run with EVALSHA.
+
+        Registered scripts are loaded on every new connection the pool opens, so
+        they are already cached when Redis restarts or fails over. Lowlevel
+        clients without a pool, such as :class:`ClusterClient`, load each script
+        on the node that first replies NOSCRIPT instead.
+
+        Args:
+            source (str): The Lua source of the script.
+
+        Returns:
+            The Script, which is called to run it.
+        """
+        script = Script(self, source)
+        self.scripts.setdefault(script.sha, script)
+        self._install_preload()
+        return self.scripts[script.sha]
+
+    def register_library(self, code: str) -> Library:
+        """Register a function library, to be called with FCALL.
+
+        Libraries are not loaded with the handshake like scripts, since FUNCTION
+        LOAD REPLACE rebuilds the library on every call. Instead, a library is
+        loaded the first time Redis replies that one of its functions doesn't
+        exist, which also covers restarts and failovers.
+
+        Args:
+            code (str): The source of the library, starting with a shebang such
+                as "#!lua name=mylib".
+
+        Returns:
+            The Library.
+        """
+        library = Library(self, code)
+        self.libraries[library.name] = library
+        return library
+
+    def prepare(self, command: str, *params: str) -> Prepared:
+        """Prepare a command sent often, encoding its name and header only once.
+
+        Args:
+            command (str): The command, such as "HGET".
+            *params (str): The name of each argument, in the order Redis
+                expects them.
+
+        Returns:
+            The Prepared, which is called with the arguments to send the command.
+
+        Example:
+            hget = client.prepare("HGET", "key", "field")
+            await hget(key="user:1", field="name") -> b"Alice"
+        """
+        return Prepared(self, command, *params)
+
+    def _install_preload(self) -> None:
+        """Make the connection pool, if there is one, send the preloads."""
+        if not hasattr(self.client, "connection_pool"):
+            return
+        hooks = self.client.connection_pool.handshake_hooks
+        if self._preload_commands not in hooks:
+            hooks.append(self._preload_commands)
+
+    def _preload_commands(self) -> t.List[t.Tuple[bytes, ...]]:
+        """Return the commands that load every registered script."""
+        return [script.load_command() for script in self.scripts.values()]
+
+    def _require_pool(self, feature: str) -> None:
+        """Check that the lowlevel client has the connection pool *feature* needs.
+
+        Args:
+            feature (str): What needs the pool, for the error message.
+
+        Raises:
+            TypeError: The lowlevel client has no connection pool.
+        """
+        if not hasattr(self.client, "connection_pool"):
+            raise TypeError(
+                f"{feature} needs a lowlevel client with a connection pool, such "
+                f"as RedisClient, not {type(self.client).__name__}"
+            )
+
+    async def _bulk(
+        self, commands: t.Iterable[t.List[Arg]], concurrency: int
+    ) -> t.List[t.Any]:
+        """Send commands with at most *concurrency* of them in flight at once.
+
+        Each command is sent with :meth:`call`, so it is given its own pooled
+        connection. *commands* is only consumed as fast as they are sent.
+
+        Args:
+            commands (list): The commands, as lists of a command and its args.
+            concurrency (int): How many commands may be in flight at once.
+
+        Returns:
+            The reply to each command, in order.
+        """
+        replies: t.List[t.Any] = []
+        slots = trio.Semaphore(concurrency)
+
+        async def send(index: int, command: t.List[Arg]) -> None:
+            try:
+                replies[index] = await self.call(*command)
+            finally:
+                slots.release()
+
+        async with trio.open_nursery() as nursery:
+            for index, command in enumerate(commands):
+                await slots.acquire()
+                replies.append(None)
+                nursery.start_soon(send, index, command)
+        return replies
 
     async def hello(self, protocol: int) -> dict:
         """Say hello to Redis and let it know what protocol we're using.
@@ -48,214 +304,498 @@ class MidlevelClient:
         Returns:
             A dict containing the response from Redis.
         """
-        return await self.call("HELLO", str(protocol))
+        return await self.call("HELLO", protocol)
+
+    ### Generic commands: https://redis.io/commands#generic ###
+    async def delete(self, key: Arg, *keys: Arg) -> int:
+        """Implement the DEL command (https://redis.io/commands/del)."""
+        return await self.call("DEL", key, *keys)
+
+    async def exists(self, key: Arg, *keys: Arg) -> int:
+        """Implement the EXISTS command (https://redis.io/commands/exists)."""
+        return await self.call("EXISTS", key, *keys)
+
+    def scan_iter(
+        self,
+        match: t.Optional[str] = None,
+        count: int = 10,
+        type: t.Optional[str] = None,
+        *,
+        target_latency: float = TARGET_LATENCY,
+        prefetch: bool = False,
+    ) -> t.AsyncIterator[bytes]:
+        """Iterate over the keys with SCAN (https://redis.io/commands/scan).
+
+        COUNT starts at *count*, and is adjusted after every page so that each
+        page takes about *target_latency* seconds. See :class:`Scanner`.
+
+        Args:
+            match (str): Only return keys matching this glob (default: all).
+            count (int): The COUNT of the first page (default: 10).
+            type (str): Only return keys of this type, like "hash" (default: all).
+            target_latency (float): Seconds a page should take (default: 5ms).
+            prefetch (bool): Request the next page while the current one is
+                being processed (default: False).
+
+        Returns:
+            An async iterator over the keys. A key may be returned more than once.
+
+        Example:
+            async for key in client.scan_iter("user:*", type="hash"):
+                print(key)
+        """
+        return Scanner(
+            self,
+            "SCAN",
+            match=match,
+            type=type,
+            count=count,
+            target_latency=target_latency,
+            prefetch=prefetch,
+        ).elements()
+
+    async def touch(self, key: Arg, *keys: Arg) -> int:
+        """Implement the TOUCH command (https://redis.io/commands/touch)."""
+        return await self.call("TOUCH", key, *keys)
+
+    async def unlink(self, key: Arg, *keys: Arg) -> int:
+        """Implement the UNLINK command (https://redis.io/commands/unlink)."""
+        return await self.call("UNLINK", key, *keys)
 
     ### Hash commands: https://redis.io/commands#hash ###
-    async def hdel(self, key: str, *fields: str) -> int:
+    async def hdel(self, key: Arg, *fields: Arg) -> int:
         """Implement the HDEL command (https://redis.io/commands/hdel)."""
         return await self.call("HDEL", key, *fields)
 
-    async def hexists(self, key: str, field: str) -> int:
+    async def hexists(self, key: Arg, field: Arg) -> int:
         """Implement the HEXISTS command (https://redis.io/commands/hexists)."""
-        return await self.call("HEXISTS", key, field)
+        return await self.read("HEXISTS", key, field)
 
-    async def hget(self, key: str, field: str) -> bytes:
+    async def hget(self, key: Arg, field: Arg) -> bytes:
         """Implement the HGET command (https://redis.io/commands/hget)."""
-        return await self.call("HGET", key, field)
+        return await self.read("HGET", key, field)
 
-    async def hgetall(self, key: str) -> dict:
+    async def hgetall(self, key: Arg) -> dict:
         """Implement the HGETALL command (https://redis.io/commands/hgetall)."""
-        return await self.call("HGETALL", key)
+        return await self.read("HGETALL", key)
 
-    async def hincrby(self, key: str, field: str, increment: int) -> int:
+    async def hincrby(self, key: Arg, field: Arg, increment: int) -> int:
         """Implement the HINCRBY command (https://redis.io/commands/hincrby)."""
-        return await self.call("HINCRBY", key, field, str(increment))
+        return await self.call("HINCRBY", key, field, increment)
 
-    async def hincrbyfloat(self, key: str, field: str, increment: float) -> float:
+    async def hincrbyfloat(self, key: Arg, field: Arg, increment: float) -> float:
         """Implement HINCRBYFLOAT command (https://redis.io/commands/hincrbyfloat).
 
         This command modifies the return response from `bytes` to `float`.
 
         Args:
-            key (str): the key to increment.
-            field (str): the field of the key to increment.
+            key (Arg): the key to increment.
+            field (Arg): the field of the key to increment.
             increment (float): the amount to increment the field.
 
         Returns:
             The new value of the field (float).
         """
-        return float(await self.call("HINCRBYFLOAT", key, field, str(increment)))
+        return float(await self.call("HINCRBYFLOAT", key, field, increment))
 
-    async def hkeys(self, key: str) -> list:
+    async def hkeys(self, key: Arg) -> list:
         """Implement the HKEYS command (https://redis.io/commands/hkeys)."""
-        return await self.call("HKEYS", key)
+        return await self.read("HKEYS", key)
 
-    async def hlen(self, key: str) -> int:
+    async def hlen(self, key: Arg) -> int:
         """Implement the HLEN command (https://redis.io/commands/hlen)."""
-        return await self.call("HLEN", key)
+        return await self.read("HLEN", key)
 
-    async def hmget(self, key: str, *fields: str) -> list:
+    async def hmget(self, key: Arg, *fields: Arg) -> list:
         """Implement the HMGET command (https://redis.io/commands/hmget)."""
-        return await self.call("HMGET", key, *fields)
+        return await self.read("HMGET", key, *fields)
 
-    async def hset(self, key: str, *args: str) -> str:
+    async def hmget_many(
+        self,
+        key: Arg,
+        fields: t.Iterable[Arg],
+        *,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        concurrency: int = BULK_CONCURRENCY,
+    ) -> list:
+        """HMGET any number of fields a chunk at a time, sending chunks concurrently.
+
+        Args:
+            key (Arg): The key of the hash.
+            fields (Arg): The fields to get.
+            chunk_size (int): The most fields in one HMGET (default: 1000).
+            concurrency (int): How many HMGETs may be in flight at once
+                (default: 4).
+
+        Returns:
+            The value of each field, or None for missing ones, in the order of
+                *fields*. The first error returned by Redis, if any.
+        """
+        commands = (
+            ["HMGET", key, *chunk] for chunk in _chunked(iter(fields), chunk_size)
+        )
+        return _concatenate(await self._bulk(commands, concurrency))
+
+    def hscan_iter(
+        self,
+        key: Arg,
+        match: t.Optional[str] = None,
+        count: int = 10,
+        *,
+        target_latency: float = TARGET_LATENCY,
+        prefetch: bool = False,
+    ) -> t.AsyncIterator[t.Tuple[bytes, bytes]]:
+        """Iterate over a hash with HSCAN (https://redis.io/commands/hscan).
+
+        Unlike :meth:`hgetall`, the hash is read a page at a time. See
+        :meth:`scan_iter` for the other args.
+
+        Args:
+            key (Arg): The key of the hash.
+            match (str): Only return fields matching this glob (default: all).
+            count (int): The COUNT of the first page (default: 10).
+            target_latency (float): Seconds a page should take (default: 5ms).
+            prefetch (bool): Request the next page while the current one is
+                being processed (default: False).
+
+        Returns:
+            An async iterator over the (field, value) pairs.
+        """
+        return Scanner(
+            self,
+            "HSCAN",
+            key,
+            match=match,
+            count=count,
+            target_latency=target_latency,
+            prefetch=prefetch,
+        ).elements()
+
+    async def hset(self, key: Arg, *args: Arg) -> str:
         """Implement the HSET command (https://redis.io/commands/hset)."""
         return await self.call("HSET", key, *args)
 
-    async def hsetnx(self, key: str, field: str, value: str) -> int:
+    async def hset_mapping(
+        self,
+        key: Arg,
+        mapping: Pairs,
+        *,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        concurrency: int = BULK_CONCURRENCY,
+    ) -> int:
+        """HSET the fields of a mapping a chunk at a time, sending chunks concurrently.
+
+        Unlike a single :meth:`hset`, the fields are not all set atomically, but
+        no one command blocks Redis for long.
+
+        Args:
+            key (Arg): The key of the hash.
+            mapping (Pairs): A dict, or an iterable of (field, value) pairs.
+            chunk_size (int): The most fields in one HSET (default: 1000).
+            concurrency (int): How many HSETs may be in flight at once
+                (default: 4).
+
+        Returns:
+            The number of fields that were added, or the first error returned
+                by Redis.
+
+        Example:
+            await client.hset_mapping("user:1", {"name": "Ada", "visits": 3})
+        """
+        commands = (
+            ["HSET", key, *itertools.chain.from_iterable(chunk)]
+            for chunk in _chunked(_pairs(mapping), chunk_size)
+        )
+        replies = await self._bulk(commands, concurrency)
+        return _first_error(replies) or sum(replies)
+
+    async def hsetnx(self, key: Arg, field: Arg, value: Arg) -> int:
         """Implement the HSETNX command (https://redis.io/commands/hsetnx)."""
         return await self.call("HSETNX", key, field, value)
 
-    async def hstrlen(self, key: str, field: str) -> int:
+    async def hstrlen(self, key: Arg, field: Arg) -> int:
         """Implement the HSTRLEN command (https://redis.io/commands/hstrlen)."""
-        return await self.call("HSTRLEN", key, field)
+        return await self.read("HSTRLEN", key, field)
 
-    async def hvals(self, key: str) -> list:
+    async def hvals(self, key: Arg) -> list:
         """Implement the HVALS command (https://redis.io/commands/hvals)."""
-        return await self.call("HVALS", key)
+        return await self.read("HVALS", key)
 
     ### Sets commands: https://redis.io/commands#set ###
-    async def sadd(self, key: str, *values: str) -> int:
+    async def sadd(self, key: Arg, *values: Arg) -> int:
         """Implement the SADD command (https://redis.io/commands/sadd)."""
         return await self.call("SADD", key, *values)
 
-    async def scard(self, key: str) -> int:
+    async def scard(self, key: Arg) -> int:
         """Implement the SCARD command (https://redis.io/commands/scard)."""
-        return await self.call("SCARD", key)
+        return await self.read("SCARD", key)
 
-    async def sdiff(self, key: str, *keys: str) -> set:
+    async def sdiff(self, key: Arg, *keys: Arg) -> set:
         """Implement the SDIFF command (https://redis.io/commands/sdiff)."""
         return await self.call("SDIFF", key, *keys)
 
-    async def sdiffstore(self, destination: str, key: str, *keys: str) -> int:
+    async def sdiffstore(self, destination: Arg, key: Arg, *keys: Arg) -> int:
         """Implement the SDIFFSTORE command (https://redis.io/commands/sdiffstore)."""
         return await self.call("SDIFFSTORE", destination, key, *keys)
 
-    async def sinter(self, key: str, *keys: str) -> set:
+    async def sinter(self, key: Arg, *keys: Arg) -> set:
         """Implement the SINTER command (https://redis.io/commands/sinter)."""
         return await self.call("SINTER", key, *keys)
 
-    async def sinterstore(self, destination: str, key: str, *keys: str):
+    async def sinterstore(self, destination: Arg, key: Arg, *keys: Arg):
         """Implement the SINTERSTORE command (https://redis.io/commands/sinterstore)."""
         return await self.call("SINTERSTORE", destination, key, *keys)
 
-    async def sismember(self, key: str, member: str) -> bool:
+    async def sismember(self, key: Arg, member: Arg) -> bool:
         """Implement the SISMEMBER command (https://redis.io/commands/sismember)."""
-        return await self.call("SISMEMBER", key, member)
+        return await self.read("SISMEMBER", key, member)
 
-    async def smembers(self, key: str) -> set:
+    async def smembers(self, key: Arg) -> set:
         """Implement the SMEMBERS command (https://redis.io/commands/smember)."""
-        return await self.call("SMEMBERS", key)
+        return await self.read("SMEMBERS", key)
 
-    async def smismember(self, key: str, member: str, *members: str) -> list:
+    async def smismember(self, key: Arg, member: Arg, *members: Arg) -> list:
         """Implement the SMISMEMBER command (https://redis.io/commands/smismember)."""
-        return await self.call("SMISMEMBER", key, member, *members)
+        return await self.read("SMISMEMBER", key, member, *members)
 
-    async def smove(self, source: str, destination: str, member: str) -> int:
+    async def smove(self, source: Arg, destination: Arg, member: Arg) -> int:
         """Implement the SMOVE command (https://redis.io/commands/smove)."""
         return await self.call("SMOVE", source, destination, member)
 
     async def spop(
-        self, key: str, count: t.Optional[int] = None
+        self, key: Arg, count: t.Optional[int] = None
     ) -> t.Union[bytes, set]:
         """Implement the SPOP command (https://redis.io/commands/spop)."""
-        command = ["SPOP", key]
+        command: t.List[Arg] = ["SPOP", key]
         if count is not None:
-            command.append(str(count))
+            command.append(count)
         return await self.call(*command)
 
+    def sscan_iter(
+        self,
+        key: Arg,
+        match: t.Optional[str] = None,
+        count: int = 10,
+        *,
+        target_latency: float = TARGET_LATENCY,
+        prefetch: bool = False,
+    ) -> t.AsyncIterator[bytes]:
+        """Iterate over a set with SSCAN (https://redis.io/commands/sscan).
+
+        Unlike :meth:`smembers`, the set is read a page at a time. See
+        :meth:`scan_iter` for the other args.
+
+        Args:
+            key (Arg): The key of the set.
+            match (str): Only return members matching this glob (default: all).
+            count (int): The COUNT of the first page (default: 10).
+            target_latency (float): Seconds a page should take (default: 5ms).
+            prefetch (bool): Request the next page while the current one is
+                being processed (default: False).
+
+        Returns:
+            An async iterator over the members. A member may be returned more
+                than once.
+        """
+        return Scanner(
+            self,
+            "SSCAN",
+            key,
+            match=match,
+            count=count,
+            target_latency=target_latency,
+            prefetch=prefetch,
+        ).elements()
+
+    ### Sorted set commands: https://redis.io/commands#sorted_set ###
+    def zscan_iter(
+        self,
+        key: Arg,
+        match: t.Optional[str] = None,
+        count: int = 10,
+        *,
+        target_latency: float = TARGET_LATENCY,
+        prefetch: bool = False,
+    ) -> t.AsyncIterator[t.Tuple[bytes, float]]:
+        """Iterate over a sorted set with ZSCAN (https://redis.io/commands/zscan).
+
+        See :meth:`scan_iter` for the other args.
+
+        Args:
+            key (Arg): The key of the sorted set.
+            match (str): Only return members matching this glob (default: all).
+            count (int): The COUNT of the first page (default: 10).
+            target_latency (float): Seconds a page should take (default: 5ms).
+            prefetch (bool): Request the next page while the current one is
+                being processed (default: False).
+
+        Returns:
+            An async iterator over the (member, score) pairs, with float scores.
+        """
+        return Scanner(
+            self,
+            "ZSCAN",
+            key,
+            match=match,
+            count=count,
+            target_latency=target_latency,
+            prefetch=prefetch,
+        ).elements()
+
     ### String commands: https://redis.io/commands/#string ###
-    async def append(self, key: str, value: str) -> bytes:
+    async def append(self, key: Arg, value: Arg) -> bytes:
         """Implement the APPEND command (https://redis.io/commands/append)."""
         return await self.call("APPEND", key, value)
 
     async def bitcount(
-        self, key: str, start: t.Optional[int] = None, end: t.Optional[int] = None
+        self, key: Arg, start: t.Optional[int] = None, end: t.Optional[int] = None
     ):
         """Implement the BITCOUNT command (https://redis.io/commands/bitcount)."""
-        command = ["BITCOUNT", key]
+        command: t.List[Arg] = ["BITCOUNT", key]
         if start is not None and end is not None:
-            command.extend([str(start), str(end)])
+            command.extend([start, end])
 
         return await self.call(*command)
 
     async def bitop(
         self,
         command: t.Literal["AND", "OR", "XOR", "NOT"],
-        destination_key: str,
-        *source_keys: str,
+        destination_key: Arg,
+        *source_keys: Arg,
     ) -> int:
         """Implement the BITOP command (https://redis.io/commands/bitop)."""
         return await self.call("BITOP", command, destination_key, *source_keys)
 
     async def bitpos(
         self,
-        key: str,
+        key: Arg,
         bit: t.Literal[0, 1],
         start: t.Optional[int] = None,
         end: t.Optional[int] = None,
     ):
         """Implement the BITPOS command (https://redis.io/commands/bitpos)."""
-        command = ["BITPOS", key, str(bit)]
+        command: t.List[Arg] = ["BITPOS", key, bit]
         if start:
-            command.append(str(start))
+            command.append(start)
         if end:
-            command.append(str(end))
+            command.append(end)
 
         return await self.call(*command)
 
-    async def decr(self, key: str) -> int:
+    async def decr(self, key: Arg) -> int:
         """Implement the DECR command (https://redis.io/commands/decr)."""
         return await self.call("DECR", key)
 
-    async def decrby(self, key: str, decrement: int) -> int:
+    async def decrby(self, key: Arg, decrement: int) -> int:
         """Implement the DECRBY command (https://redis.io/commands/decrby)."""
-        return await self.call("DECRBY", key, str(decrement))
+        return await self.call("DECRBY", key, decrement)
 
-    async def get(self, key: str) -> bytes:
+    async def get(self, key: Arg) -> bytes:
         """Implement the GET command (https://redis.io/commands/get)."""
-        return await self.call("GET", key)
+        return await self.read("GET", key)
+
+    async def get_into(self, key: Arg, writable) -> t.Optional[int]:
+        """Stream a string into a file, see :meth:`RedisClient.get_into`."""
+        self._require_pool("get_into")
+        return await self.client.get_into(encode_arg(key), writable)
 
-    async def getbit(self, key: str, index: int) -> int:
+    async def getbit(self, key: Arg, index: int) -> int:
         """Implement the GETBIT command (https://redis.io/commands/getbit)."""
-        return await self.call("GETBIT", key, str(index))
+        return await self.read("GETBIT", key, index)
 
-    async def getrange(self, key: str, start: int, end: int) -> bytes:
+    async def getrange(self, key: Arg, start: int, end: int) -> bytes:
         """Implement the GETRANGE command (https://redis.io/commands/getrange)."""
-        return await self.call("GETRANGE", key, str(start), str(end))
+        return await self.read("GETRANGE", key, start, end)
 
-    async def getset(self, key: str, value: str) -> t.Optional[bytes]:
+    async def getset(self, key: Arg, value: Arg) -> t.Optional[bytes]:
         """Implement the GETSET command (https://redis.io/commands/getset)."""
         return await self.call("GETSET", key, value)
 
-    async def incr(self, key: str) -> int:
+    async def incr(self, key: Arg) -> int:
         """Implement the INCR command (https://redis.io/commands/incr)."""
         return await self.call("INCR", key)
 
-    async def incrby(self, key: str, increment: int) -> int:
+    async def incrby(self, key: Arg, increment: int) -> int:
         """Implement the INCRBY command (https://redis.io/commands/incrby)."""
-        return await self.call("INCRBY", key, str(increment))
+        return await self.call("INCRBY", key, increment)
 
-    async def incrbyfloat(self, key: str, increment: float) -> float:
+    async def incrbyfloat(self, key: Arg, increment: float) -> float:
         """Implement the INCRBYFLOAT command (https://redis.io/commands/incrbyfloat)."""
-        return float(await self.call("INCRBYFLOAT", key, str(increment)))
+        return float(await self.call("INCRBYFLOAT", key, increment))
 
-    async def mget(self, key: str, *keys: str) -> list:
+    async def mget(self, key: Arg, *keys: Arg) -> list:
         """Implement the MGET command (https://redis.io/commands/mget)."""
         return await self.call("MGET", key, *keys)
 
-    async def mset(self, key: str, value: str, *more: str) -> bytes:
+    async def mget_many(
+        self,
+        keys: t.Iterable[Arg],
+        *,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        concurrency: int = BULK_CONCURRENCY,
+    ) -> list:
+        """MGET any number of keys a chunk at a time, sending chunks concurrently.
+
+        Args:
+            keys (Arg): The keys to get.
+            chunk_size (int): The most keys in one MGET (default: 1000).
+            concurrency (int): How many MGETs may be in flight at once
+                (default: 4).
+
+        Returns:
+            The value of each key, or None for missing ones, in the order of
+                *keys*. The first error returned by Redis, if any.
+        """
+        commands = (["MGET", *chunk] for chunk in _chunked(iter(keys), chunk_size))
+        return _concatenate(await self._bulk(commands, concurrency))
+
+    async def mset(self, key: Arg, value: Arg, *more: Arg) -> bytes:
         """Implement the MSET command (https://redis.io/commands/mset)."""
         return await self.call("MSET", key, value, *more)
 
-    async def msetnx(self, key: str, value: str, *more: str) -> int:
+    async def mset_mapping(
+        self,
+        mapping: Pairs,
+        *,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        concurrency: int = BULK_CONCURRENCY,
+    ) -> int:
+        """MSET the keys of a mapping a chunk at a time, sending chunks concurrently.
+
+        Unlike a single :meth:`mset`, the keys are not all set atomically, but
+        no one command blocks Redis for long.
+
+        Args:
+            mapping (Pairs): A dict, or an iterable of (key, value) pairs.
+            chunk_size (int): The most keys in one MSET (default: 1000).
+            concurrency (int): How many MSETs may be in flight at once
+                (default: 4).
+
+        Returns:
+            The number of keys that were set, or the first error returned by
+                Redis.
+
+        Example:
+            await client.mset_mapping({f"item:{i}": i for i in range(100_000)})
+        """
+        count = 0
+
+        def commands() -> t.Iterator[t.List[Arg]]:
+            nonlocal count
+            for chunk in _chunked(_pairs(mapping), chunk_size):
+                count += len(chunk)
+                yield ["MSET", *itertools.chain.from_iterable(chunk)]
+
+        return _first_error(await self._bulk(commands(), concurrency)) or count
+
+    async def msetnx(self, key: Arg, value: Arg, *more: Arg) -> int:
         """Implement the MSETNX command (https://redis.io/commands/msetnx)."""
         return await self.call("MSETNX", key, value, *more)
 
     async def set(
         self,
-        key: str,
-        value: str,
+        key: Arg,
+        value: Arg,
         *,
         ex: int = 0,
         px: int = 0,
@@ -264,15 +804,15 @@ class MidlevelClient:
         xx: bool = False,
     ):
         """Implement the SET command (https://redis.io/commands/set)."""
-        command = ["SET", key, value]
+        command: t.List[Arg] = ["SET", key, value]
         if bool(ex) + bool(px) + keepttl > 1:
             raise ValueError(
                 f"More than one of {ex=}, {px=}, and {keepttl=} were specified"
             )
         if ex:
-            command.extend(["EX", str(ex)])
+            command.extend(["EX", ex])
         elif px:
-            command.extend(["PX", str(px)])
+            command.extend(["PX", px])
         elif keepttl:
             command.append("KEEPTTL")
 
@@ -285,14 +825,50 @@ class MidlevelClient:
 
         return await self.call(*command)
 
-    async def setbit(self, key: str, offset: int, value: t.Literal[0, 1]) -> int:
+    async def set_from(self, key: Arg, readable, length: int):
+        """Stream a string from a file, see :meth:`RedisClient.set_from`."""
+        self._require_pool("set_from")
+        return await self.client.set_from(encode_arg(key), readable, length)
+
+    async def setbit(self, key: Arg, offset: int, value: t.Literal[0, 1]) -> int:
         """Implement the SETBIT command (https://redis.io/commands/setbit)."""
-        return await self.call("SETBIT", key, str(offset), str(value))
+        return await self.call("SETBIT", key, offset, value)
 
-    async def setrange(self, key: str, offset: int, value: str) -> int:
+    async def setrange(self, key: Arg, offset: int, value: Arg) -> int:
         """Implement the SETRANGE command (https://redis.io/commands/setrange)."""
-        return await self.call("SETRANGE", key, str(offset), value)
+        return await self.call("SETRANGE", key, offset, value)
 
-    async def strlen(self, key: str) -> int:
+    async def strlen(self, key: Arg) -> int:
         """Implement the STRLEN command (https://redis.io/commands/strlen)."""
-        return await self.call("STRLEN", key)
+        return await self.read("STRLEN", key)
+
+
+def _pairs(mapping: Pairs) -> t.Iterator[t.Tuple[Arg, Arg]]:
+    """Return an iterator over the pairs of a mapping, or of an iterable of pairs."""
+    items = getattr(mapping, "items", None)
+    return iter(items() if items is not None else mapping)
+
+
+def _chunked(items: t.Iterator, size: int) -> t.Iterator[list]:
+    """Split an iterator into lists of at most *size* items."""
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _first_error(replies: t.List[t.Any]) -> t.Optional[protocol.RedisError]:
+    """Return the first error among the replies, or None."""
+    for reply in replies:
+        if isinstance(reply, protocol.RedisError):
+            return reply
+    return None
+
+
+def _concatenate(replies: t.List[t.Any]) -> list:
+    """Join the list replies of a chunked command, or return the first error."""
+    error = _first_error(replies)
+    if error is not None:
+        return error
+    return list(itertools.chain.from_iterable(replies))
@@ -0,0 +1,87 @@
+"""This module contains commands prepared once and sent many times.
+
+Classes:
+    Prepared
+"""
+import typing as t
+
+from redtrio.lowlevel.encoding import Arg
+from redtrio.lowlevel.encoding import encode_arg
+from redtrio.lowlevel.encoding import prepare
+
+
+class Prepared:
+    """Prepared sends one command with named arguments, encoded once up front.
+
+    The command name and the RESP header of the array are encoded into a
+    :class:`PreparedCommand` when the Prepared is created, and each call only
+    encodes its arguments before sending them with
+    :meth:`RedisClient.call_prepared`. Lowlevel clients without that method,
+    such as :class:`ClusterClient`, are sent the command with *call* instead.
+
+    Arguments are given by position or by name, and a missing or unexpected one
+    raises TypeError before anything is sent.
+
+    Attributes:
+        client (MidlevelClient): The client the command is sent with.
+        template (PreparedCommand): The encoded header and command name.
+        params (tuple): The names of the arguments, in order.
+
+    Example:
+        hget = client.prepare("HGET", "key", "field")
+        await hget("user:1", "name") -> b"Alice"
+        await hget(key="user:1", field="email") -> b"alice@example.com"
+    """
+
+    def __init__(self, client, command: str, *params: str):
+        """Initialize the Prepared.
+
+        Arguments:
+            client (MidlevelClient): The client to send the command with.
+            command (str): The command, such as "HGET".
+            *params (str): The name of each argument, in the order Redis
+                expects them.
+        """
+        self.client = client
+        self.template = prepare(command.encode(), len(params))
+        self.params = params
+        self._positions = {name: i for i, name in enumerate(params)}
+        self._call_prepared = getattr(client.client, "call_prepared", None)
+
+    async def __call__(self, *args: Arg, **kwargs: Arg):
+        """Send the command with its arguments and return the response.
+
+        Args:
+            *args (Arg): The arguments, in order.
+            **kwargs (Arg): The arguments, by name.
+
+        Returns:
+            The response from Redis.
+        """
+        if kwargs or len(args) != len(self.params):
+            args = self._bind(args, kwargs)
+        encoded = [encode_arg(arg) for arg in args]
+        if self._call_prepared is None:
+            return await self.client.client.call(self.template.command, *encoded)
+        return await self._call_prepared(self.template, *encoded)
+
+    def _bind(self, args: t.Tuple[Arg, ...], kwargs: t.Dict[str, Arg]) -> list:
+        """Put positional and named arguments in order, like a function call."""
+        if len(args) > len(self.params):
+            raise TypeError(
+                f"{self.template.command!r} takes {len(self.params)} arguments, "
+                f"but {len(args)} were given"
+            )
+        missing = object()
+        bound: t.List[t.Any] = [*args, *[missing] * (len(self.params) - len(args))]
+        for name, value in kwargs.items():
+            position = self._positions.get(name)
+            if position is None:
+                raise TypeError(f"Unexpected argument {name!r}")
+            if bound[position] is not missing:
+                raise TypeError(f"Got multiple values for argument {name!r}")
+            bound[position] = value
+        names = [self.params[i] for i, arg in enumerate(bound) if arg is missing]
+        if names:
+            raise TypeError(f"Missing arguments: {', '.join(names)}")
+        return bound
@@ -0,0 +1,200 @@
+"""This module walks SCAN cursors, adjusting COUNT as it goes.
+
+Classes:
+    Scanner
+"""
+import typing as t
+
+from respy3 import protocol
+import trio
+
+from redtrio.lowlevel.encoding import Arg
+from redtrio.lowlevel.encoding import encode_arg
+
+TARGET_LATENCY = 0.005
+MAX_COUNT = 10_000
+
+
+class Scanner:
+    """Scanner walks the cursor of SCAN, HSCAN, SSCAN or ZSCAN, one page at a time.
+
+    COUNT is only a hint of how much work Redis does for one page, so it is
+    adjusted after every page: halved at most if the page took longer than
+    *target_latency*, and doubled at most if it was quicker. Large keyspaces are
+    walked in a few big pages when Redis answers quickly, and in small pages,
+    which block it for less time, when it doesn't.
+
+    With *prefetch*, the command for the next page is sent as soon as a page
+    arrives, on a connection kept for the whole scan, so Redis works on it while
+    the current page is being processed. Then only the time spent waiting for a
+    page counts toward *target_latency*. Prefetching needs a lowlevel client
+    with a connection pool, such as :class:`RedisClient`; with other clients,
+    such as :class:`ClusterClient`, each page is requested once it is needed.
+
+    Attributes:
+        client (MidlevelClient): The client the commands are sent with.
+        command (str): The command, such as "SCAN" or "HSCAN".
+        key (Arg): The key to scan, or None for SCAN.
+        args (list): The MATCH and TYPE args sent with every page.
+        count (int): The COUNT sent with the next page.
+        target_latency (float): Seconds a page should take.
+        max_count (int): The largest COUNT ever sent.
+        prefetch (bool): Whether the next page is requested before it is needed.
+
+    Example:
+        async for member in Scanner(client, "SSCAN", "tags").elements():
+            print(member)
+    """
+
+    def __init__(
+        self,
+        client,
+        command: str,
+        key: t.Optional[Arg] = None,
+        *,
+        match: t.Optional[str] = None,
+        type: t.Optional[str] = None,
+        count: int = 10,
+        target_latency: float = TARGET_LATENCY,
+        max_count: int = MAX_COUNT,
+        prefetch: bool = False,
+    ):
+        """Initialize the Scanner.
+
+        Arguments:
+            client (MidlevelClient): The client to send the commands with.
+            command (str): "SCAN", "HSCAN", "SSCAN" or "ZSCAN".
+            key (Arg): The key to scan, or None for SCAN (default: None).
+            match (str): Only return elements matching this glob (default: all).
+            type (str): Only return keys of this type, for SCAN (default: all).
+            count (int): The COUNT of the first page (default: 10).
+            target_latency (float): Seconds a page should take (default: 5ms).
+            max_count (int): The largest COUNT to send (default: 10,000).
+            prefetch (bool): Request the next page before it is needed
+                (default: False).
+        """
+        self.client = client
+        self.command = command
+        self.key = key
+        self.args: t.List[str] = []
+        if match is not None:
+            self.args.extend(("MATCH", match))
+        if type is not None:
+            self.args.extend(("TYPE", type))
+        self.count = count
+        self.target_latency = target_latency
+        self.max_count = max_count
+        self.prefetch = prefetch
+
+    def command_for(self, cursor: Arg) -> t.List[Arg]:
+        """Return the command that fetches the page at a cursor.
+
+        Args:
+            cursor (Arg): The cursor returned with the previous page, which is
+                a str if the client decodes replies.
+
+        Returns:
+            The command and its args.
+        """
+        key = [] if self.key is None else [self.key]
+        return [self.command, *key, cursor, *self.args, "COUNT", self.count]
+
+    def adjust(self, elapsed: float) -> None:
+        """Scale COUNT toward *target_latency*, by a factor of two at most.
+
+        Args:
+            elapsed (float): How many seconds the last page took.
+        """
+        factor = 2.0 if elapsed <= 0 else self.target_latency / elapsed
+        factor = min(max(factor, 0.5), 2.0)
+        self.count = min(max(int(self.count * factor), 1), self.max_count)
+
+    def pages(self) -> t.AsyncIterator[list]:
+        """Return an async iterator over each page, until the cursor is back at 0.
+
+        Returns:
+            An async generator yielding the elements of each page, as returned
+                by Redis. Close it with *aclose* if it is abandoned early.
+        """
+        if self.prefetch and hasattr(self.client.client, "connection_pool"):
+            return self._prefetched_pages()
+        return self._pages()
+
+    async def elements(self) -> t.AsyncIterator[t.Any]:
+        """Yield each element of each page.
+
+        Yields:
+            Each key or member, or a (field, value) pair for HSCAN, or a
+                (member, score) pair with a float score for ZSCAN.
+        """
+        pages = self.pages()
+        try:
+            async for page in pages:
+                if self.command == "HSCAN":
+                    for i in range(0, len(page), 2):
+                        yield page[i], page[i + 1]
+                elif self.command == "ZSCAN":
+                    for i in range(0, len(page), 2):
+                        yield page[i], float(page[i + 1])
+                else:
+                    for element in page:
+                        yield element
+        finally:
+            await pages.aclose()
+
+    async def _pages(self) -> t.AsyncIterator[list]:
+        """Yield each page, sending the command for it once it is needed.
+
+        Yields:
+            The elements of one page, as returned by Redis.
+        """
+        cursor = b"0"
+        while True:
+            start = trio.current_time()
+            cursor, page = _split(await self.client.call(*self.command_for(cursor)))
+            self.adjust(trio.current_time() - start)
+            yield page
+            if int(cursor) == 0:
+                return
+
+    async def _prefetched_pages(self) -> t.AsyncIterator[list]:
+        """Yield each page, sending the command for the next one first.
+
+        Yields:
+            The elements of one page, as returned by Redis.
+        """
+        client = self.client.client
+        # A page still on its way when the scan is abandoned means the
+        # connection can't be reused, so checkout closes it.
+        async with client.connection_pool.checkout() as connection:
+            command = [encode_arg(arg) for arg in self.command_for(b"0")]
+            await client.send_command(*command, connection=connection)
+            while True:
+                start = trio.current_time()
+                cursor, page = _split(await client.receive(connection))
+                self.adjust(trio.current_time() - start)
+                if int(cursor) == 0:
+                    break
+                command = [encode_arg(arg) for arg in self.command_for(cursor)]
+                await client.send_command(*command, connection=connection)
+                yield page
+        # The connection is back in the pool before the last page is processed.
+        yield page
+
+
+def _split(reply) -> t.Tuple[t.Any, list]:
+    """Return the cursor and the elements of a page.
+
+    Arguments:
+        reply: The reply to SCAN, HSCAN, SSCAN or ZSCAN.
+
+    Returns:
+        The cursor of the next page, and the elements of this one.
+
+    Raises:
+        reply: Redis replied with an error, such as WRONGTYPE.
+    """
+    if isinstance(reply, protocol.RedisError):
+        raise reply
+    cursor, page = reply
+    return cursor, page
@@ -0,0 +1,129 @@
+"""This module contains Lua scripts and function libraries run by their name.
+
+Classes:
+    Script
+    Library
+"""
+import hashlib
+import re
+import typing as t
+
+from respy3 import protocol
+
+from redtrio.lowlevel.encoding import Arg
+
+
+def _is_error(reply, code: bytes, message: bytes = b"") -> bool:
+    """Return whether a reply is a RedisError with this code and message prefix."""
+    return (
+        isinstance(reply, protocol.RedisError)
+        and reply.args[:1] == (code,)
+        and (not message or bytes(reply.args[1]).startswith(message))
+    )
+
+
+class Script:
+    """Script runs a Lua script by its SHA1, only sending the source when needed.
+
+    The SHA1 is computed locally, and the script is run with EVALSHA. If Redis
+    replies with NOSCRIPT, for example after a restart, the script is sent once
+    with EVAL, which also caches it again, and later calls go back to EVALSHA.
+
+    Attributes:
+        client (MidlevelClient): The client the script is run with.
+        source (str): The Lua source of the script.
+        sha (str): The SHA1 of *source*, as hex.
+
+    Example:
+        increment = client.register_script("return redis.call('INCR', KEYS[1])")
+        await increment(keys=["counter"]) -> 1
+    """
+
+    def __init__(self, client, source: str):
+        """Initialize the Script.
+
+        Arguments:
+            client (MidlevelClient): The client to run the script with.
+            source (str): The Lua source of the script.
+        """
+        self.client = client
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    async def __call__(self, keys: t.Sequence[Arg] = (), args: t.Sequence[Arg] = ()):
+        """Run the script and return its reply.
+
+        Args:
+            keys (Arg): The keys the script accesses, available as KEYS.
+            args (Arg): Other arguments, available as ARGV.
+
+        Returns:
+            The reply from the script.
+        """
+        reply = await self.client.call("EVALSHA", self.sha, len(keys), *keys, *args)
+        if _is_error(reply, b"NOSCRIPT"):
+            reply = await self.client.call("EVAL", self.source, len(keys), *keys, *args)
+        return reply
+
+    def load_command(self) -> t.Tuple[bytes, ...]:
+        """Return the command that loads the script into Redis' script cache."""
+        return (b"SCRIPT", b"LOAD", self.source.encode())
+
+
+class Library:
+    r"""Library is a Redis function library, loaded again if Redis has lost it.
+
+    Functions are run with FCALL. If Redis replies that the function doesn't
+    exist, the library is loaded with FUNCTION LOAD REPLACE and the call is tried
+    once more.
+
+    Attributes:
+        client (MidlevelClient): The client the functions are called with.
+        code (str): The source of the library, starting with a shebang such as
+            "#!lua name=mylib".
+        name (str): The name of the library, from the shebang.
+
+    Example:
+        library = client.register_library(
+            "#!lua name=mylib\n"
+            "redis.register_function('hello', function() return 'hi' end)"
+        )
+        await library.fcall("hello") -> b"hi"
+    """
+
+    def __init__(self, client, code: str):
+        """Initialize the Library.
+
+        Arguments:
+            client (MidlevelClient): The client to call the functions with.
+            code (str): The source of the library, starting with a shebang.
+
+        Raises:
+            ValueError: The code does not start with a shebang naming the library.
+        """
+        match = re.match(r"#!\w+ .*?\bname=(\S+)", code)
+        if match is None:
+            raise ValueError("The library must start with a shebang, like #!lua name=")
+        self.client = client
+        self.code = code
+        self.name = match[1]
+
+    async def fcall(
+        self, function: str, keys: t.Sequence[Arg] = (), args: t.Sequence[Arg] = ()
+    ):
+        """Call a function in the library and return its reply.
+
+        Args:
+            function (str): The name of the function.
+            keys (Arg): The keys the function accesses.
+            args (Arg): Other arguments to pass to the function.
+
+        Returns:
+            The reply from the function.
+        """
+        command = ("FCALL", function, len(keys), *keys, *args)
+        reply = await self.client.call(*command)
+        if _is_error(reply, b"ERR", b"Function not found"):
+            await self.client.call("FUNCTION", "LOAD", "REPLACE", self.code)
+            reply = await self.client.call(*command)
+        return reply
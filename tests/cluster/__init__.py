@@ -0,0 +1 @@
+"""Tests for the Redis Cluster client."""
@@ -0,0 +1,164 @@
+"""A fake Redis Cluster, served over in-memory streams."""
+
+import pytest
+from respy3.protocol import Resp3Reader
+import trio
+import trio.testing
+
+from redtrio.cluster import key_slot
+
+
+def encode(value) -> bytes:
+    """Encode a reply from the fake cluster."""
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    if value is None:
+        return b"_\r\n"
+    return b"$%d\r\n%b\r\n" % (len(value), value)
+
+
+class FakeNode:
+    """One node of the fake cluster.
+
+    Attributes:
+        port (int): The port the node listens on.
+        data (dict): The keys and values stored on the node.
+        migrating (dict): The port each migrating slot is moving to, by slot.
+        importing (set): The slots being migrated to this node.
+        commands (list): Every command received.
+        streams (list): The server end of each connection.
+    """
+
+    def __init__(self, cluster, port):
+        """Initialize the FakeNode."""
+        self.cluster = cluster
+        self.port = port
+        self.data = {}
+        self.migrating = {}
+        self.importing = set()
+        self.commands = []
+        self.streams = []
+
+    async def serve(self, stream):
+        """Handle the commands sent on one connection."""
+        self.streams.append(stream)
+        reader = Resp3Reader()
+        asking = False
+        while True:
+            command = reader.get_object()
+            if command is reader.sentinel:
+                try:
+                    data = await stream.receive_some()
+                except trio.ClosedResourceError:
+                    return
+                if not data:
+                    return
+                reader.feed(data)
+                continue
+
+            self.commands.append(command)
+            reply = self.handle(command, asking)
+            asking = command[0] == b"ASKING"
+            await stream.send_all(reply)
+
+    def handle(self, command, asking) -> bytes:
+        """Return the reply to a command."""
+        name, *args = command
+        if name == b"ASKING":
+            return b"+OK\r\n"
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"CLUSTER":
+            return encode(self.cluster.slots_reply())
+
+        keys = args[::2] if name == b"MSET" else args
+        if name in (b"GET", b"SET", b"SSCAN"):
+            keys = args[:1]
+        slot = key_slot(keys[0])
+        if any(key_slot(key) != slot for key in keys):
+            return b"-CROSSSLOT Keys in request don't hash to the same slot\r\n"
+        owner = self.cluster.owners[slot]
+        if owner != self.port and not (asking and slot in self.importing):
+            return b"-MOVED %d 127.0.0.1:%d\r\n" % (slot, owner)
+        if slot in self.migrating and keys[0] not in self.data:
+            return b"-ASK %d 127.0.0.1:%d\r\n" % (slot, self.migrating[slot])
+
+        if name in (b"SET", b"MSET"):
+            for i in range(0, len(args), 2):
+                self.data[args[i]] = args[i + 1]
+            return b"+OK\r\n"
+        if name == b"GET":
+            return encode(self.data.get(args[0]))
+        if name == b"SSCAN":
+            # Each key holds one member, returned in a single page.
+            return encode([b"0", [self.data[args[0]]] if args[0] in self.data else []])
+        if name == b"MGET":
+            return encode([self.data.get(key) for key in keys])
+        if name == b"EXISTS":
+            return encode(sum(key in self.data for key in keys))
+        # DEL and UNLINK
+        return encode(sum(self.data.pop(key, None) is not None for key in keys))
+
+
+class FakeCluster:
+    """A fake three-node Redis Cluster on ports 7000 to 7002.
+
+    Attributes:
+        nodes (dict): The nodes, by port.
+        owners (list): The port of the node owning each slot.
+    """
+
+    def __init__(self, nursery):
+        """Initialize the FakeCluster, splitting the slots evenly."""
+        self.nursery = nursery
+        self.nodes = {port: FakeNode(self, port) for port in (7000, 7001, 7002)}
+        self.owners = [7000] * 5461 + [7001] * 5462 + [7002] * 5461
+
+    async def spawn_connection(self, host, port):
+        """Connect a new in-memory connection to a node."""
+        if port not in self.nodes:
+            raise OSError(f"Connection refused: {port}")
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        self.nursery.start_soon(self.nodes[port].serve, server_stream)
+        return client_stream
+
+    def slots_reply(self) -> list:
+        """Return the CLUSTER SLOTS reply for the current owners."""
+        reply = []
+        start = 0
+        for slot in range(1, len(self.owners) + 1):
+            if slot == len(self.owners) or self.owners[slot] != self.owners[start]:
+                port = self.owners[start]
+                reply.append([start, slot - 1, [b"127.0.0.1", port, b"id%d" % port]])
+                start = slot
+        return reply
+
+    def move_slot(self, slot, port):
+        """Move a slot, and its keys, to another node."""
+        source = self.nodes[self.owners[slot]]
+        for key in [key for key in source.data if key_slot(key) == slot]:
+            self.nodes[port].data[key] = source.data.pop(key)
+        self.owners[slot] = port
+
+    async def fail_over(self, port, new_port):
+        """Take a node down, and give its slots and keys to another one."""
+        for slot, owner in enumerate(self.owners):
+            if owner == port:
+                self.move_slot(slot, new_port)
+        node = self.nodes.pop(port)
+        for stream in node.streams:
+            await stream.aclose()
+
+    def cluster_slots_calls(self) -> int:
+        """Return how many times the slot map was fetched."""
+        return sum(
+            node.commands.count([b"CLUSTER", b"SLOTS"]) for node in self.nodes.values()
+        )
+
+
+@pytest.fixture
+def cluster(nursery):
+    """A FakeCluster running in the test's nursery."""
+    return FakeCluster(nursery)
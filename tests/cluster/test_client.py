@@ -0,0 +1,155 @@
+"""Tests for the cluster client."""
+
+import pytest
+import trio
+
+from redtrio.cluster import ClusterClient
+from redtrio.cluster import key_slot
+from redtrio.lowlevel import DecodingReader
+from redtrio.lowlevel import PairsReader
+from redtrio.lowlevel import RawReader
+from redtrio.midlevel import MidlevelClient
+
+
+@pytest.fixture
+def client(cluster):
+    """A ClusterClient connected to the FakeCluster."""
+    return ClusterClient(
+        [("127.0.0.1", 7000)], spawn_connection=cluster.spawn_connection
+    )
+
+
+async def test_routing(client, cluster):
+    """It sends each command to the node owning its key's slot."""
+    for key in (b"foo", b"bar", b"baz", b"{foo}.other"):
+        assert await client.call(b"SET", key, key) == b"OK"
+        assert await client.call(b"GET", key) == key
+        assert key in cluster.nodes[cluster.owners[key_slot(key)]].data
+
+    assert await client.call(b"PING") == b"PONG"
+    assert cluster.cluster_slots_calls() == 1
+
+
+@pytest.mark.parametrize("Reader", [RawReader, PairsReader, DecodingReader])
+async def test_readers(cluster, Reader):
+    """It reads the slot map and redirects whatever the nodes' reader is."""
+    client = ClusterClient(
+        [("127.0.0.1", 7000)], Reader=Reader, spawn_connection=cluster.spawn_connection
+    )
+    await client.call(b"SET", b"foo", b"1")
+    assert client.slots[key_slot(b"foo")] == ("127.0.0.1", 7002)
+    assert b"foo" in cluster.nodes[7002].data
+
+    cluster.move_slot(key_slot(b"foo"), 7000)
+    reply = await client.call(b"GET", b"foo")
+    if Reader is RawReader:
+        reply = bytes(reply)
+    assert reply == {RawReader: b"$1\r\n1\r\n", DecodingReader: "1"}.get(Reader, b"1")
+    assert client.slots[key_slot(b"foo")] == ("127.0.0.1", 7000)
+
+
+async def test_moved(client, cluster):
+    """It follows MOVED, updating the slot and then the whole slot map."""
+    await client.call(b"SET", b"foo", b"1")
+    slot = key_slot(b"foo")
+    cluster.move_slot(slot, 7000)
+
+    assert await client.call(b"GET", b"foo") == b"1"
+    assert client.slots[slot] == ("127.0.0.1", 7000)
+    assert cluster.cluster_slots_calls() == 1
+
+    # The slot map is only fetched again on the next command.
+    assert await client.call(b"GET", b"foo") == b"1"
+    assert cluster.cluster_slots_calls() == 2
+
+
+async def test_ask(client, cluster):
+    """It follows ASK with ASKING, without changing the slot map."""
+    await client.call(b"SET", b"foo", b"1")
+    slot = key_slot(b"foo")
+    source, target = cluster.nodes[7002], cluster.nodes[7000]
+    source.migrating[slot] = 7000
+    target.importing.add(slot)
+    target.data[b"foo"] = source.data.pop(b"foo")
+
+    assert await client.call(b"GET", b"foo") == b"1"
+    assert target.commands[-2:] == [[b"ASKING"], [b"GET", b"foo"]]
+    assert client.slots[slot] == ("127.0.0.1", 7002)
+    assert cluster.cluster_slots_calls() == 1
+
+
+async def test_startup_node_down(cluster):
+    """It fetches the slot map from the next startup node if one is down."""
+    client = ClusterClient(
+        [("127.0.0.1", 6999), ("127.0.0.1", 7001)],
+        spawn_connection=cluster.spawn_connection,
+    )
+    assert await client.call(b"SET", b"foo", b"1") == b"OK"
+
+    client = ClusterClient(
+        [("127.0.0.1", 6999)], spawn_connection=cluster.spawn_connection
+    )
+    with pytest.raises(ConnectionError):
+        await client.call(b"GET", b"foo")
+
+
+async def test_node_down(client, cluster):
+    """It drops a node it can't reach, and fetches the slot map again."""
+    await client.call(b"SET", b"foo", b"1")
+    await cluster.fail_over(7002, 7000)
+
+    with pytest.raises((OSError, trio.BrokenResourceError)):
+        await client.call(b"GET", b"foo")
+    assert ("127.0.0.1", 7002) not in client.nodes
+    assert await client.call(b"GET", b"foo") == b"1"
+    assert client.slots[key_slot(b"foo")] == ("127.0.0.1", 7000)
+    assert cluster.cluster_slots_calls() == 2
+
+
+async def test_fan_out(client, cluster):
+    """It splits multi-key commands by slot, pipelined per node."""
+    keys = [b"key%d" % i for i in range(100)]
+    pairs = [arg for key in keys for arg in (key, key.upper())]
+    assert await client.call(b"MSET", *pairs) == b"OK"
+    assert all(len(node.data) > 0 for node in cluster.nodes.values())
+
+    assert await client.call(b"MGET", *keys, b"missing") == [
+        *[key.upper() for key in keys],
+        None,
+    ]
+    assert await client.call(b"EXISTS", *keys[:10], b"missing") == 10
+    assert await client.call(b"DEL", *keys) == 100
+    assert await client.call(b"UNLINK", *keys) == 0
+
+
+async def test_fan_out_moved(client, cluster):
+    """It follows redirects for one slot of a split command."""
+    await client.call(b"MSET", b"foo", b"1", b"bar", b"2")
+    cluster.move_slot(key_slot(b"foo"), 7001)
+    assert await client.call(b"MGET", b"foo", b"bar") == [b"1", b"2"]
+
+
+async def test_midlevel(client):
+    """It works as the lowlevel client of a MidlevelClient."""
+    client = MidlevelClient(client=client)
+    assert await client.mset("foo", "1", "bar", "2") == b"OK"
+    assert await client.mget("foo", "bar") == [b"1", b"2"]
+    assert await client.get(memoryview(b"foo")) == b"1"
+
+
+async def test_midlevel_without_pool(client):
+    """Features needing one connection pool are skipped or refused."""
+    client = MidlevelClient(client=client)
+    client.register_script("return 1")
+    client.register_library("#!lua name=mylib\n")
+
+    await client.call("SET", "tags", "a")
+    pages = [page async for page in client.sscan_iter("tags", prefetch=True)]
+    assert pages == [b"a"]
+
+    with pytest.raises(TypeError, match="ClusterClient"):
+        await client.transaction(lambda transaction: None, "foo")
+    with pytest.raises(TypeError, match="ClusterClient"):
+        await client.get_into("foo", bytearray(1))
+    with pytest.raises(TypeError, match="ClusterClient"):
+        await client.set_from("foo", bytearray(1), 1)
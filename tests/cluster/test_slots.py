@@ -0,0 +1,25 @@
+"""Tests for hash slots."""
+
+from redtrio.cluster import key_slot
+from redtrio.cluster.slots import crc16
+
+
+def test_crc16():
+    """It computes the CRC16 (XMODEM) checksum Redis uses."""
+    assert crc16(b"123456789") == 0x31C3
+
+
+def test_key_slot():
+    """It returns the same slots as Redis' CLUSTER KEYSLOT."""
+    assert key_slot(b"foo") == 12182
+    assert key_slot(b"") == 0
+    assert key_slot(memoryview(b"{foo}bar")) == key_slot(bytearray(b"foo")) == 12182
+
+
+def test_hash_tags():
+    """It only hashes the first non-empty hash tag."""
+    assert key_slot(b"{user1000}.following") == key_slot(b"user1000")
+    assert key_slot(b"{user1000}.followers") == key_slot(b"user1000")
+    assert key_slot(b"foo{}{bar}") == 8363
+    assert key_slot(b"foo{{bar}}zap") == key_slot(b"{bar")
+    assert key_slot(b"foo{bar}{zap}") == key_slot(b"bar")
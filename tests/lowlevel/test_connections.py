@@ -1,9 +1,12 @@
 """Tests for the connection pool."""
 
 import pytest
+from respy3.protocol import Resp3Reader
 import trio
+import trio.testing
 
 from redtrio.lowlevel import connections
+from redtrio.lowlevel import RedisClient
 
 
 @pytest.fixture
@@ -56,3 +59,406 @@ async def test_pool_limit(autojump_clock, pool):
         await pool.wait_for_connection()
 
     assert cancel_scope.cancelled_caught
+
+
+async def echo_server(stream, *, task_status=trio.TASK_STATUS_IGNORED):
+    """Reply to each ECHO command after one second, one byte at a time."""
+    reader = Resp3Reader()
+    task_status.started()
+    while True:
+        command = reader.get_object()
+        if command is reader.sentinel:
+            reader.feed(await stream.receive_some())
+            continue
+        await trio.sleep(1)
+        _, message = command
+        for byte in b"$%d\r\n%b\r\n" % (len(message), message):
+            await stream.send_all(bytes([byte]))
+
+
+async def test_concurrent_connections(autojump_clock, nursery):
+    """Concurrent callers each use their own connection and parser."""
+
+    async def spawn_connection(host, port):
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        await nursery.start(echo_server, server_stream)
+        return client_stream
+
+    pool = connections.ConnectionPool(
+        "127.0.0.1", 6379, spawn_connection=spawn_connection
+    )
+    client = RedisClient(connection_pool=pool)
+    results = {}
+
+    async def echo(i):
+        results[i] = await client.call(b"ECHO", b"message %d" % i)
+
+    start = trio.current_time()
+    async with trio.open_nursery() as callers:
+        for i in range(pool.max_connections):
+            callers.start_soon(echo, i)
+
+    assert results == {i: b"message %d" % i for i in range(pool.max_connections)}
+    assert len(pool.pool) == pool.max_connections
+    assert len({connection.reader for connection in pool.pool}) == len(pool.pool)
+    assert trio.current_time() - start < 2
+
+
+@pytest.fixture
+def small_pool():
+    """A ConnectionPool of two in-memory connections."""
+
+    async def spawn_connection(host, port):
+        _, client_stream = trio.testing.memory_stream_pair()
+        return client_stream
+
+    return connections.ConnectionPool(
+        "127.0.0.1", 6379, max_connections=2, spawn_connection=spawn_connection
+    )
+
+
+async def test_checkout(small_pool):
+    """It puts the connection back after the block, and closes it on an error."""
+    async with small_pool.checkout() as connection:
+        assert connection in small_pool.used_connections
+    assert list(small_pool.pool) == [connection]
+
+    with pytest.raises(ValueError):
+        async with small_pool.checkout() as connection:
+            raise ValueError
+    assert small_pool.size == 0
+    with pytest.raises(trio.ClosedResourceError):
+        await connection.send_all(b"PING")
+
+
+async def test_waiter_woken_immediately(autojump_clock, nursery, small_pool):
+    """It hands a put back connection to a waiting caller without delay."""
+    first = await small_pool.wait_for_connection()
+    await small_pool.wait_for_connection()
+    received = []
+
+    async def wait():
+        received.append(await small_pool.wait_for_connection())
+
+    nursery.start_soon(wait)
+    await trio.testing.wait_all_tasks_blocked()
+    assert small_pool.waiting == 1
+
+    start = trio.current_time()
+    small_pool.put_connection(first)
+    await trio.testing.wait_all_tasks_blocked()
+    assert received == [first]
+    assert trio.current_time() == start
+    assert small_pool.waiting == 0
+    assert small_pool.wait_count == 1
+
+
+async def test_waiters_served_in_order(nursery, small_pool):
+    """It serves waiting callers in the order they started waiting."""
+    held = [await small_pool.wait_for_connection() for _ in range(2)]
+    received = {}
+
+    async def wait(i):
+        received[i] = await small_pool.wait_for_connection()
+
+    for i in range(4):
+        nursery.start_soon(wait, i)
+        await trio.testing.wait_all_tasks_blocked()
+
+    for connection in held:
+        small_pool.put_connection(connection)
+    await trio.testing.wait_all_tasks_blocked()
+    assert received == {0: held[0], 1: held[1]}
+
+
+async def test_removed_connection_frees_slot(nursery, small_pool):
+    """It lets a waiting caller spawn a connection when one is removed."""
+    first = await small_pool.wait_for_connection()
+    second = await small_pool.wait_for_connection()
+    received = []
+
+    async def wait():
+        received.append(await small_pool.wait_for_connection())
+
+    nursery.start_soon(wait)
+    await trio.testing.wait_all_tasks_blocked()
+    small_pool.remove_connection(first)
+    await trio.testing.wait_all_tasks_blocked()
+
+    assert len(received) == 1 and received[0] not in (first, second)
+    assert small_pool.size == small_pool.max_connections
+
+
+async def test_checkout_timeout(autojump_clock, small_pool):
+    """It raises TooSlowError when no connection is available in time."""
+    small_pool.checkout_timeout = 3
+    for _ in range(small_pool.max_connections):
+        await small_pool.wait_for_connection()
+
+    with pytest.raises(trio.TooSlowError):
+        await small_pool.wait_for_connection()
+
+    assert small_pool.waiting == 0
+    assert small_pool.wait_time == pytest.approx(3)
+
+
+@pytest.fixture
+def slow_pool():
+    """A ConnectionPool whose in-memory connections take a second to open."""
+
+    async def spawn_connection(host, port):
+        await trio.sleep(1)
+        _, client_stream = trio.testing.memory_stream_pair()
+        return client_stream
+
+    return connections.ConnectionPool(
+        "127.0.0.1", 6379, max_connections=10, spawn_connection=spawn_connection
+    )
+
+
+async def test_warmup(autojump_clock, slow_pool):
+    """It opens connections concurrently and runs the handshake on each."""
+    handshaken = []
+
+    async def on_connect(connection):
+        handshaken.append(connection)
+
+    slow_pool.on_connect = on_connect
+    start = trio.current_time()
+    assert await slow_pool.warmup(5) == 5
+
+    assert trio.current_time() - start == pytest.approx(1)
+    assert len(slow_pool.pool) == 5
+    assert set(handshaken) == set(slow_pool.pool)
+    assert slow_pool.connecting == 0
+
+
+async def test_warmup_max_connections(autojump_clock, slow_pool):
+    """It never opens more than max_connections."""
+    await slow_pool.wait_for_connection()
+    assert await slow_pool.warmup(20) == slow_pool.max_connections - 1
+    assert slow_pool.size == slow_pool.max_connections
+
+
+async def test_failed_handshake(autojump_clock, slow_pool):
+    """It frees the slot when the handshake fails."""
+
+    async def on_connect(connection):
+        raise OSError("handshake failed")
+
+    slow_pool.on_connect = on_connect
+    with pytest.raises(ConnectionError):
+        await slow_pool.warmup(3)
+    assert slow_pool.size == 0
+
+
+def test_handshake_commands():
+    """It builds HELLO with AUTH and SETNAME, or the RESP2 commands, and SELECT."""
+    pool = connections.ConnectionPool(
+        "127.0.0.1", 6379, protocol=3, password="secret", client_name="app", db=2
+    )
+    assert pool.handshake_commands() == [
+        (b"HELLO", b"3", b"AUTH", b"default", b"secret", b"SETNAME", b"app"),
+        (b"SELECT", b"2"),
+    ]
+    pool.protocol, pool.username = None, "ada"
+    assert pool.handshake_commands() == [
+        (b"AUTH", b"ada", b"secret"),
+        (b"CLIENT", b"SETNAME", b"app"),
+        (b"SELECT", b"2"),
+    ]
+    assert connections.ConnectionPool("127.0.0.1", 6379).handshake_commands() == []
+
+
+async def handshake_server(stream, writes):
+    """Record each write, answering SELECT 99 with an error and the rest with OK."""
+    reader = Resp3Reader()
+    while True:
+        data = await stream.receive_some()
+        if not data:
+            return
+        writes.append(data)
+        reader.feed(data)
+        while (command := reader.get_object()) is not reader.sentinel:
+            if command == [b"SELECT", b"99"]:
+                await stream.send_all(b"-ERR DB index is out of range\r\n")
+            else:
+                await stream.send_all(b"+OK\r\n")
+
+
+async def test_handshake(nursery):
+    """It sends the handshake and the hook commands in a single write."""
+    writes = []
+
+    async def spawn_connection(host, port):
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        nursery.start_soon(handshake_server, server_stream, writes)
+        return client_stream
+
+    pool = connections.ConnectionPool(
+        "127.0.0.1", 6379, spawn_connection=spawn_connection, protocol=3, db=1
+    )
+    pool.handshake_hooks.append(lambda: [(b"SCRIPT", b"LOAD", b"return 1")])
+    await pool.wait_for_connection()
+    assert len(writes) == 1
+    assert writes[0].count(b"*") == 3
+
+    pool.db = 99
+    with pytest.raises(ConnectionError, match="SELECT"):
+        await pool.wait_for_connection()
+    assert pool.size == 1
+
+
+async def test_hang_up_during_handshake(autojump_clock, nursery):
+    """It counts a hang-up during the handshake as a failed connection."""
+    hang_up = [False]
+
+    async def serve(stream):
+        await stream.receive_some()
+        if hang_up[0]:
+            await stream.aclose()
+        else:
+            await stream.send_all(b"%1\r\n$5\r\nproto\r\n:3\r\n")
+
+    async def spawn_connection(host, port):
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        nursery.start_soon(serve, server_stream)
+        return client_stream
+
+    pool = connections.ConnectionPool(
+        "127.0.0.1", 6379, protocol=3, min_idle=1, spawn_connection=spawn_connection
+    )
+    await nursery.start(pool.run)
+    hang_up[0] = True
+    with pytest.raises(ConnectionError):
+        await pool.warmup(2)
+    assert pool.size == 1
+
+    # run keeps going when topping up fails, and catches up once it can.
+    await pool.wait_for_connection()
+    await trio.sleep(pool.maintenance_interval * 2)
+    assert len(pool.pool) == 0
+    hang_up[0] = False
+    await trio.sleep(pool.maintenance_interval)
+    assert len(pool.pool) == 1
+
+
+async def test_run_keeps_idle_connections(autojump_clock, nursery, slow_pool):
+    """It tops the pool back up to min_idle as connections are used."""
+    slow_pool.min_idle = 3
+    await nursery.start(slow_pool.run)
+    assert len(slow_pool.pool) == 3
+
+    start = trio.current_time()
+    connection = await slow_pool.wait_for_connection()
+    assert trio.current_time() == start
+    await trio.sleep(2)
+    assert len(slow_pool.pool) == 3
+
+    slow_pool.put_connection(connection)
+    assert len(slow_pool.pool) == 4
+
+
+async def ping_server(stream):
+    """Answer PING commands until the stream is closed."""
+    while True:
+        try:
+            data = await stream.receive_some()
+        except trio.ClosedResourceError:
+            return
+        if not data:
+            return
+        await stream.send_all(b"+PONG\r\n" * data.count(b"PING"))
+
+
+@pytest.fixture
+def ping_pool(nursery):
+    """A ConnectionPool of in-memory connections to servers that answer PING.
+
+    The server end of each connection is kept in *pool.servers*.
+
+    Args:
+        nursery: The nursery the servers run in.
+
+    Returns:
+        The ConnectionPool.
+    """
+
+    async def spawn_connection(host, port):
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        nursery.start_soon(ping_server, server_stream)
+        pool.servers.append(server_stream)
+        return client_stream
+
+    pool = connections.ConnectionPool(
+        "127.0.0.1", 6379, max_connections=10, spawn_connection=spawn_connection
+    )
+    pool.servers = []
+    return pool
+
+
+async def test_evict_idle_timeout(autojump_clock, ping_pool):
+    """It closes connections idle for too long, keeping min_idle."""
+    ping_pool.min_idle = 1
+    ping_pool.idle_timeout = 10
+    await ping_pool.warmup(4)
+
+    await trio.sleep(5)
+    assert await ping_pool.evict() == 0
+    await trio.sleep(5)
+    assert await ping_pool.evict() == 3
+    assert len(ping_pool.pool) == 1 and ping_pool.size == 1
+
+
+async def test_max_lifetime(autojump_clock, ping_pool):
+    """It never hands out a connection past its max lifetime."""
+    ping_pool.max_lifetime = 10
+    old = await ping_pool.wait_for_connection()
+    await trio.sleep(10)
+    ping_pool.put_connection(old)
+
+    connection = await ping_pool.wait_for_connection()
+    assert connection is not old
+    assert ping_pool.size == 1
+
+
+async def test_evict_broken(autojump_clock, ping_pool):
+    """It closes idle connections that no longer answer PING."""
+    ping_pool.health_check_interval = 5
+    await ping_pool.warmup(2)
+    broken = ping_pool.pool[0]
+    await ping_pool.servers[0].aclose()
+
+    await trio.sleep(5)
+    assert await ping_pool.evict() == 1
+    assert broken not in ping_pool.pool
+    assert len(ping_pool.pool) == 1 and ping_pool.size == 1
+
+
+async def test_run_shrinks_pool(autojump_clock, nursery, ping_pool):
+    """It evicts idle connections in the background."""
+    ping_pool.idle_timeout = 10
+    held = [await ping_pool.wait_for_connection() for _ in range(5)]
+    await nursery.start(ping_pool.run)
+    for connection in held:
+        ping_pool.put_connection(connection)
+
+    await trio.sleep(12)
+    assert ping_pool.size == 0
+
+
+async def test_reset(autojump_clock, ping_pool):
+    """It closes idle connections and retires the used ones when put back."""
+    await ping_pool.warmup(2)
+    used = await ping_pool.wait_for_connection()
+
+    assert await ping_pool.reset("10.0.0.2", 6380) == 1
+    assert ping_pool.pool == [] and ping_pool.size == 1
+    assert (ping_pool.host, ping_pool.port) == ("10.0.0.2", 6380)
+
+    ping_pool.put_connection(used)
+    assert ping_pool.size == 0
+    assert await ping_pool.evict() == 1
+    connection = await ping_pool.wait_for_connection()
+    assert connection is not used
+    assert connection.generation == ping_pool.generation == 1
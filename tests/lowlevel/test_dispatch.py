@@ -0,0 +1,84 @@
+"""Tests for dispatching pushes to worker tasks."""
+
+import trio
+import trio.testing
+
+from redtrio.lowlevel import connections
+from redtrio.lowlevel import PushDispatcher
+from redtrio.lowlevel import RedisClient
+
+PUSH = b">2\r\n$7\r\nmessage\r\n$5\r\nhello\r\n"
+
+
+async def connect(client):
+    """Return a connection to an in-memory server, and the server's stream."""
+    server_stream, client_stream = trio.testing.memory_stream_pair()
+    return connections.Connection(client_stream, client.Reader()), server_stream
+
+
+async def test_async_callback_without_dispatcher():
+    """It awaits async callbacks before returning the reply."""
+    client = RedisClient()
+    connection, server = await connect(client)
+    received = []
+
+    async def callback(push):
+        await trio.sleep(0)
+        received.append(push.data)
+
+    client.register_push_callback(b"message", callback)
+    await server.send_all(PUSH + b"+PONG\r\n")
+    assert await client.receive(connection) == b"PONG"
+    assert received == [[b"hello"]]
+
+
+async def test_slow_callback_does_not_block(autojump_clock):
+    """It returns the reply without waiting for a slow callback."""
+    client = RedisClient()
+    connection, server = await connect(client)
+    received = []
+
+    async def callback(push):
+        await trio.sleep(10)
+        received.append(trio.current_time())
+
+    client.register_push_callback(b"message", callback)
+    async with PushDispatcher(client) as dispatcher:
+        start = trio.current_time()
+        await server.send_all(PUSH + b"+PONG\r\n")
+        assert await client.receive(connection) == b"PONG"
+        assert trio.current_time() == start
+        assert received == []
+
+    # The idle worker took the push straight away, so it never waited in the queue.
+    assert received == [start + 10]
+    assert dispatcher.stats == {
+        "queue_depth": 0,
+        "max_queue_depth": 0,
+        "dispatched": 1,
+        "handled": 1,
+        "dropped": 0,
+    }
+    assert client.push_dispatcher is None
+
+
+async def test_full_queue_drops(autojump_clock):
+    """It drops pushes once the queue is full, and counts them."""
+    client = RedisClient()
+    connection, server = await connect(client)
+    release = trio.Event()
+
+    async def callback(push):
+        await release.wait()
+
+    client.register_push_callback(b"message", callback)
+    async with PushDispatcher(client, workers=1, queue_size=2) as dispatcher:
+        await server.send_all(PUSH * 5 + b"+PONG\r\n")
+        await trio.testing.wait_all_tasks_blocked()
+        assert await client.receive(connection) == b"PONG"
+        assert dispatcher.queue_depth == 2
+        assert dispatcher.dropped == 2
+        assert dispatcher.max_queue_depth == 2
+        release.set()
+
+    assert dispatcher.handled == 3
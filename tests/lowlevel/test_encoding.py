@@ -0,0 +1,97 @@
+"""Tests for encoding commands without copying large arguments."""
+
+import array
+
+import pytest
+from respy3.protocol import write_command
+import trio
+
+from redtrio.lowlevel import connections
+from redtrio.lowlevel import encoding
+from redtrio.lowlevel import RedisClient
+
+
+def test_small_args_joined():
+    """It joins small args into a single chunk, like write_command."""
+    chunks = encoding.write_command_chunks(b"SET", b"key", b"value")
+    assert chunks == [write_command(b"SET", b"key", b"value")]
+
+
+def test_large_args_passed_through():
+    """It passes large args through as they are, without copying them."""
+    value = memoryview(bytearray(b"x" * 100))
+    chunks = encoding.write_command_chunks(b"SET", b"key", value, threshold=50)
+
+    assert len(chunks) == 3
+    assert chunks[1] is value
+    assert b"".join(chunks) == write_command(b"SET", b"key", bytes(value))
+
+
+def test_coalesce():
+    """It joins runs of small chunks and keeps large ones."""
+    large = b"x" * 10
+    chunks = encoding.coalesce([b"a", b"b", large, b"c", b"d"], threshold=5)
+    assert chunks == [b"ab", large, b"cd"]
+    assert chunks[1] is large
+
+
+async def test_send_large_value():
+    """It sends large values in separate writes, with the same bytes on the wire."""
+    sent = []
+
+    class RecordingStream(trio.abc.Stream):
+        async def send_all(self, data):
+            sent.append(data)
+
+        async def wait_send_all_might_not_block(self):
+            pass
+
+        async def receive_some(self, max_bytes=None):
+            return b""
+
+        async def aclose(self):
+            pass
+
+    stream = RecordingStream()
+    client = RedisClient(large_value_threshold=1024)
+    value = bytearray(b"x" * 4096)
+    connection = connections.Connection(stream, client.Reader())
+    await client.send_command(b"SET", b"key", value, connection=connection)
+
+    assert any(chunk is value for chunk in sent)
+    assert b"".join(sent) == write_command(b"SET", b"key", bytes(value))
+
+
+def test_encode_arg():
+    """It converts str, int and float args, and passes bytes-like args through."""
+    value = bytearray(b"value")
+    view = memoryview(b"view")
+    assert encoding.encode_arg("ключ") == "ключ".encode()
+    assert encoding.encode_arg(value) is value
+    assert encoding.encode_arg(view) is view
+    assert encoding.encode_arg(7) is encoding.encode_arg(7) == b"7"
+    assert encoding.encode_arg(-(2**70)) == b"-1180591620717411303424"
+    assert encoding.encode_arg(0.1) == b"0.1"
+    assert encoding.encode_arg(float("-inf")) == b"-inf"
+    assert encoding.encode_arg(True) == b"1"
+
+    wide = memoryview(array.array("H", [1, 2]))
+    assert encoding.encode_arg(wide).nbytes == len(encoding.encode_arg(wide)) == 4
+    with pytest.raises(TypeError):
+        encoding.encode_arg(None)
+
+
+def test_prepared_command():
+    """It encodes the same bytes as write_command, reusing the prefix."""
+    hget = encoding.prepare(b"HGET", 2)
+    assert hget is encoding.prepare(b"HGET", 2)
+    assert hget.prefix == b"*3\r\n$4\r\nHGET\r\n"
+    assert hget.encode(b"key", memoryview(b"field")) == write_command(
+        b"HGET", b"key", b"field"
+    )
+    assert encoding.write_command(b"PING") == write_command(b"PING")
+    assert encoding.write_command(b"MSET", b"a", b"1", b"b", b"") == write_command(
+        b"MSET", b"a", b"1", b"b", b""
+    )
+    with pytest.raises(TypeError):
+        hget.encode(b"key")
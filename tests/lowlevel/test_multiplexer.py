@@ -0,0 +1,117 @@
+"""Tests for the multiplexer."""
+
+import pytest
+import trio
+import trio.testing
+
+from redtrio.lowlevel import Multiplexer
+from redtrio.lowlevel import RedisClient
+from redtrio.lowlevel.encoding import prepare
+
+
+@pytest.fixture
+async def client():
+    """A fresh client instance for every test, with an empty database."""
+    client = RedisClient()
+    await client.call(b"FLUSHALL")
+    return client
+
+
+async def test_concurrent_calls(client):
+    """It matches every reply to the caller that sent the command."""
+    results = {}
+
+    async def set_and_get(i):
+        key = b"multiplexer_key%d" % i
+        await client.call(b"SET", key, b"%d" % i)
+        results[i] = await client.call(b"GET", key)
+
+    async with Multiplexer(client, connections=2):
+        async with trio.open_nursery() as nursery:
+            for i in range(200):
+                nursery.start_soon(set_and_get, i)
+
+    assert results == {i: b"%d" % i for i in range(200)}
+
+
+async def test_call_prepared(client):
+    """It sends prepared commands through the multiplexer too."""
+    get = prepare(b"GET", 1)
+    await client.call(b"SET", b"multiplexer_prepared", b"value")
+    assert await client.call_prepared(get, b"multiplexer_prepared") == b"value"
+    async with Multiplexer(client, connections=1) as multiplexer:
+        assert await client.call_prepared(get, b"multiplexer_prepared") == b"value"
+        assert not multiplexer.channels[0].waiting
+
+
+async def test_connection_count(client):
+    """It only uses the connections it was asked to use."""
+    async with Multiplexer(client, connections=2) as multiplexer:
+        assert client.multiplexer is multiplexer
+        assert len(client.connection_pool.used_connections) == 2
+        async with trio.open_nursery() as nursery:
+            for _ in range(200):
+                nursery.start_soon(client.call, b"INCR", b"multiplexer_counter")
+        assert len(client.connection_pool.used_connections) == 2
+
+    assert client.multiplexer is None
+    assert not client.connection_pool.used_connections
+    assert await client.call(b"GET", b"multiplexer_counter") == b"200"
+
+
+async def test_connection_closed(nursery):
+    """It fails the outstanding calls when Redis closes the connection."""
+    server_socket, client_socket = trio.testing.memory_stream_pair()
+
+    async def spawn_connection(host, port):
+        return client_socket
+
+    client = RedisClient()
+    client.connection_pool.spawn_connection = spawn_connection
+
+    async def close_connection():
+        await server_socket.receive_some()
+        await server_socket.aclose()
+
+    nursery.start_soon(close_connection)
+    async with Multiplexer(client):
+        with pytest.raises(trio.BrokenResourceError):
+            await client.call(b"PING")
+
+
+async def test_reconnect(autojump_clock, nursery):
+    """It reconnects until it can, failing the calls queued in the meantime."""
+    attempts = []
+
+    async def serve(stream, first):
+        replies = 0
+        while True:
+            data = await stream.receive_some()
+            if not data or (first and replies):
+                await stream.aclose()
+                return
+            await stream.send_all(b"+PONG\r\n" * data.count(b"PING"))
+            if first:
+                # A reply nobody asked for, which is dropped.
+                await stream.send_all(b"+stray\r\n")
+            replies += 1
+
+    async def spawn_connection(host, port):
+        attempts.append(trio.current_time())
+        if len(attempts) in (2, 3):
+            raise OSError("Connection refused")
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        nursery.start_soon(serve, server_stream, len(attempts) == 1)
+        return client_stream
+
+    client = RedisClient(spawn_connection=spawn_connection)
+    async with Multiplexer(client):
+        assert await client.call(b"PING") == b"PONG"
+        await trio.testing.wait_all_tasks_blocked()
+        with pytest.raises(trio.BrokenResourceError):
+            await client.call(b"PING")
+        with pytest.raises(OSError):
+            await client.call(b"PING")
+        await trio.sleep(5)
+        assert await client.call(b"PING") == b"PONG"
+    assert len(attempts) == 4
@@ -0,0 +1,79 @@
+"""Tests for the pipeline."""
+
+import pytest
+from respy3.protocol import RedisError
+import trio
+import trio.testing
+
+from redtrio.lowlevel import Pipeline
+from redtrio.lowlevel import RedisClient
+
+
+@pytest.fixture
+async def client():
+    """A fresh client instance for every test, with an empty database."""
+    client = RedisClient()
+    await client.call(b"FLUSHALL")
+    return client
+
+
+async def test_execute(client):
+    """It returns the replies in the order the commands were queued."""
+    pipeline = Pipeline(client)
+    pipeline.queue(b"SET", b"pipeline_key", b"1").queue(b"INCR", b"pipeline_key")
+    pipeline.queue(b"GET", b"pipeline_key")
+    assert len(pipeline) == 3
+
+    result = await pipeline.execute()
+    assert result == [b"OK", 2, b"2"]
+    assert len(pipeline) == 0
+
+
+async def test_execute_empty(client):
+    """It returns an empty list without using a connection."""
+    pool_size = len(client.connection_pool.pool)
+    assert await Pipeline(client).execute() == []
+    assert not client.connection_pool.used_connections
+    assert len(client.connection_pool.pool) == pool_size
+
+
+async def test_errors_in_position(client):
+    """It places errors at the position of the command that caused them."""
+    pipeline = Pipeline(client)
+    pipeline.queue(b"SET", b"pipeline_key", b"not a number")
+    pipeline.queue(b"INCR", b"pipeline_key")
+    pipeline.queue(b"PING")
+
+    ok, error, pong = await pipeline.execute()
+    assert ok == b"OK"
+    assert isinstance(error, RedisError)
+    assert pong == b"PONG"
+
+
+async def test_single_connection(client):
+    """It sends everything on one connection and returns it to the pool."""
+    pipeline = Pipeline(client)
+    for i in range(100):
+        pipeline.queue(b"HSET", b"pipeline_hash", b"field%d" % i, b"%d" % i)
+
+    assert await pipeline.execute() == [1] * 100
+    assert len(client.connection_pool.pool) == 1
+    assert not client.connection_pool.used_connections
+    assert await client.call(b"HLEN", b"pipeline_hash") == 100
+
+
+async def test_interrupted_execute(autojump_clock):
+    """It closes the connection if execute is cancelled with replies unread."""
+    streams = []
+
+    async def spawn_connection(host, port):
+        _, client_stream = trio.testing.memory_stream_pair()
+        streams.append(client_stream)
+        return client_stream
+
+    client = RedisClient(spawn_connection=spawn_connection)
+    with trio.move_on_after(1):
+        await Pipeline(client).queue(b"PING").execute()
+    assert client.connection_pool.size == 0
+    with pytest.raises(trio.ClosedResourceError):
+        await streams[0].send_all(b"PING")
@@ -0,0 +1,264 @@
+"""Tests for receiving Pub/Sub messages."""
+
+import fnmatch
+
+import pytest
+from respy3.protocol import Resp3Reader
+import trio
+import trio.testing
+
+from redtrio.lowlevel import PubSub
+from redtrio.lowlevel import RedisClient
+from redtrio.lowlevel.pubsub import Message
+
+
+def encode(value: bytes) -> bytes:
+    """Encode a bulk string."""
+    return b"$%d\r\n%b\r\n" % (len(value), value)
+
+
+class PubSubServer:
+    """A fake Redis server supporting HELLO and the Pub/Sub commands.
+
+    Attributes:
+        streams (list): The server end of each open connection.
+        channels (dict): The channels each connection is subscribed to.
+        patterns (dict): The patterns each connection is subscribed to.
+        commands (list): Every command received.
+        unconfirmed (set): Channels and patterns subscribed to without replying.
+    """
+
+    def __init__(self):
+        """Initialize the PubSubServer."""
+        self.streams = []
+        self.channels = {}
+        self.patterns = {}
+        self.commands = []
+        self.unconfirmed = set()
+
+    async def spawn_connection(self, host, port):
+        """Connect a new in-memory connection to the server."""
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        self.nursery.start_soon(self.serve, server_stream)
+        return client_stream
+
+    async def serve(self, stream):
+        """Handle the commands sent on one connection."""
+        self.streams.append(stream)
+        self.channels[stream], self.patterns[stream] = set(), set()
+        reader = Resp3Reader()
+        while True:
+            command = reader.get_object()
+            if command is reader.sentinel:
+                try:
+                    data = await stream.receive_some()
+                except (trio.ClosedResourceError, trio.BrokenResourceError):
+                    data = b""
+                if not data:
+                    self.streams.remove(stream)
+                    return
+                reader.feed(data)
+                continue
+
+            self.commands.append(command)
+            name, *args = command
+            subscribed = self.patterns if name.startswith(b"P") else self.channels
+            if name == b"HELLO":
+                await stream.send_all(b"%1\r\n$5\r\nproto\r\n:3\r\n")
+            elif name in (b"SUBSCRIBE", b"PSUBSCRIBE"):
+                for arg in args:
+                    subscribed[stream].add(arg)
+                    if arg in self.unconfirmed:
+                        continue
+                    await stream.send_all(
+                        b">3\r\n"
+                        + encode(name.lower())
+                        + encode(arg)
+                        + b":%d\r\n" % len(subscribed[stream])
+                    )
+            elif name in (b"UNSUBSCRIBE", b"PUNSUBSCRIBE"):
+                for arg in args:
+                    subscribed[stream].discard(arg)
+
+    async def publish(self, channel: bytes, data: bytes) -> None:
+        """Send a message to every connection subscribed to the channel."""
+        for stream in self.streams:
+            if channel in self.channels[stream]:
+                push = b">3\r\n" + encode(b"message") + encode(channel) + encode(data)
+                await stream.send_all(push)
+            for pattern in self.patterns[stream]:
+                if fnmatch.fnmatchcase(channel.decode(), pattern.decode()):
+                    push = (
+                        b">4\r\n"
+                        + encode(b"pmessage")
+                        + encode(pattern)
+                        + encode(channel)
+                        + encode(data)
+                    )
+                    await stream.send_all(push)
+        await trio.testing.wait_all_tasks_blocked()
+
+
+@pytest.fixture
+def server(nursery):
+    """A PubSubServer running in the test's nursery."""
+    server = PubSubServer()
+    server.nursery = nursery
+    return server
+
+
+@pytest.fixture
+def client(server):
+    """A RedisClient connected to the PubSubServer."""
+    client = RedisClient()
+    client.connection_pool.spawn_connection = server.spawn_connection
+    return client
+
+
+async def test_subscribe(client, server):
+    """It delivers channel and pattern messages to their subscriptions."""
+    async with PubSub(client) as pubsub:
+        news = await pubsub.subscribe(b"news")
+        everything = await pubsub.psubscribe(b"n*")
+        await server.publish(b"news", b"hello")
+        await server.publish(b"nothing", b"ignored")
+
+        assert await news.receive() == Message(b"news", b"hello")
+        assert await everything.receive() == Message(b"news", b"hello", b"n*")
+        assert await everything.receive() == Message(b"nothing", b"ignored", b"n*")
+        assert client.connection_pool.size == 0
+
+
+async def test_shared_channel(client, server):
+    """It only unsubscribes once the last subscription to a channel is closed."""
+    async with PubSub(client) as pubsub:
+        first = await pubsub.subscribe(b"news")
+        second = await pubsub.subscribe(b"news")
+        await server.publish(b"news", b"hello")
+        assert (await first.receive()).data == b"hello"
+        assert (await second.receive()).data == b"hello"
+
+        await first.aclose()
+        assert [b"UNSUBSCRIBE", b"news"] not in server.commands
+        await second.aclose()
+        await trio.testing.wait_all_tasks_blocked()
+        assert [b"UNSUBSCRIBE", b"news"] in server.commands
+        assert server.commands.count([b"SUBSCRIBE", b"news"]) == 1
+
+
+async def test_async_for_ends_on_exit(client, server):
+    """It ends every subscription's iteration when the PubSub is closed."""
+    received = []
+
+    async def consume(subscription):
+        async for message in subscription:
+            received.append(message.data)
+
+    async with trio.open_nursery() as nursery:
+        async with PubSub(client) as pubsub:
+            nursery.start_soon(consume, await pubsub.subscribe(b"news"))
+            await server.publish(b"news", b"1")
+            await server.publish(b"news", b"2")
+
+    assert received == [b"1", b"2"]
+
+
+async def test_overflow_block(client, server):
+    """It stops reading until a slow subscriber catches up, losing nothing."""
+    async with PubSub(client, buffer_size=1) as pubsub:
+        subscription = await pubsub.subscribe(b"news")
+        for data in (b"1", b"2", b"3"):
+            await server.publish(b"news", data)
+        received = [(await subscription.receive()).data for _ in range(3)]
+        assert received == [b"1", b"2", b"3"]
+
+
+async def test_blocked_subscriber_closed(autojump_clock, client, server):
+    """It drops a subscriber closed while blocking, keeping the connection."""
+    async with PubSub(client, buffer_size=1) as pubsub:
+        slow = await pubsub.subscribe(b"news")
+        other = await pubsub.subscribe(b"other")
+        await server.publish(b"news", b"1")
+        await server.publish(b"news", b"2")
+        connection = pubsub.connection
+
+        await slow.aclose()
+        await trio.testing.wait_all_tasks_blocked()
+        await server.publish(b"other", b"hello")
+        with trio.fail_after(5):
+            assert (await other.receive()).data == b"hello"
+        assert pubsub.connection is connection
+        assert b"news" not in pubsub.channels
+
+
+async def test_cancelled_subscribe(autojump_clock, client, server):
+    """It undoes a subscribe cancelled before or after it was sent."""
+    async with PubSub(client, buffer_size=1) as pubsub:
+        with trio.CancelScope() as scope:
+            scope.cancel()
+            await pubsub.subscribe(b"news")
+        assert pubsub.channels == {}
+        with trio.fail_after(5):
+            news = await pubsub.subscribe(b"news")
+
+        server.unconfirmed.add(b"sports")
+        with trio.move_on_after(1):
+            await pubsub.subscribe(b"sports")
+        await trio.testing.wait_all_tasks_blocked()
+        assert b"sports" not in pubsub.channels
+        assert server.commands[-1] == [b"UNSUBSCRIBE", b"sports"]
+
+        for data in (b"1", b"2"):
+            await server.publish(b"sports", data)
+        await server.publish(b"news", b"hello")
+        with trio.fail_after(5):
+            assert (await news.receive()).data == b"hello"
+
+
+async def test_overflow_drop_oldest(client, server):
+    """It drops the oldest buffered messages to make room for new ones."""
+    async with PubSub(client, buffer_size=2, overflow="drop-oldest") as pubsub:
+        subscription = await pubsub.subscribe(b"news")
+        for data in (b"1", b"2", b"3", b"4", b"5"):
+            await server.publish(b"news", data)
+
+        assert (await subscription.receive()).data == b"4"
+        assert (await subscription.receive()).data == b"5"
+        assert subscription.dropped == 3
+
+
+async def test_overflow_disconnect(client, server):
+    """It closes a subscription that falls behind, without affecting others."""
+    async with PubSub(client, buffer_size=1) as pubsub:
+        slow = await pubsub.subscribe(b"news", overflow="disconnect")
+        fast = await pubsub.subscribe(b"news", buffer_size=10)
+        for data in (b"1", b"2", b"3"):
+            await server.publish(b"news", data)
+
+        assert (await slow.receive()).data == b"1"
+        with pytest.raises(trio.BrokenResourceError):
+            await slow.receive()
+        assert slow.overflowed
+        assert [(await fast.receive()).data for _ in range(3)] == [b"1", b"2", b"3"]
+        assert pubsub.channels[b"news"] == [fast]
+
+
+async def test_resubscribe(autojump_clock, client, server):
+    """It reconnects and subscribes again when the connection is lost."""
+    async with PubSub(client) as pubsub:
+        subscription = await pubsub.psubscribe(b"news.*")
+        await server.streams[0].aclose()
+        await trio.sleep(2)
+
+        assert server.commands.count([b"PSUBSCRIBE", b"news.*"]) == 2
+        await server.publish(b"news.today", b"hello")
+        assert (await subscription.receive()).data == b"hello"
+
+
+def test_bad_overflow():
+    """It raises ValueError for unknown or unusable overflow policies."""
+    client = RedisClient()
+    with pytest.raises(ValueError):
+        PubSub(client, overflow="explode")
+    with pytest.raises(ValueError):
+        PubSub(client, buffer_size=0, overflow="drop-oldest")
@@ -0,0 +1,95 @@
+"""Tests for the raw, pairs and decoding readers."""
+
+from respy3.protocol import RedisError
+from respy3.protocol import RespPush
+
+from redtrio.lowlevel import DecodingReader
+from redtrio.lowlevel import PairsReader
+from redtrio.lowlevel import RawReader
+from redtrio.lowlevel import RedisClient
+
+FRAMES = [
+    b"+OK\r\n",
+    b"$5\r\nhe\r\nl\r\n",
+    b"$-1\r\n",
+    b"*-1\r\n",
+    b"*2\r\n:1\r\n*1\r\n_\r\n",
+    b"%2\r\n$1\r\na\r\n~1\r\n,1.5\r\n+b\r\n=7\r\ntxt:abc\r\n",
+    b"|1\r\n+ttl\r\n:3\r\n$1\r\nv\r\n",
+]
+
+
+def read_all(reader, data: bytes, step: int) -> list:
+    """Feed *data* to a reader *step* bytes at a time, and return every object."""
+    objects = []
+    for i in range(0, len(data), step):
+        reader.feed(data[i : i + step])
+        while (output := reader.get_object()) is not reader.sentinel:
+            objects.append(output)
+    return objects
+
+
+def test_raw_frames():
+    """It returns each frame as it was received, however the data is split."""
+    for step in (1, 3, 1000):
+        frames = read_all(RawReader(), b"".join(FRAMES), step)
+        assert [bytes(frame) for frame in frames] == FRAMES
+        assert all(frame.readonly for frame in frames)
+
+
+def test_raw_errors_and_pushes():
+    """It parses errors and pushes, and keeps frames valid after more data."""
+    reader = RawReader()
+    reader.feed(b"-ERR bad\r\n>2\r\n$10\r\ninvalidate\r\n_\r\n:1\r\n:2")
+    assert reader.get_object() == RedisError(b"ERR", b"bad")
+    push = reader.get_object()
+    assert isinstance(push, RespPush)
+    assert push.push_type == b"invalidate"
+    frame = reader.get_object()
+    assert reader.get_object() is reader.sentinel
+
+    reader.feed(b"\r\n")
+    assert bytes(reader.get_object()) == b":2\r\n"
+    assert bytes(frame) == b":1\r\n"
+
+
+def test_pairs_reader():
+    """It parses maps into flat lists, resuming after more data is fed."""
+    data = b"%2\r\n$1\r\na\r\n:1\r\n$1\r\na\r\n%1\r\n+b\r\n:2\r\n"
+    for step in (1, 1000):
+        assert read_all(PairsReader(), data, step) == [[b"a", 1, b"a", [b"b", 2]]]
+
+
+def test_decoding_reader():
+    """It decodes strings, except in errors and pushes."""
+    data = (
+        b"+OK\r\n$5\r\n\xc3\xa9t\xc3\xa9\r\n=7\r\ntxt:abc\r\n%1\r\n$1\r\nk\r\n*1\r\n+v\r\n"
+        b"-ERR bad\r\n>2\r\n$7\r\nmessage\r\n$2\r\n\xff\xfe\r\n"
+    )
+    for step in (1, 1000):
+        objects = read_all(DecodingReader(), data, step)
+        assert objects[:4] == ["OK", "été", "abc", {"k": ["v"]}]
+        assert objects[4] == RedisError(b"ERR", b"bad")
+        assert (objects[5].push_type, objects[5].data) == (b"message", [b"\xff\xfe"])
+
+
+async def test_reply_modes():
+    """Each reader can be used by a client, with working health checks."""
+    setup = RedisClient()
+    await setup.call(b"DEL", b"readers_hash")
+    await setup.call(b"HSET", b"readers_hash", b"field", b"value")
+
+    raw = RedisClient(Reader=RawReader, protocol=3, health_check_interval=0)
+    reply = await raw.call(b"HGETALL", b"readers_hash")
+    assert bytes(reply) == b"%1\r\n$5\r\nfield\r\n$5\r\nvalue\r\n"
+    assert isinstance(await raw.call(b"NOTACOMMAND"), RedisError)
+
+    pairs = RedisClient(Reader=PairsReader, protocol=3)
+    assert await pairs.call(b"HGETALL", b"readers_hash") == [b"field", b"value"]
+
+    decoding = RedisClient(Reader=DecodingReader, protocol=3, health_check_interval=0)
+    assert await decoding.call(b"HGETALL", b"readers_hash") == {"field": "value"}
+
+    for client in (raw, decoding):
+        assert await client.connection_pool.evict() == 0
+        assert len(client.connection_pool.pool) == 1
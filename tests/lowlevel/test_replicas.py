@@ -0,0 +1,127 @@
+"""Tests for sending reads to replicas."""
+
+import pytest
+from respy3.protocol import Resp3Reader
+import trio
+import trio.testing
+
+from redtrio.lowlevel import ReplicaClient
+
+PRIMARY = ("primary", 6379)
+REPLICAS = [("replica1", 6379), ("replica2", 6379)]
+
+
+class FakeNodes:
+    """Fake nodes that answer GET with their own host, and anything else with OK.
+
+    Attributes:
+        down (set): The hosts that refuse connections.
+        loading (set): The hosts that answer LOADING.
+        slow (set): The hosts that wait for *release* before answering.
+        release (trio.Event): Lets the slow hosts answer.
+    """
+
+    def __init__(self, nursery):
+        """Initialize the FakeNodes."""
+        self.nursery = nursery
+        self.down = set()
+        self.loading = set()
+        self.slow = set()
+        self.release = trio.Event()
+
+    async def spawn_connection(self, host, port):
+        """Connect a new in-memory connection to a node."""
+        if host in self.down:
+            raise OSError(f"Connection refused by {host}")
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        self.nursery.start_soon(self.serve, server_stream, host)
+        return client_stream
+
+    async def serve(self, stream, host):
+        """Handle the commands sent on one connection."""
+        reader = Resp3Reader()
+        while True:
+            command = reader.get_object()
+            if command is reader.sentinel:
+                data = await stream.receive_some()
+                if not data:
+                    return
+                reader.feed(data)
+                continue
+
+            if host in self.slow:
+                await self.release.wait()
+            if host in self.loading:
+                await stream.send_all(b"-LOADING Redis is loading the dataset\r\n")
+            elif command[0] == b"GET":
+                await stream.send_all(b"$%d\r\n%b\r\n" % (len(host), host.encode()))
+            else:
+                await stream.send_all(b"+OK\r\n")
+
+
+@pytest.fixture
+def nodes(nursery):
+    """The fake nodes, running in the test's nursery."""
+    return FakeNodes(nursery)
+
+
+def make_client(nodes, **client_args):
+    """Create a ReplicaClient connected to the fake nodes."""
+    return ReplicaClient(
+        PRIMARY, REPLICAS, spawn_connection=nodes.spawn_connection, **client_args
+    )
+
+
+async def test_round_robin(nodes):
+    """It takes the replicas in turn for reads, and sends writes to the primary."""
+    client = make_client(nodes)
+    assert await client.call(b"SET", b"key", b"value") == b"OK"
+    replies = [await client.call(b"GET", b"key") for _ in range(4)]
+    assert replies == [b"replica1", b"replica2", b"replica1", b"replica2"]
+    assert client.primary.connection_pool.size == 1
+
+
+async def test_least_outstanding(nursery, nodes):
+    """It sends reads to the replica with the fewest commands in flight."""
+    client = make_client(nodes, balance="least-outstanding")
+    nodes.slow.add("replica1")
+    replies = []
+
+    async def get():
+        replies.append(await client.call(b"GET", b"key"))
+
+    nursery.start_soon(get)
+    await trio.testing.wait_all_tasks_blocked()
+    assert client.outstanding[client.replicas[0]] == 1
+
+    for _ in range(3):
+        await get()
+    assert replies == [b"replica2"] * 3
+
+    nodes.release.set()
+    await trio.testing.wait_all_tasks_blocked()
+    assert replies[-1] == b"replica1"
+
+
+async def test_unhealthy_replicas(autojump_clock, nodes):
+    """It takes failing replicas out of rotation, and tries them again later."""
+    client = make_client(nodes, retry_interval=5)
+    nodes.down.add("replica1")
+    assert [await client.call(b"GET", b"key") for _ in range(2)] == [b"replica2"] * 2
+    assert client.available == [client.replicas[1]]
+
+    nodes.loading.add("replica2")
+    assert await client.call(b"GET", b"key") == b"primary"
+    assert client.available == []
+
+    nodes.down.clear()
+    nodes.loading.clear()
+    await trio.sleep(5)
+    assert len(client.available) == 2
+    assert await client.call(b"GET", b"key") in (b"replica1", b"replica2")
+
+
+def test_bad_balance():
+    """It raises ValueError for unknown balance policies."""
+    with pytest.raises(ValueError):
+        ReplicaClient(PRIMARY, REPLICAS, balance="random")
@@ -0,0 +1,187 @@
+"""Tests for finding the master through Redis Sentinel."""
+
+import pytest
+from respy3.protocol import Resp3Reader
+import trio
+import trio.testing
+
+from redtrio.lowlevel import DecodingReader
+from redtrio.lowlevel import PairsReader
+from redtrio.lowlevel import RawReader
+from redtrio.lowlevel import RedisClient
+from redtrio.lowlevel import SentinelPool
+
+SENTINELS = [("127.0.0.1", 26379), ("127.0.0.1", 26380)]
+
+
+def encode(value: bytes) -> bytes:
+    """Encode a bulk string."""
+    return b"$%d\r\n%b\r\n" % (len(value), value)
+
+
+class FakeSentinels:
+    """Fake sentinels monitoring "mymaster", and fake masters answering PING.
+
+    Attributes:
+        master (tuple): The (host, port) of the current master.
+        down (set): The addresses that refuse connections.
+        subscribers (list): The sentinel streams subscribed to +switch-master.
+        opened (list): The address of every master connection opened.
+    """
+
+    def __init__(self, nursery):
+        """Initialize the FakeSentinels."""
+        self.nursery = nursery
+        self.master = ("10.0.0.1", 6379)
+        self.down = set()
+        self.subscribers = []
+        self.opened = []
+
+    async def spawn_connection(self, host, port):
+        """Connect a new in-memory connection to a sentinel or a master."""
+        if (host, port) in self.down:
+            raise OSError(f"Connection refused by {host}:{port}")
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        if (host, port) not in SENTINELS:
+            self.opened.append((host, port))
+        self.nursery.start_soon(self.serve, server_stream)
+        return client_stream
+
+    async def serve(self, stream):
+        """Handle the commands sent on one connection."""
+        reader = Resp3Reader()
+        while True:
+            command = reader.get_object()
+            if command is reader.sentinel:
+                try:
+                    data = await stream.receive_some()
+                except (trio.ClosedResourceError, trio.BrokenResourceError):
+                    data = b""
+                if not data:
+                    if stream in self.subscribers:
+                        self.subscribers.remove(stream)
+                    return
+                reader.feed(data)
+                continue
+
+            name, *args = command
+            if name == b"HELLO":
+                await stream.send_all(b"%1\r\n$5\r\nproto\r\n:3\r\n")
+            elif name == b"PING":
+                await stream.send_all(b"+PONG\r\n")
+            elif name == b"SENTINEL":
+                if args[1] == b"mymaster":
+                    host, port = self.master
+                    reply = b"*2\r\n" + encode(host.encode()) + encode(b"%d" % port)
+                    await stream.send_all(reply)
+                else:
+                    await stream.send_all(b"_\r\n")
+            elif name == b"SUBSCRIBE":
+                self.subscribers.append(stream)
+                await stream.send_all(
+                    b">3\r\n" + encode(b"subscribe") + encode(args[0]) + b":1\r\n"
+                )
+
+    async def failover(self, host, port):
+        """Switch to a new master, and tell the subscribers about it."""
+        old_host, old_port = self.master
+        self.master = (host, port)
+        message = b"mymaster %b %d %b %d" % (
+            old_host.encode(),
+            old_port,
+            host.encode(),
+            port,
+        )
+        for stream in self.subscribers:
+            await stream.send_all(
+                b">3\r\n"
+                + encode(b"message")
+                + encode(b"+switch-master")
+                + encode(message)
+            )
+        await trio.testing.wait_all_tasks_blocked()
+
+
+@pytest.fixture
+def sentinels(nursery):
+    """The fake sentinels, running in the test's nursery."""
+    return FakeSentinels(nursery)
+
+
+@pytest.fixture
+def pool(sentinels):
+    """A SentinelPool connected to the FakeSentinels."""
+    return SentinelPool(
+        "mymaster", SENTINELS, spawn_connection=sentinels.spawn_connection
+    )
+
+
+async def test_discover(pool, sentinels):
+    """It asks the next sentinel when one is down, and asks that one first."""
+    sentinels.down.add(SENTINELS[0])
+    client = RedisClient(connection_pool=pool)
+
+    assert await client.call(b"PING") == b"PONG"
+    assert (pool.host, pool.port) == ("10.0.0.1", 6379)
+    assert sentinels.opened == [("10.0.0.1", 6379)]
+    assert pool.sentinels == [SENTINELS[1], SENTINELS[0]]
+
+
+@pytest.mark.parametrize("Reader", [RawReader, PairsReader, DecodingReader])
+async def test_readers(autojump_clock, nursery, sentinels, Reader):
+    """It finds the master and follows failovers whatever the pool's reader is."""
+    pool = SentinelPool(
+        "mymaster",
+        SENTINELS,
+        Reader=Reader,
+        spawn_connection=sentinels.spawn_connection,
+    )
+    await nursery.start(pool.run)
+    assert (pool.host, pool.port) == ("10.0.0.1", 6379)
+
+    await sentinels.failover("10.0.0.2", 6379)
+    assert (pool.host, pool.port) == ("10.0.0.2", 6379)
+    client = RedisClient(connection_pool=pool)
+    assert await client.call(b"PING") in (b"PONG", "PONG", b"+PONG\r\n")
+
+
+async def test_discover_unknown(sentinels):
+    """It raises ConnectionError if no sentinel knows the master."""
+    pool = SentinelPool(
+        "unknown", SENTINELS, spawn_connection=sentinels.spawn_connection
+    )
+    with pytest.raises(ConnectionError):
+        await pool.wait_for_connection()
+    assert pool.size == 0
+
+
+async def test_failover(autojump_clock, nursery, pool, sentinels):
+    """It moves the pool to the new master as soon as a failover is announced."""
+    pool.min_idle = 2
+    await nursery.start(pool.run)
+    used = await pool.wait_for_connection()
+    await trio.testing.wait_all_tasks_blocked()
+
+    await sentinels.failover("10.0.0.2", 6379)
+    assert (pool.host, pool.port) == ("10.0.0.2", 6379)
+    assert pool.failovers == 1
+    assert len(pool.pool) == 2
+    assert all(connection.generation == pool.generation for connection in pool.pool)
+
+    pool.put_connection(used)
+    assert used not in pool.pool
+    assert sentinels.opened.count(("10.0.0.2", 6379)) == 2
+
+
+async def test_resubscribe(autojump_clock, nursery, pool, sentinels):
+    """It subscribes on the next sentinel, and catches up on missed failovers."""
+    await nursery.start(pool.run)
+    sentinels.down.add(SENTINELS[0])
+    sentinels.master = ("10.0.0.3", 6379)
+    await sentinels.subscribers[0].aclose()
+    await trio.sleep(2)
+
+    assert (pool.host, pool.port) == ("10.0.0.3", 6379)
+    assert len(sentinels.subscribers) == 1
+    await sentinels.failover("10.0.0.4", 6379)
+    assert (pool.host, pool.port) == ("10.0.0.4", 6379)
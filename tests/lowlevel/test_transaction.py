@@ -0,0 +1,107 @@
+"""Tests for MULTI/EXEC transactions."""
+
+import pytest
+from respy3.protocol import RedisError
+
+from redtrio.lowlevel import RawReader
+from redtrio.lowlevel import RedisClient
+from redtrio.lowlevel import run_transaction
+from redtrio.lowlevel import Transaction
+from redtrio.lowlevel.transaction import WatchError
+
+
+@pytest.fixture
+async def client():
+    """A fresh RESP3 client instance for every test, with an empty database."""
+    client = RedisClient(protocol=3)
+    await client.call(b"FLUSHALL")
+    return client
+
+
+async def test_execute(client):
+    """It runs the queued commands atomically and returns their replies."""
+    transaction = Transaction(client)
+    transaction.queue(b"SET", b"tx_key", b"1").queue(b"INCR", b"tx_key")
+    assert await transaction.execute() == [b"OK", 2]
+    assert not client.connection_pool.used_connections
+
+
+async def test_pinned_connection(client):
+    """It sends everything on one connection, and returns it to the pool after."""
+    async with Transaction(client) as transaction:
+        connection = transaction.connection
+        assert connection in client.connection_pool.used_connections
+        assert await transaction.call(b"SET", b"tx_key", b"1") == b"OK"
+        transaction.queue(b"INCR", b"tx_key")
+        assert await transaction.execute() == [2]
+        assert transaction.connection is connection
+    assert connection in client.connection_pool.pool
+
+
+async def test_watch_aborts(client):
+    """It returns None if a watched key changed before EXEC."""
+    await client.call(b"SET", b"tx_key", b"1")
+    async with Transaction(client) as transaction:
+        await transaction.watch(b"tx_key")
+        await client.call(b"SET", b"tx_key", b"2")
+        transaction.queue(b"SET", b"tx_key", b"3")
+        assert await transaction.execute() is None
+        assert not transaction.watching
+    assert await client.call(b"GET", b"tx_key") == b"2"
+
+
+@pytest.mark.parametrize("protocol", [2, 3])
+async def test_raw_reader(client, protocol):
+    """It retries on a nil EXEC when replies are left as RawReader frames."""
+    raw = RedisClient(Reader=RawReader, protocol=protocol)
+    await client.call(b"SET", b"tx_key", b"1")
+    attempts = 0
+
+    async def increment(transaction):
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            await client.call(b"INCR", b"tx_key")
+        transaction.queue(b"INCR", b"tx_key")
+
+    replies = await run_transaction(raw, increment, b"tx_key")
+    assert bytes(replies) == b"*1\r\n:3\r\n"
+    assert attempts == 2
+
+
+async def test_queue_error(client):
+    """It returns the error if Redis refuses to queue a command."""
+    transaction = Transaction(client)
+    transaction.queue(b"SET", b"tx_key", b"1").queue(b"NOT_A_COMMAND")
+    assert isinstance(await transaction.execute(), RedisError)
+    assert await client.call(b"EXISTS", b"tx_key") == 0
+
+
+async def test_run_transaction_retries(client):
+    """It runs the body again until no watched key changed."""
+    await client.call(b"SET", b"tx_balance", b"100")
+    attempts = 0
+
+    async def withdraw(transaction):
+        nonlocal attempts
+        attempts += 1
+        balance = int(await transaction.call(b"GET", b"tx_balance"))
+        if attempts == 1:
+            await client.call(b"SET", b"tx_balance", b"50")
+        transaction.queue(b"SET", b"tx_balance", b"%d" % (balance - 10))
+
+    assert await run_transaction(client, withdraw, b"tx_balance") == [b"OK"]
+    assert attempts == 2
+    assert await client.call(b"GET", b"tx_balance") == b"40"
+
+
+async def test_run_transaction_gives_up(client):
+    """It raises WatchError once it runs out of attempts."""
+
+    async def interfere(transaction):
+        await client.call(b"INCR", b"tx_key")
+        transaction.queue(b"SET", b"tx_key", b"0")
+
+    with pytest.raises(WatchError):
+        await run_transaction(client, interfere, b"tx_key", max_attempts=3)
+    assert await client.call(b"GET", b"tx_key") == b"3"
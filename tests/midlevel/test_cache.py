@@ -0,0 +1,314 @@
+"""This module contains the tests for client-side caching."""
+
+import pytest
+from respy3.protocol import Resp3Reader
+import trio
+import trio.testing
+
+from redtrio.lowlevel import RawReader
+from redtrio.midlevel import ClientSideCache
+from redtrio.midlevel import MidlevelClient
+from redtrio.midlevel.cache import LocalCache
+from redtrio.midlevel.cache import RECONNECT_DELAY
+
+
+def encode(value) -> bytes:
+    """Encode a reply from the fake server."""
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if value is None:
+        return b"_\r\n"
+    return b"$%d\r\n%b\r\n" % (len(value), value)
+
+
+class TrackingServer:
+    """A fake Redis server supporting GET, HGET, SET and CLIENT TRACKING.
+
+    Attributes:
+        data (dict): The keys and values stored in the server, with a dict for
+            each hash.
+        streams (dict): The server end of each connection, by client ID.
+        tracking (dict): The client IDs to send invalidations to, by key.
+        broadcast (dict): The prefixes tracked in BCAST mode, by client ID.
+        commands (list): Every command received.
+        down (bool): Whether new connections are refused.
+        refuse_id (bool): Whether CLIENT ID is answered with an error.
+    """
+
+    def __init__(self):
+        """Initialize the TrackingServer."""
+        self.data = {}
+        self.streams = {}
+        self.tracking = {}
+        self.broadcast = {}
+        self.commands = []
+        self.next_id = 1
+        self.down = False
+        self.refuse_id = False
+
+    async def spawn_connection(self, host, port):
+        """Connect a new in-memory connection to the server."""
+        if self.down:
+            raise OSError("Connection refused")
+        server_stream, client_stream = trio.testing.memory_stream_pair()
+        self.nursery.start_soon(self.serve, server_stream, self.next_id)
+        self.next_id += 1
+        return client_stream
+
+    async def serve(self, stream, client_id):
+        """Handle the commands sent on one connection."""
+        self.streams[client_id] = stream
+        reader = Resp3Reader()
+        redirect = None
+        optin = caching = False
+        while True:
+            command = reader.get_object()
+            if command is reader.sentinel:
+                try:
+                    data = await stream.receive_some()
+                except trio.ClosedResourceError:
+                    return
+                if not data:
+                    return
+                reader.feed(data)
+                continue
+
+            self.commands.append(command)
+            name, *args = command
+            if name == b"HELLO":
+                reply = b"%1\r\n$5\r\nproto\r\n:3\r\n"
+            elif name == b"CLIENT" and args[0] == b"ID":
+                reply = b"-ERR refused\r\n" if self.refuse_id else encode(client_id)
+            elif name == b"CLIENT" and args[:3] == [b"TRACKING", b"ON", b"BCAST"]:
+                self.broadcast[client_id] = args[4::2]
+                reply = b"+OK\r\n"
+            elif name == b"CLIENT" and args[0] == b"TRACKING":
+                redirect = int(args[3])
+                optin = b"OPTIN" in args
+                reply = b"+OK\r\n"
+            elif name == b"CLIENT" and args[0] == b"CACHING":
+                caching = True
+                reply = b"+OK\r\n"
+            elif name in (b"GET", b"HGET"):
+                if redirect is not None and (caching or not optin):
+                    self.tracking.setdefault(args[0], set()).add(redirect)
+                caching = False
+                value = self.data.get(args[0])
+                reply = encode(value if name == b"GET" else value.get(args[1]))
+            elif name == b"SET":
+                self.data[args[0]] = args[1]
+                await self.invalidate(args[0])
+                reply = b"+OK\r\n"
+            await stream.send_all(reply)
+
+    async def invalidate(self, key):
+        """Send an invalidate push for a key to every client tracking it."""
+        client_ids = self.tracking.pop(key, set())
+        for client_id, prefixes in self.broadcast.items():
+            if not prefixes or key.startswith(tuple(prefixes)):
+                client_ids.add(client_id)
+        for client_id in client_ids:
+            push = b">2\r\n$10\r\ninvalidate\r\n*1\r\n" + encode(key)
+            await self.streams[client_id].send_all(push)
+
+
+@pytest.fixture
+def server(nursery):
+    """A TrackingServer running in the test's nursery."""
+    server = TrackingServer()
+    server.nursery = nursery
+    return server
+
+
+@pytest.fixture
+def client(server):
+    """A MidlevelClient connected to the TrackingServer."""
+    client = MidlevelClient()
+    client.client.connection_pool.spawn_connection = server.spawn_connection
+    return client
+
+
+async def test_local_cache_lru():
+    """It evicts the least recently used entries."""
+    cache = LocalCache(max_size=2)
+    cache.set((b"GET", b"a"), b"1")
+    cache.set((b"GET", b"b"), b"2")
+    assert cache.get((b"GET", b"a")) == (True, b"1")
+    cache.set((b"GET", b"c"), b"3")
+
+    assert cache.get((b"GET", b"b")) == (False, None)
+    assert cache.get((b"GET", b"a")) == (True, b"1")
+    assert cache.get((b"GET", b"c")) == (True, b"3")
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+
+
+async def test_local_cache_ttl(autojump_clock):
+    """It expires entries after the ttl."""
+    cache = LocalCache(ttl=10)
+    cache.set((b"GET", b"a"), b"1")
+    await trio.sleep(9)
+    assert cache.get((b"GET", b"a")) == (True, b"1")
+    await trio.sleep(1)
+    assert cache.get((b"GET", b"a")) == (False, None)
+    assert len(cache) == 0
+
+
+async def test_local_cache_invalidate():
+    """It drops every entry read from an invalidated key."""
+    cache = LocalCache()
+    cache.set((b"HGET", b"hash", b"a"), b"1")
+    cache.set((b"HGETALL", b"hash"), {b"a": b"1"})
+    cache.set((b"GET", b"other"), b"2")
+
+    cache.invalidate(b"hash")
+    assert len(cache) == 1 and cache.invalidations == 2
+    assert cache.get((b"GET", b"other")) == (True, b"2")
+
+
+async def test_local_cache_copies():
+    """It doesn't let callers change cached replies."""
+    cache = LocalCache()
+    reply = {b"a": b"1"}
+    cache.set((b"HGETALL", b"hash"), reply)
+    reply[b"b"] = b"2"
+    cache.get((b"HGETALL", b"hash"))[1].clear()
+    assert cache.get((b"HGETALL", b"hash")) == (True, {b"a": b"1"})
+
+
+async def test_cached_read(server, client):
+    """It serves repeated reads from the cache."""
+    server.data[b"key"] = b"value"
+    async with ClientSideCache(client) as cache:
+        assert client.cache is cache
+        assert await client.get("key") == b"value"
+        assert await client.get("key") == b"value"
+        assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+    assert client.cache is None
+    assert [command[0] for command in server.commands].count(b"GET") == 1
+
+
+async def test_bytes_like_args(server, client):
+    """It caches reads whose args are bytes-like objects, such as bytearrays."""
+    server.data[b"hash"] = {b"field": b"value"}
+    async with ClientSideCache(client) as cache:
+        for _ in range(2):
+            assert await client.hget("hash", bytearray(b"field")) == b"value"
+        assert await client.hget(memoryview(b"hash"), b"field") == b"value"
+        assert cache.stats["hits"] == 2 and cache.stats["misses"] == 1
+
+
+async def test_raw_reader(server):
+    """It reads the tracking connection's ID and caches frames from RawReader."""
+    client = MidlevelClient(Reader=RawReader)
+    client.client.connection_pool.spawn_connection = server.spawn_connection
+    server.data[b"key"] = b"value"
+    async with ClientSideCache(client) as cache:
+        assert isinstance(cache.client_id, int)
+        for _ in range(2):
+            assert bytes(await client.get("key")) == b"$5\r\nvalue\r\n"
+        assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+
+async def test_invalidation(server, client):
+    """It drops a cached reply when Redis says the key changed."""
+    server.data[b"key"] = b"old"
+    writer = MidlevelClient()
+    writer.client.connection_pool.spawn_connection = server.spawn_connection
+
+    async with ClientSideCache(client) as cache:
+        assert await client.get("key") == b"old"
+        await writer.set("key", "new")
+        await trio.testing.wait_all_tasks_blocked()
+        assert cache.stats["invalidations"] == 1
+        assert await client.get("key") == b"new"
+
+
+async def test_tracking_reconnect(autojump_clock, server, client):
+    """It flushes everything when the tracking connection is lost."""
+    server.data[b"key"] = b"value"
+    async with ClientSideCache(client) as cache:
+        await client.get("key")
+        old_id = cache.client_id
+        await server.streams[old_id].aclose()
+        await trio.testing.wait_all_tasks_blocked()
+        assert cache.client_id is None
+        await trio.sleep(RECONNECT_DELAY)
+        await trio.testing.wait_all_tasks_blocked()
+
+        assert len(cache.local) == 0
+        assert cache.client_id not in (None, old_id)
+        assert await client.get("key") == b"value"
+        assert await client.get("key") == b"value"
+        assert cache.stats["hits"] == 1
+
+
+async def test_tracking_refused_later(autojump_clock, server, client):
+    """It keeps retrying, once a second, if tracking is refused after starting."""
+    server.data[b"key"] = b"value"
+    async with ClientSideCache(client) as cache:
+        server.refuse_id = True
+        await server.streams[cache.client_id].aclose()
+        await trio.sleep(3.5)
+        assert cache.client_id is None
+        refused = [c for c in server.commands if c == [b"CLIENT", b"ID"]]
+        assert len(refused) == 4
+        assert await client.get("key") == b"value"
+
+        server.refuse_id = False
+        await trio.sleep(RECONNECT_DELAY)
+        await trio.testing.wait_all_tasks_blocked()
+        assert cache.client_id is not None
+
+
+async def test_failed_checkout(server, client):
+    """It doesn't leave the read marked in flight if no connection is available."""
+    async with ClientSideCache(client) as cache:
+        server.down = True
+        with pytest.raises(OSError):
+            await client.get("key")
+        assert cache._in_flight == {}
+
+
+async def test_bcast_mode(server, client):
+    """It only caches keys matching the prefixes, without per-read setup."""
+    server.data.update({b"user:1": b"alice", b"other": b"value"})
+    writer = MidlevelClient()
+    writer.client.connection_pool.spawn_connection = server.spawn_connection
+
+    async with client.client_side_cache(mode="bcast", prefixes=["user:"]) as cache:
+        assert server.broadcast == {cache.client_id: [b"user:"]}
+        for _ in range(2):
+            assert await client.get("user:1") == b"alice"
+            assert await client.get("other") == b"value"
+        assert cache.stats["hits"] == 1 and cache.stats["size"] == 1
+        assert not any(
+            command[:2] == [b"CLIENT", b"TRACKING"] and b"REDIRECT" in command
+            for command in server.commands
+        )
+
+        await writer.set("user:1", "bob")
+        await trio.testing.wait_all_tasks_blocked()
+        assert await client.get("user:1") == b"bob"
+
+
+async def test_optin_mode(server, client):
+    """It only asks Redis to track the chosen commands."""
+    server.data[b"key"] = b"value"
+    async with client.client_side_cache(mode="optin", commands=["GET"]) as cache:
+        assert await client.get("key") == b"value"
+        assert await client.get("key") == b"value"
+        assert cache.stats["hits"] == 1
+
+    assert [b"CLIENT", b"CACHING", b"yes"] in server.commands
+    tracking = [c for c in server.commands if c[:2] == [b"CLIENT", b"TRACKING"]]
+    assert tracking and tracking[0][-1] == b"OPTIN"
+
+
+def test_invalid_mode():
+    """It rejects unknown modes, and prefixes outside bcast mode."""
+    client = MidlevelClient()
+    with pytest.raises(ValueError):
+        client.client_side_cache(mode="unknown")
+    with pytest.raises(ValueError):
+        client.client_side_cache(prefixes=["user:"])
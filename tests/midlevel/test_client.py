@@ -1,7 +1,9 @@
 """This module contains test related to the midlevel client itself."""
 
-import pytest  # noqa
+import pytest
 
+from redtrio.lowlevel import connections
+from redtrio.lowlevel import RedisClient
 from redtrio.midlevel import MidlevelClient
 
 
@@ -13,7 +15,7 @@ def test_arguments_passed_through():
 
     host = "Nothing"
     port = -1
-    connection_pool = True
+    connection_pool = connections.ConnectionPool("127.0.0.1", 6379)
     write_command = lambda x: x  # noqa
 
     client = MidlevelClient(
@@ -27,5 +29,77 @@ def test_arguments_passed_through():
     assert client.client.host == host
     assert client.client.port == port
     assert client.client.connection_pool == connection_pool
-    assert isinstance(client.client.reader, TestReader)
+    assert client.client.Reader is TestReader
     assert client.client.write_command is write_command
+
+
+async def test_connection_pool_says_hello():
+    """It makes a connection pool without a protocol send HELLO 3."""
+    pool = connections.ConnectionPool("127.0.0.1", 6379)
+    client = MidlevelClient(connection_pool=pool)
+    assert pool.protocol == 3
+    await client.hset("midlevel_hello", "field", "value")
+    assert await client.hgetall("midlevel_hello") == {b"field": b"value"}
+    resp2 = connections.ConnectionPool("127.0.0.1", 6379, protocol=2)
+    assert MidlevelClient(connection_pool=resp2).client.connection_pool is resp2
+    assert resp2.protocol == 2
+
+    with pytest.raises(TypeError, match="protocol"):
+        RedisClient(connection_pool=pool, protocol=3)
+
+
+async def test_transaction():
+    """It runs a transaction, watching keys given as strings."""
+    client = MidlevelClient()
+    await client.call("SET", "midlevel_tx_counter", "1")
+
+    async def increment(transaction):
+        value = int(await transaction.call(b"GET", b"midlevel_tx_counter"))
+        transaction.queue(b"SET", b"midlevel_tx_counter", b"%d" % (value + 1))
+
+    assert await client.transaction(increment, "midlevel_tx_counter") == [b"OK"]
+    assert await client.get("midlevel_tx_counter") == b"2"
+
+
+async def test_every_connection_says_hello():
+    """It sends HELLO 3 on every connection, not just the first one used."""
+    client = MidlevelClient()
+    await client.hset("midlevel_hello", "field", "value")
+    lowlevel = client.client
+    connections = [await lowlevel.connection_pool.wait_for_connection() for _ in "ab"]
+
+    for connection in connections:
+        await lowlevel.send_command(
+            b"HGETALL", b"midlevel_hello", connection=connection
+        )
+        assert await lowlevel.receive(connection) == {b"field": b"value"}
+
+
+async def test_typed_arguments():
+    """It sends bytes, memoryview, int and float arguments without str round trips."""
+    client = MidlevelClient()
+    await client.delete("midlevel_typed", b"midlevel_binary")
+    assert await client.set(b"midlevel_binary", memoryview(b"\x00\xff")) == b"OK"
+    assert await client.get("midlevel_binary") == b"\x00\xff"
+
+    assert await client.hset("midlevel_typed", "count", 1, b"ratio", 0.5) == 2
+    assert await client.hincrby("midlevel_typed", "count", 41) == 42
+    assert await client.hincrbyfloat("midlevel_typed", "ratio", 0.25) == 0.75
+
+
+async def test_prepare():
+    """It sends a prepared command with its arguments by position or name."""
+    client = MidlevelClient()
+    hget = client.prepare("HGET", "key", "field")
+    await client.hset("midlevel_prepared", "name", "value")
+
+    assert await hget("midlevel_prepared", "name") == b"value"
+    assert await hget(field=b"name", key="midlevel_prepared") == b"value"
+    with pytest.raises(TypeError):
+        await hget("midlevel_prepared", "name", "extra")
+    with pytest.raises(TypeError):
+        await hget(key="midlevel_prepared")
+    with pytest.raises(TypeError):
+        await hget("midlevel_prepared", key="midlevel_prepared")
+    with pytest.raises(TypeError):
+        await hget("midlevel_prepared", name="name")
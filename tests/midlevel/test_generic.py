@@ -0,0 +1,44 @@
+"""This module contains the tests for Redis' generic commands."""
+
+import pytest
+
+from redtrio.midlevel import MidlevelClient
+
+
+@pytest.fixture
+async def client():
+    """A fresh client for every test.
+
+    Also flushes the database to prevent conflicts.
+
+    Returns:
+        An instance of :class:`midlevel.MidlevelClient`.
+    """
+    client = MidlevelClient()
+    await client.call("FLUSHALL")
+    return client
+
+
+async def test_delete(client):
+    """It returns the number of keys deleted by DEL."""
+    await client.mset("generic_a", "1", "generic_b", "2")
+    assert await client.delete("generic_a", "generic_b", "generic_c") == 2
+    assert await client.delete("generic_a") == 0
+
+
+async def test_exists(client):
+    """It returns the number of keys that exist, counting repeats."""
+    await client.set("generic_a", "1")
+    assert await client.exists("generic_a", "generic_a", "generic_b") == 2
+
+
+async def test_touch(client):
+    """It returns the number of keys touched."""
+    await client.set("generic_a", "1")
+    assert await client.touch("generic_a", "generic_b") == 1
+
+
+async def test_unlink(client):
+    """It returns the number of keys unlinked."""
+    await client.mset("generic_a", "1", "generic_b", "2")
+    assert await client.unlink("generic_a", "generic_b") == 2
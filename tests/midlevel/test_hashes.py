@@ -1,6 +1,7 @@
 """This module contains the tests for Redis' hash commands."""
 
 import pytest
+from respy3.protocol import RedisError
 
 from redtrio.midlevel import MidlevelClient
 
@@ -260,3 +261,23 @@ async def test_hvals(client):
     expected = [value.encode()]
     actual = await client.hvals(key)
     assert actual == expected
+
+
+async def test_hset_mapping_hmget_many(client):
+    """It sets and gets many fields of a hash in chunks."""
+    key = "midlevel_hash_bulk_test"
+    mapping = {f"field_{i}": f"value_{i}" for i in range(100)}
+
+    assert await client.hset_mapping(key, mapping, chunk_size=15) == 100
+    assert await client.hset_mapping(key, [("field_0", "changed")]) == 0
+    assert await client.hlen(key) == 100
+
+    values = await client.hmget_many(key, ["field_0", "nope", "field_99"], chunk_size=2)
+    assert values == [b"changed", None, b"value_99"]
+
+
+async def test_hset_mapping_error(client):
+    """It returns the error from Redis if a chunk fails."""
+    await client.set("midlevel_hash_bulk_string", "not a hash")
+    result = await client.hset_mapping("midlevel_hash_bulk_string", {"a": "b"})
+    assert isinstance(result, RedisError)
@@ -0,0 +1,101 @@
+"""This module contains the tests for iterating with the SCAN family."""
+
+import pytest
+from respy3.protocol import RedisError
+
+from redtrio.midlevel import MidlevelClient
+from redtrio.midlevel import Scanner
+
+
+@pytest.fixture
+async def client():
+    """A fresh client for every test.
+
+    Also flushes the database to prevent conflicts.
+
+    Returns:
+        An instance of :class:`midlevel.MidlevelClient`.
+    """
+    client = MidlevelClient()
+    await client.call("FLUSHALL")
+    return client
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+async def test_scan_iter(client, prefetch):
+    """It yields every matching key, across many pages."""
+    keys = [f"scan_{i}" for i in range(100)]
+    await client.mset(*[arg for key in keys for arg in (key, "value")])
+    await client.hset("scan_hash", "field", "value")
+
+    found = {key async for key in client.scan_iter("scan_*", 5, prefetch=prefetch)}
+    assert found == {key.encode() for key in keys} | {b"scan_hash"}
+    found = [key async for key in client.scan_iter(type="hash", prefetch=prefetch)]
+    assert found == [b"scan_hash"]
+    assert client.client.connection_pool.size == len(client.client.connection_pool.pool)
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+async def test_hscan_iter(client, prefetch):
+    """It yields every (field, value) pair of a hash."""
+    fields = {f"field_{i}".encode(): f"value_{i}".encode() for i in range(200)}
+    await client.hset(
+        "hscan", *[arg.decode() for pair in fields.items() for arg in pair]
+    )
+
+    found = dict([pair async for pair in client.hscan_iter("hscan", prefetch=prefetch)])
+    assert found == fields
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+async def test_scan_error(client, prefetch):
+    """It raises the error Redis replies with, such as WRONGTYPE."""
+    await client.set("scan_string", "value")
+    with pytest.raises(RedisError, match="WRONGTYPE"):
+        async for _ in client.hscan_iter("scan_string", prefetch=prefetch):
+            pass
+
+
+async def test_sscan_iter(client):
+    """It yields every matching member of a set."""
+    members = [f"member_{i}" for i in range(200)]
+    await client.sadd("sscan", *members, "other")
+
+    found = {member async for member in client.sscan_iter("sscan", "member_*")}
+    assert found == {member.encode() for member in members}
+
+
+async def test_zscan_iter(client):
+    """It yields every (member, score) pair of a sorted set, with float scores."""
+    await client.call("ZADD", "zscan", "1.5", "a", "2", "b")
+
+    found = sorted([pair async for pair in client.zscan_iter("zscan")])
+    assert found == [(b"a", 1.5), (b"b", 2.0)]
+
+
+async def test_break_with_prefetch(client):
+    """It closes the connection if the scan is abandoned with a page in flight."""
+    await client.sadd("sscan", *[f"member_{i}" for i in range(200)])
+    pool = client.client.connection_pool
+
+    members = client.sscan_iter("sscan", count=10, prefetch=True)
+    await members.__anext__()
+    assert len(pool.used_connections) == 1
+    await members.aclose()
+    assert len(pool.used_connections) == 0
+
+
+def test_adjust():
+    """It scales COUNT toward the target latency, by a factor of two at most."""
+    scanner = Scanner(None, "SCAN", count=100, target_latency=0.01, max_count=300)
+    scanner.adjust(0.02)
+    assert scanner.count == 50
+    scanner.adjust(1)
+    assert scanner.count == 25
+    scanner.adjust(0.008)
+    assert scanner.count == 31
+    scanner.adjust(0)
+    assert scanner.count == 62
+    for _ in range(5):
+        scanner.adjust(0.001)
+    assert scanner.count == 300
@@ -0,0 +1,74 @@
+"""This module contains the tests for Lua scripts and function libraries."""
+
+import pytest
+from respy3.protocol import RedisError
+
+from redtrio.midlevel import MidlevelClient
+
+INCREMENT = "return redis.call('INCR', KEYS[1]) + tonumber(ARGV[1])"
+
+LIBRARY = "#!lua name=testlib\nredis.register_function('hi', function() end)"
+
+
+@pytest.fixture
+async def client():
+    """A fresh client for every test, with no keys and no cached scripts."""
+    client = MidlevelClient()
+    await client.call("FLUSHALL")
+    await client.call("SCRIPT", "FLUSH")
+    return client
+
+
+async def test_script(client):
+    """It runs a script, even when Redis doesn't have it cached."""
+    increment = client.register_script(INCREMENT)
+    assert client.register_script(INCREMENT) is increment
+    assert await increment(keys=["script_key"], args=["10"]) == 11
+    assert await client.call("SCRIPT", "EXISTS", increment.sha) == [1]
+
+    await client.call("SCRIPT", "FLUSH")
+    assert await increment(keys=["script_key"], args=["10"]) == 12
+    assert await client.call("SCRIPT", "EXISTS", increment.sha) == [1]
+
+
+async def test_preload(client):
+    """It loads registered scripts, but not libraries, on every new connection."""
+    increment = client.register_script(INCREMENT)
+    client.register_library(LIBRARY)
+    assert client._preload_commands() == [increment.load_command()]
+    await client.call("SCRIPT", "FLUSH")
+    client.client.connection_pool.pool.clear()
+
+    assert await client.call("SCRIPT", "EXISTS", increment.sha) == [1]
+
+
+async def test_library():
+    """It loads the library and calls the function again if it wasn't found."""
+    client = MidlevelClient()
+    calls = []
+
+    async def call(*command):
+        calls.append(command)
+        if command[0] == "FCALL" and ("FUNCTION", "LOAD") not in [c[:2] for c in calls]:
+            return RedisError(b"ERR", b"Function not found")
+        return b"hello"
+
+    client.call = call
+    library = client.register_library(LIBRARY)
+    assert library.name == "testlib"
+    assert client.libraries == {"testlib": library}
+    # Libraries are loaded when they are missing, not with every handshake.
+    assert client.client.connection_pool.handshake_hooks == []
+
+    assert await library.fcall("hi", keys=["a"], args=["b"]) == b"hello"
+    assert calls == [
+        ("FCALL", "hi", 1, "a", "b"),
+        ("FUNCTION", "LOAD", "REPLACE", LIBRARY),
+        ("FCALL", "hi", 1, "a", "b"),
+    ]
+
+
+def test_library_without_shebang():
+    """It raises ValueError if the library doesn't name itself."""
+    with pytest.raises(ValueError):
+        MidlevelClient().register_library("redis.register_function('hi', f)")
@@ -1,5 +1,6 @@
 """This module contains the tests for Redis' string commands."""
 
+import io
 import time
 
 import pytest
@@ -460,3 +461,30 @@ async def test_strlen(client):
     expected = len(value)
     actual = await client.strlen(key)
     assert actual == expected
+
+
+async def test_set_from_get_into(client):
+    """It streams a value into Redis and back out again."""
+    key = "midlevel_stream_test"
+    value = b"x" * 200_000
+
+    assert await client.set_from(key, io.BytesIO(value), len(value)) == b"OK"
+    writable = io.BytesIO()
+    assert await client.get_into(key, writable) == len(value)
+    assert writable.getvalue() == value
+
+
+async def test_mset_mapping_mget_many(client):
+    """It sets and gets many keys in chunks, over several connections."""
+    mapping = {f"midlevel_bulk_{i}": i for i in range(250)}
+
+    result = await client.mset_mapping(mapping, chunk_size=20, concurrency=3)
+    assert result == 250
+    assert 1 < client.client.connection_pool.size <= 3
+
+    keys = [*mapping, "midlevel_bulk_missing"]
+    values = await client.mget_many(keys, chunk_size=30)
+    assert values == [b"%d" % i for i in range(250)] + [None]
+
+    assert await client.mset_mapping(iter([("a", "1"), ("b", "2")])) == 2
+    assert await client.mget_many([]) == []